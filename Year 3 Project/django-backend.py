@@ -13,6 +13,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'agriconnect.middleware.PerformanceMiddleware',
+    'agriconnect.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -23,15 +25,32 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Shared pymongo client pool for raw queries and the setup script (see mongo.py)
+MONGO_CLIENT = {
+    'HOST': 'mongodb://localhost:27017',
+    'NAME': 'agriconnect_db',
+    'MAX_POOL_SIZE': 50,
+    'MIN_POOL_SIZE': 0,
+    'WAIT_QUEUE_TIMEOUT_MS': 1000,
+    'CONNECT_TIMEOUT_MS': 5000,
+    'SERVER_SELECTION_TIMEOUT_MS': 5000,
+}
+
 # MongoDB configuration using djongo
 DATABASES = {
     'default': {
         'ENGINE': 'djongo',
-        'NAME': 'agriconnect_db',
+        'NAME': MONGO_CLIENT['NAME'],
         'CLIENT': {
-            'host': 'mongodb://localhost:27017',
+            'host': MONGO_CLIENT['HOST'],
             'username': '',
             'password': '',
+            'maxPoolSize': MONGO_CLIENT['MAX_POOL_SIZE'],
+            'minPoolSize': MONGO_CLIENT['MIN_POOL_SIZE'],
+            'waitQueueTimeoutMS': MONGO_CLIENT['WAIT_QUEUE_TIMEOUT_MS'],
+            'connectTimeoutMS': MONGO_CLIENT['CONNECT_TIMEOUT_MS'],
+            'serverSelectionTimeoutMS': MONGO_CLIENT['SERVER_SELECTION_TIMEOUT_MS'],
+            # AgriconnectConfig.ready() adds the pool listener (mongo.instrument_orm_client)
         }
     }
 }
@@ -39,11 +58,12 @@ DATABASES = {
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'agriconnect.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'agriconnect.pagination.KeysetPagination',
 }
 
 # JWT settings
@@ -57,10 +77,89 @@ SIMPLE_JWT = {
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Cache settings
+# Product catalog responses are cached until a product changes. Use a shared
+# backend (e.g. Redis) with several workers so invalidation reaches them all.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+CATALOG_CACHE_TIMEOUT = 300
+# Lower bounds of the price ranges /products/facets/ counts; the last range
+# is open-ended
+CATALOG_PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000]
+
+# Users behind JWTs are cached per process for TIMEOUT seconds; point
+# SHARED_ALIAS at a shared cache (e.g. Redis) so workers share entries and
+# invalidations
+USER_CACHE = {
+    'SIZE': 1024,
+    'TIMEOUT': 60,
+    'SHARED_ALIAS': None,
+    'SHARED_TIMEOUT': 600,
+}
+
+# ASGI serving (asgi.py) routes the hot reads to async views on motor; under
+# WSGI every route stays on the synchronous DRF views
+import os
+ASYNC_VIEWS = os.environ.get('AGRICONNECT_ASYNC_VIEWS') == '1'
+
+# Read the product catalog, reviews per product and a buyer's orders straight
+# from MongoDB with pymongo (repository.py) instead of through djongo
+DIRECT_MONGO_READS = False
+
+# Order status feed (/orders/events/): follows change streams on the
+# order_events collection on a replica set or mongos and polls it on a
+# standalone server ('auto' picks by server type; or 'stream' / 'poll').
+# Event streams end after STREAM_TIMEOUT seconds and clients reconnect with
+# their last event id; long polls wait at most LONG_POLL_TIMEOUT seconds.
+ORDER_EVENTS = {
+    'MODE': 'auto',
+    'POLL_INTERVAL': 2,
+    'HEARTBEAT': 15,
+    'STREAM_TIMEOUT': 300,
+    'LONG_POLL_TIMEOUT': 25,
+    'RETENTION_DAYS': 7,
+}
+
+# Delivered and cancelled orders last updated more than AFTER_DAYS ago are
+# moved to the archive collections by the archive_orders command. Order
+# lists read the archive only for ?include_archived or a date range that
+# reaches back past what has been archived.
+ORDER_ARCHIVE = {
+    'AFTER_DAYS': 365,
+    'BATCH_SIZE': 500,
+}
+
+# Delta sync (/products/changes/): deletions are remembered for
+# TOMBSTONE_DAYS, so cursors older than that get a 410 and a full resync
+CATALOG_SYNC = {
+    'PAGE_SIZE': 200,
+    'MAX_PAGE_SIZE': 1000,
+    'TOMBSTONE_DAYS': 30,
+}
+
+# JSON, NDJSON, CSV and plain text responses of at least MIN_SIZE bytes are
+# compressed with brotli (needs the brotli package) or gzip, whichever the
+# client's Accept-Encoding prefers. Event streams and file exports, which
+# are streamed, are sent as they are.
+RESPONSE_COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'BROTLI_QUALITY': 5,
+}
+
+# Performance monitoring
+# Requests slower than this are logged with their queries; /metrics/ is
+# served only to these addresses
+SLOW_REQUEST_SECONDS = 0.5
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
 # models.py
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
+from djongo.models import JSONField
 
 class User(AbstractUser):
     USER_TYPE_CHOICES = (
@@ -72,6 +171,11 @@ class User(AbstractUser):
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     profile_image = models.URLField(blank=True, null=True)
+    # GeoJSON point ({"type": "Point", "coordinates": [lng, lat]}), 2dsphere indexed
+    geo_point = JSONField(blank=True, null=True)
+    
+    class Meta(AbstractUser.Meta):
+        db_table = 'users'
     
     def __str__(self):
         return self.username
@@ -92,14 +196,59 @@ class Product(models.Model):
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products')
     location = models.CharField(max_length=100)
+    # GeoJSON point ({"type": "Point", "coordinates": [lng, lat]}), 2dsphere indexed
+    geo_point = JSONField(blank=True, null=True)
     harvest_date = models.DateField()
     is_organic = models.BooleanField(default=False)
     quantity = models.PositiveIntegerField()
+    # Farmer's own stock code, unique per farmer; used by bulk inventory upload
+    sku = models.CharField(max_length=64, blank=True, null=True)
+    # Review aggregates, maintained incrementally by the Review signals
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Moved by atomic updates on the collection (take_stock, return_stock,
+    # adjust_rating) rather than through the ORM
+    COUNTER_FIELDS = ('quantity', 'rating_sum', 'rating_count', 'rating_avg')
+    
+    class Meta:
+        db_table = 'products'
+    
     def __str__(self):
         return self.title
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a save can tell which counters were actually edited
+        instance._loaded_counters = instance.current_counters()
+        return instance
+    
+    def current_counters(self):
+        deferred = self.get_deferred_fields()
+        return {name: getattr(self, name) for name in self.COUNTER_FIELDS if name not in deferred}
+    
+    def save(self, *args, **kwargs):
+        """
+        A full-row save leaves out the COUNTER_FIELDS still as they were
+        loaded, so it can't put back stock or ratings that an order or review
+        moved since; counters that were assigned new values are saved
+        """
+        loaded = getattr(self, '_loaded_counters', None)
+        if loaded and not self._state.adding and kwargs.get('update_fields') is None:
+            unchanged = {name for name, value in loaded.items() if getattr(self, name) == value}
+            if unchanged:
+                deferred = self.get_deferred_fields()
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in unchanged
+                    and field.attname not in deferred
+                ]
+        super().save(*args, **kwargs)
+        self._loaded_counters = self.current_counters()
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -115,11 +264,30 @@ class Order(models.Model):
     shipping_address = models.TextField()
     phone_number = models.CharField(max_length=15)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Denormalized ids of the farmers whose products are in this order, so the
+    # farmer order list is one lookup on the multikey farmer_ids index
+    farmer_ids = JSONField(default=list)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        db_table = 'orders'
+    
     def __str__(self):
         return f"Order #{self.id} by {self.buyer.username}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a status change can be applied to the sales rollups
+        instance._saved_status = instance.status
+        return instance
+    
+    def refresh_farmer_ids(self):
+        self.farmer_ids = sorted(set(
+            self.items.exclude(product=None).values_list('product__farmer_id', flat=True)
+        ))
+        Order.objects.filter(pk=self.pk).update(farmer_ids=self.farmer_ids)
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -127,6 +295,9 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     
+    class Meta:
+        db_table = 'order_items'
+    
     def __str__(self):
         return f"{self.quantity} x {self.product.title}"
 
@@ -138,261 +309,5681 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
+        db_table = 'reviews'
         unique_together = ('product', 'user')
     
     def __str__(self):
         return f"Review for {self.product.title} by {self.user.username}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is stored so an edit adjusts the aggregates by the difference
+        instance._saved_rating = (instance.product_id, instance.rating)
+        return instance
 
-# serializers.py
-from rest_framework import serializers
-from .models import User, Product, Order, OrderItem, Review
+# metrics.py
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
 
-class UserSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 
-                  'user_type', 'phone_number', 'address', 'profile_image']
-        read_only_fields = ['id']
+# Per-request counters, filled in by the ORM execute wrapper, the pymongo
+# command listener and timed phases while PerformanceMiddleware is active
+current_metrics = contextvars.ContextVar('current_metrics', default=None)
 
-class ProductSerializer(serializers.ModelSerializer):
-    farmer_name = serializers.SerializerMethodField()
+MAX_RECORDED_STATEMENTS = 50
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.compress_seconds = 0.0
+        self.statements = []
     
-    class Meta:
-        model = Product
-        fields = ['id', 'title', 'description', 'price', 'image_url', 
-                  'category', 'farmer', 'farmer_name', 'location', 
-                  'harvest_date', 'is_organic', 'quantity', 'created_at']
-        read_only_fields = ['id', 'farmer', 'farmer_name', 'created_at']
+    def record_query(self, sql, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        if len(self.statements) < MAX_RECORDED_STATEMENTS:
+            self.statements.append((seconds, sql))
     
-    def get_farmer_name(self, obj):
-        return f"{obj.farmer.first_name} {obj.farmer.last_name}"
+    def record_mongo(self, command, seconds):
+        self.mongo_commands += 1
+        self.mongo_seconds += seconds
+        if len(self.statements) < MAX_RECORDED_STATEMENTS:
+            self.statements.append((seconds, f'mongo {command}'))
+
+@contextmanager
+def request_phase(name):
+    """
+    Time a phase of the current request, excluding database time spent inside it
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
     
-    def create(self, validated_data):
-        validated_data['farmer'] = self.context['request'].user
-        return super().create(validated_data)
+    db_before = metrics.db_seconds + metrics.mongo_seconds
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        db_inside = metrics.db_seconds + metrics.mongo_seconds - db_before
+        setattr(metrics, f'{name}_seconds', getattr(metrics, f'{name}_seconds') + elapsed - db_inside)
 
-class ReviewSerializer(serializers.ModelSerializer):
-    user_name = serializers.SerializerMethodField()
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """
+    Prometheus-style cumulative histogram keyed by label values
+    """
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
     
-    class Meta:
-        model = Review
-        fields = ['id', 'product', 'user', 'user_name', 'rating', 'comment', 'created_at']
-        read_only_fields = ['id', 'user', 'user_name', 'created_at']
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
     
-    def get_user_name(self, obj):
-        return f"{obj.user.first_name} {obj.user.last_name}"
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.series.items()):
+                label_text = ','.join(
+                    f'{name}="{value}"' for name, value in zip(self.label_names, labels)
+                )
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+                lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+REQUEST_LABELS = ('view', 'method')
+request_duration = Histogram(
+    'agriconnect_request_duration_seconds', 'Total request time', REQUEST_LABELS, DURATION_BUCKETS
+)
+request_db_duration = Histogram(
+    'agriconnect_request_db_seconds', 'ORM and raw MongoDB time per request', REQUEST_LABELS, DURATION_BUCKETS
+)
+request_serialize_duration = Histogram(
+    'agriconnect_request_serialize_seconds', 'Serialization time per request', REQUEST_LABELS, DURATION_BUCKETS
+)
+request_queries = Histogram(
+    'agriconnect_request_db_queries', 'ORM queries and raw MongoDB commands per request',
+    REQUEST_LABELS, QUERY_BUCKETS
+)
+HISTOGRAMS = (request_duration, request_db_duration, request_serialize_duration, request_queries)
+
+def observe_request(view, method, metrics, total_seconds):
+    labels = (view, method)
+    request_duration.observe(labels, total_seconds)
+    request_db_duration.observe(labels, metrics.db_seconds + metrics.mongo_seconds)
+    request_serialize_duration.observe(labels, metrics.serialize_seconds)
+    request_queries.observe(labels, metrics.queries + metrics.mongo_commands)
+
+def render_metrics(gauges=None):
+    """
+    All histograms (for this process) plus any extra gauges, in the
+    Prometheus text exposition format
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for name, value in (gauges or {}).items():
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+# mongo.py
+import asyncio
+import os
+import threading
+import time
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from pymongo import MongoClient, UpdateOne, monitoring
+from .metrics import current_metrics
+
+DEFAULT_CLIENT_SETTINGS = {
+    'HOST': 'mongodb://localhost:27017',
+    'NAME': 'agriconnect_db',
+    'MAX_POOL_SIZE': 50,
+    'MIN_POOL_SIZE': 0,
+    'WAIT_QUEUE_TIMEOUT_MS': 1000,
+    'CONNECT_TIMEOUT_MS': 5000,
+    'SERVER_SELECTION_TIMEOUT_MS': 5000,
+}
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connections in use and how long checkouts waited for one, per process
+    """
+    def __init__(self):
+        self.reset()
     
-    def create(self, validated_data):
-        validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
+    def reset(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.open = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+    
+    def snapshot(self):
+        with self.lock:
+            return {
+                'open': self.open,
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_max': self.wait_seconds_max,
+            }
+    
+    def _record_wait(self):
+        # Checkouts run on the calling thread, so start/finish pair up per thread
+        started = getattr(self.local, 'checkout_started', None)
+        self.local.checkout_started = None
+        return time.perf_counter() - started if started is not None else 0.0
+    
+    def connection_check_out_started(self, event):
+        self.local.checkout_started = time.perf_counter()
+    
+    def connection_checked_out(self, event):
+        waited = self._record_wait()
+        with self.lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+    
+    def connection_check_out_failed(self, event):
+        waited = self._record_wait()
+        with self.lock:
+            self.checkout_failures += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+    
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.in_use -= 1
+    
+    def connection_created(self, event):
+        with self.lock:
+            self.open += 1
+    
+    def connection_closed(self, event):
+        with self.lock:
+            self.open -= 1
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        pass
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_ready(self, event):
+        pass
 
-class OrderItemSerializer(serializers.ModelSerializer):
-    product_title = serializers.ReadOnlyField(source='product.title')
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Charges raw pymongo command time to the current request's metrics
+    """
+    def started(self, event):
+        pass
     
-    class Meta:
-        model = OrderItem
-        fields = ['id', 'product', 'product_title', 'quantity', 'price']
-        read_only_fields = ['id']
+    def succeeded(self, event):
+        self._record(event)
+    
+    def failed(self, event):
+        self._record(event)
+    
+    def _record(self, event):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.record_mongo(event.command_name, event.duration_micros / 1e6)
 
-class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True)
-    buyer_name = serializers.SerializerMethodField()
+pool_metrics = PoolMetrics()
+command_metrics = CommandMetrics()
+_clients = {}
+_clients_lock = threading.Lock()
+_async_clients = {}
+
+def _reset_after_fork():
+    # pymongo clients are not fork-safe: children open their own pools
+    global _clients_lock
+    _clients.clear()
+    _async_clients.clear()
+    _clients_lock = threading.Lock()
+    pool_metrics.reset()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def client_settings():
+    """
+    MONGO_CLIENT from Django settings when configured (the setup script runs
+    without them), with MONGODB_URI in the environment overriding the host
+    """
+    options = dict(DEFAULT_CLIENT_SETTINGS)
+    try:
+        from django.conf import settings
+        if settings.configured:
+            options.update(getattr(settings, 'MONGO_CLIENT', {}))
+    except ImportError:
+        pass
+    if os.environ.get('MONGODB_URI'):
+        options['HOST'] = os.environ['MONGODB_URI']
+    return options
+
+def get_client(host=None):
+    """
+    Process-wide pooled client for host, created on first use
+    """
+    options = client_settings()
+    host = host or options['HOST']
+    client = _clients.get(host)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(host)
+            if client is None:
+                client = MongoClient(
+                    host,
+                    maxPoolSize=options['MAX_POOL_SIZE'],
+                    minPoolSize=options['MIN_POOL_SIZE'],
+                    waitQueueTimeoutMS=options['WAIT_QUEUE_TIMEOUT_MS'],
+                    connectTimeoutMS=options['CONNECT_TIMEOUT_MS'],
+                    serverSelectionTimeoutMS=options['SERVER_SELECTION_TIMEOUT_MS'],
+                    event_listeners=[pool_metrics, command_metrics],
+                )
+                _clients[host] = client
+    return client
+
+def get_db(host=None):
+    return get_client(host)[client_settings()['NAME']]
+
+def get_async_db(host=None):
+    """
+    motor database for the async views. motor clients belong to the event
+    loop they were created on, so there is one per loop and host.
+    """
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient
+    except ImportError:
+        from django.core.exceptions import ImproperlyConfigured
+        raise ImproperlyConfigured('The async views need motor: pip install motor')
     
-    class Meta:
-        model = Order
-        fields = ['id', 'buyer', 'buyer_name', 'items', 'total_amount', 
-                  'shipping_address', 'phone_number', 'status', 'created_at']
-        read_only_fields = ['id', 'buyer', 'buyer_name', 'created_at']
+    options = client_settings()
+    host = host or options['HOST']
+    key = (host, asyncio.get_running_loop())
+    client = _async_clients.get(key)
+    if client is None:
+        # No command listener: motor runs commands on executor threads, outside
+        # the request's context, so async views time their own calls
+        client = AsyncIOMotorClient(
+            host,
+            maxPoolSize=options['MAX_POOL_SIZE'],
+            minPoolSize=options['MIN_POOL_SIZE'],
+            waitQueueTimeoutMS=options['WAIT_QUEUE_TIMEOUT_MS'],
+            connectTimeoutMS=options['CONNECT_TIMEOUT_MS'],
+            serverSelectionTimeoutMS=options['SERVER_SELECTION_TIMEOUT_MS'],
+            event_listeners=[pool_metrics],
+        )
+        _async_clients[key] = client
+    return client[options['NAME']]
+
+def instrument_orm_client(settings_dict):
+    """
+    djongo opens its own MongoClient (one per ORM connection) from the
+    database's CLIENT options; count its connections in pool_metrics too.
+    Its commands are timed by the ORM execute wrapper already, so it gets
+    no command listener.
+    """
+    if settings_dict.get('ENGINE') != 'djongo':
+        return
+    listeners = settings_dict.setdefault('CLIENT', {}).setdefault('event_listeners', [])
+    if pool_metrics not in listeners:
+        listeners.append(pool_metrics)
+
+def pool_stats():
+    stats = pool_metrics.snapshot()
+    stats['max_pool_size'] = client_settings()['MAX_POOL_SIZE']
+    # Shared pymongo and motor clients; djongo's are counted in the
+    # connections above but not here
+    stats['clients'] = len(_clients) + len(_async_clients)
+    return stats
+
+def to_bson(value):
+    """
+    Convert values pymongo cannot encode into the types djongo stores
+    """
+    if isinstance(value, Decimal):
+        return Decimal128(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+def from_bson(field, value):
+    """
+    A stored value as djongo hands it to the ORM for field
+    """
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    if isinstance(value, datetime):
+        internal_type = field.get_internal_type()
+        if internal_type == 'DateField':
+            return value.date()
+        if internal_type == 'DateTimeField':
+            from django.conf import settings
+            if settings.USE_TZ:
+                return value.replace(tzinfo=timezone.utc)
+    return value
+
+def from_document(model, doc, field_names=None):
+    """
+    Model instance for a raw document, as the ORM would have loaded it.
+    Fields not in field_names (model field names) are deferred.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if field_names is None or field.name in field_names
+    ]
+    return model.from_db(
+        'default',
+        [field.attname for field in fields],
+        [from_bson(field, doc.get(field.attname)) for field in fields],
+    )
+
+def get_collection(model):
+    """
+    Raw pymongo collection behind a model, for queries djongo cannot express
+    """
+    return get_db()[model._meta.db_table]
+
+def current_time():
+    """
+    updated_at for raw updates, on the ORM's auto_now clock (Django's
+    naive local time unless USE_TZ) rather than the server's UTC
+    $currentDate, so delta sync cursors can compare the two
+    """
+    from django.utils import timezone
+    return timezone.now()
+
+def nearby_ids(model, longitude, latitude, max_meters, limit, query=None):
+    """
+    (pk, distance in meters) of documents whose geo_point is within
+    max_meters, nearest first, via the 2dsphere index. query narrows the
+    documents before the limit is applied.
+    """
+    cursor = get_collection(model).aggregate([
+        {'$geoNear': {
+            'near': {'type': 'Point', 'coordinates': [longitude, latitude]},
+            'key': 'geo_point',
+            'distanceField': 'distance',
+            'maxDistance': max_meters,
+            'query': query or {},
+            'spherical': True,
+        }},
+        {'$limit': limit},
+        {'$project': {'_id': 0, 'id': 1, 'distance': 1}},
+    ])
+    return [(doc['id'], doc['distance']) for doc in cursor]
+
+def text_search_ids(model, terms, limit, query=None):
+    """
+    Primary keys of documents matching terms on the collection's text
+    index, best textScore first. query narrows the hits before the limit
+    is applied, so filtered searches aren't starved by unfiltered hits.
+    """
+    cursor = get_collection(model).find(
+        dict(query or {}, **{'$text': {'$search': terms}}),
+        {'id': 1, 'score': {'$meta': 'textScore'}}
+    ).sort([('score', {'$meta': 'textScore'})]).limit(limit)
+    return [doc['id'] for doc in cursor]
+
+def matching_ids(model, query):
+    """
+    Primary keys of documents matching a native MongoDB query
+    """
+    return [doc['id'] for doc in get_collection(model).find(query, {'id': 1})]
+
+def take_stock(model, quantities):
+    """
+    Atomically decrement quantity by {pk: amount}, each only while at least
+    that much is left. All or nothing: if a document is short, the amounts
+    already taken are put back and the short pk is returned.
+    """
+    collection = get_collection(model)
+    taken = {}
     
-    def get_buyer_name(self, obj):
-        return f"{obj.buyer.first_name} {obj.buyer.last_name}"
+    # Fixed pk order so concurrent orders contend on documents in the same order
+    for pk, amount in sorted(quantities.items()):
+        result = collection.update_one(
+            {'id': pk, 'quantity': {'$gte': amount}},
+            {'$inc': {'quantity': -amount}, '$set': {'updated_at': current_time()}}
+        )
+        if not result.modified_count:
+            return_stock(model, taken)
+            return pk
+        taken[pk] = amount
     
-    def create(self, validated_data):
-        items_data = validated_data.pop('items')
-        validated_data['buyer'] = self.context['request'].user
-        order = Order.objects.create(**validated_data)
+    return None
+
+def adjust_rating(model, pk, rating_delta, count_delta):
+    """
+    Atomically shift rating_sum/rating_count and recompute rating_avg from
+    them in the same update, so concurrent reviews cannot lose each other
+    """
+    get_collection(model).update_one({'id': pk}, [
+        {'$set': {
+            'rating_sum': {'$add': [{'$ifNull': ['$rating_sum', 0]}, rating_delta]},
+            'rating_count': {'$add': [{'$ifNull': ['$rating_count', 0]}, count_delta]},
+            'updated_at': current_time(),
+        }},
+        {'$set': {'rating_avg': {'$cond': [
+            {'$gt': ['$rating_count', 0]}, {'$divide': ['$rating_sum', '$rating_count']}, 0
+        ]}}},
+    ])
+
+def return_stock(model, quantities):
+    if not quantities:
+        return
+    get_collection(model).bulk_write([
+        UpdateOne({'id': pk}, {'$inc': {'quantity': amount}, '$set': {'updated_at': current_time()}})
+        for pk, amount in quantities.items()
+    ], ordered=False)
+
+# indexes.py
+from datetime import datetime
+from pymongo import ASCENDING as ASC, DESCENDING as DESC, GEOSPHERE, IndexModel, TEXT
+from pymongo.errors import OperationFailure
+
+# Compound indexes follow the query shapes the views run: equality fields
+# first, then the sort (always ending on id for keyset pagination), then
+# range fields
+INDEXES = {
+    'users': [
+        IndexModel([('username', ASC)], unique=True),
+        IndexModel([('email', ASC)], unique=True),
+        IndexModel([('date_joined', DESC), ('id', DESC)]),
+        IndexModel([('geo_point', GEOSPHERE)]),
+    ],
+    'products': [
+        IndexModel([('created_at', DESC), ('id', DESC)]),
+        IndexModel([('price', ASC), ('id', ASC)]),
+        IndexModel([('harvest_date', DESC), ('id', DESC)]),
+        IndexModel([('rating_avg', DESC), ('id', DESC)]),
+        IndexModel([('rating_count', DESC), ('id', DESC)]),
+        IndexModel([('category', ASC), ('created_at', DESC), ('id', DESC)]),
+        IndexModel([('category', ASC), ('is_organic', ASC), ('created_at', DESC), ('id', DESC), ('price', ASC)]),
+        IndexModel([('category', ASC), ('is_organic', ASC), ('price', ASC), ('id', ASC)]),
+        IndexModel([('farmer_id', ASC), ('created_at', DESC), ('id', DESC)]),
+        IndexModel([('updated_at', ASC), ('id', ASC)]),
+        IndexModel(
+            [('farmer_id', ASC), ('sku', ASC)], unique=True,
+            partialFilterExpression={'sku': {'$type': 'string'}}
+        ),
+        IndexModel([('title', TEXT), ('description', TEXT)]),
+        IndexModel([('geo_point', GEOSPHERE)]),
+    ],
+    'orders': [
+        IndexModel([('buyer_id', ASC), ('created_at', DESC), ('id', DESC)]),
+        IndexModel([('farmer_ids', ASC), ('created_at', DESC), ('id', DESC)]),
+        IndexModel([('status', ASC), ('updated_at', ASC)]),
+        IndexModel([('created_at', ASC), ('id', ASC)]),
+    ],
+    'order_items': [
+        IndexModel([('order_id', ASC)]),
+        IndexModel([('product_id', ASC)]),
+    ],
+    'orders_archive': [
+        IndexModel([('id', ASC)], unique=True),
+        IndexModel([('buyer_id', ASC), ('created_at', DESC), ('id', DESC)]),
+        IndexModel([('farmer_ids', ASC), ('created_at', DESC), ('id', DESC)]),
+    ],
+    'order_items_archive': [
+        IndexModel([('id', ASC)], unique=True),
+        IndexModel([('order_id', ASC)]),
+    ],
+    'reviews': [
+        IndexModel([('product_id', ASC), ('user_id', ASC)], unique=True),
+        IndexModel([('created_at', DESC), ('id', DESC)]),
+        IndexModel([('product_id', ASC), ('created_at', DESC), ('id', DESC)]),
+        IndexModel([('user_id', ASC), ('created_at', DESC), ('id', DESC)]),
+    ],
+    'sales_daily': [
+        IndexModel([('farmer_id', ASC), ('day', ASC), ('product_id', ASC)], unique=True),
+    ],
+    'order_events': [
+        IndexModel([('buyer_id', ASC), ('_id', ASC)]),
+        IndexModel([('farmer_ids', ASC), ('_id', ASC)]),
+        IndexModel([('expires_at', ASC)], expireAfterSeconds=0),
+    ],
+    'product_tombstones': [
+        IndexModel([('deleted_at', ASC), ('product_id', ASC)]),
+        IndexModel([('expires_at', ASC)], expireAfterSeconds=0),
+    ],
+}
+
+# Single-field indexes from earlier setups that a compound index above now
+# covers as a prefix
+REDUNDANT_INDEXES = {
+    'products': ['category_1', 'farmer_id_1'],
+    'orders': ['buyer_id_1', 'farmer_ids_1', 'status_1', 'created_at_1'],
+    'reviews': ['product_id_1'],
+}
+
+# Options that make two indexes with the same keys different
+INDEX_OPTIONS = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds')
+
+# Representative filters and sorts for every list query the API runs
+QUERY_SHAPES = [
+    ('product list', 'products', {}, [('created_at', DESC), ('id', DESC)]),
+    ('product list by price', 'products', {}, [('price', ASC), ('id', ASC)]),
+    ('product list by rating', 'products', {}, [('rating_avg', DESC), ('id', DESC)]),
+    ('product list by rating count', 'products', {}, [('rating_count', DESC), ('id', DESC)]),
+    ('products by category', 'products', {'category': 'vegetables'}, [('created_at', DESC), ('id', DESC)]),
+    ('products by category and organic', 'products',
+     {'category': 'vegetables', 'is_organic': True}, [('created_at', DESC), ('id', DESC)]),
+    ('products by category, organic and price', 'products',
+     {'category': 'vegetables', 'is_organic': True, 'price': {'$gte': 1, '$lte': 10}},
+     [('created_at', DESC), ('id', DESC)]),
+    ('products by category, organic and price by price', 'products',
+     {'category': 'vegetables', 'is_organic': True, 'price': {'$gte': 1, '$lte': 10}},
+     [('price', ASC), ('id', ASC)]),
+    ('farmer products', 'products', {'farmer_id': 1}, [('created_at', DESC), ('id', DESC)]),
+    ('product changes', 'products',
+     {'updated_at': {'$gt': datetime(2024, 1, 1), '$lt': datetime(2024, 1, 2)}},
+     [('updated_at', ASC), ('id', ASC)]),
+    ('product deletions', 'product_tombstones',
+     {'deleted_at': {'$gt': datetime(2024, 1, 1), '$lt': datetime(2024, 1, 2)}},
+     [('deleted_at', ASC), ('product_id', ASC)]),
+    ('buyer orders', 'orders', {'buyer_id': 1}, [('created_at', DESC), ('id', DESC)]),
+    ('farmer orders', 'orders', {'farmer_ids': 1}, [('created_at', DESC), ('id', DESC)]),
+    ('order export', 'orders', {}, [('created_at', ASC), ('id', ASC)]),
+    ('order items', 'order_items', {'order_id': 1}, None),
+    ('archivable orders', 'orders',
+     {'status': {'$in': ['delivered', 'cancelled']}, 'updated_at': {'$lt': datetime(2024, 1, 1)}}, None),
+    ('archived buyer orders', 'orders_archive', {'buyer_id': 1}, [('created_at', DESC), ('id', DESC)]),
+    ('archived farmer orders', 'orders_archive', {'farmer_ids': 1}, [('created_at', DESC), ('id', DESC)]),
+    ('archived order items', 'order_items_archive', {'order_id': 1}, None),
+    ('review list', 'reviews', {}, [('created_at', DESC), ('id', DESC)]),
+    ('product reviews', 'reviews', {'product_id': 1}, [('created_at', DESC), ('id', DESC)]),
+    ('user reviews', 'reviews', {'user_id': 1}, [('created_at', DESC), ('id', DESC)]),
+    ('farmer sales', 'sales_daily',
+     {'farmer_id': 1, 'day': {'$gte': datetime(2024, 1, 1), '$lte': datetime(2024, 12, 31)}},
+     [('day', ASC), ('product_id', ASC)]),
+    ('buyer order events', 'order_events', {'buyer_id': 1}, [('_id', ASC)]),
+    ('farmer order events', 'order_events', {'farmer_ids': 1}, [('_id', ASC)]),
+    ('user list', 'users', {}, [('date_joined', DESC), ('id', DESC)]),
+]
+
+def apply_indexes(db):
+    """
+    Create missing indexes, re-create any whose options changed and drop
+    redundant ones. Safe to run repeatedly against a live database.
+    Returns what was changed.
+    """
+    changes = []
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
         
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+        for index in indexes:
+            spec = index.document
+            name = spec['name']
+            current = existing.get(name)
+            if current is not None:
+                if all(current.get(option) == spec.get(option) for option in INDEX_OPTIONS):
+                    continue
+                collection.drop_index(name)
+            try:
+                collection.create_indexes([index])
+            except OperationFailure as e:
+                # Same keys under another name (e.g. created by djongo) already serve the query
+                if e.code != 85:
+                    raise
+                continue
+            changes.append(f"created {collection_name}.{name}")
         
-        return order
+        for name in REDUNDANT_INDEXES.get(collection_name, []):
+            if name in existing:
+                collection.drop_index(name)
+                changes.append(f"dropped {collection_name}.{name}")
+    
+    return changes
 
-# views.py
-from rest_framework import viewsets, permissions, status, filters
-from rest_framework.decorators import action
+def plan_stages(plan):
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+def check_query_plans(db, shapes=QUERY_SHAPES):
+    """
+    Explain every query shape and return (name, problem) for each one whose
+    winning plan scans the collection or sorts in memory
+    """
+    problems = []
+    for name, collection_name, query, sort in shapes:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = plan_stages(cursor.explain()['queryPlanner']['winningPlan'])
+        if 'COLLSCAN' in stages:
+            problems.append((name, 'collection scan'))
+        if 'SORT' in stages:
+            problems.append((name, 'in-memory sort'))
+    return problems
+
+# cache.py
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags, urlencode
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.db.models import Q
-from .models import User, Product, Order, Review
-from .serializers import (
-    UserSerializer, ProductSerializer, OrderSerializer, ReviewSerializer
+
+CATALOG_VERSION_KEY = 'catalog:version'
+LIST_VERSION_KEY = 'catalog:lists'
+PRODUCT_VERSION_KEY = 'catalog:product:{}'
+DETAIL_SCOPE = 'detail:'
+CATALOG_CACHE_PARAMS = (
+    'category', 'farmer', 'is_organic', 'min_price', 'max_price',
+    'search', 'near', 'radius_km', 'ordering', 'cursor', 'page_size', 'fields', 'omit',
+)
+# Facet counts depend on the filters alone, not on order or page
+FACET_CACHE_PARAMS = (
+    'category', 'farmer', 'is_organic', 'min_price', 'max_price',
+    'search', 'near', 'radius_km',
 )
 
-class IsOwnerOrReadOnly(permissions.BasePermission):
+def catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns, None)
+
+def invalidate_catalog():
     """
-    Custom permission to only allow owners of an object to edit it.
+    Drop every cached catalog response by moving to a new key version
     """
-    def has_object_permission(self, request, view, obj):
-        if request.method in permissions.SAFE_METHODS:
-            return True
-        
-        # Check if the object has a farmer attribute (Product)
-        if hasattr(obj, 'farmer'):
-            return obj.farmer == request.user
-        
-        # Check if the object has a buyer attribute (Order)
-        if hasattr(obj, 'buyer'):
-            return obj.buyer == request.user
-        
-        # Check if the object has a user attribute (Review)
-        if hasattr(obj, 'user'):
-            return obj.user == request.user
-        
-        return obj == request.user
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
 
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
-    serializer_class = UserSerializer
-    permission_classes = [IsOwnerOrReadOnly]
+def invalidate_products(pks):
+    """
+    For stock moved by orders: drop these products' cached detail responses
+    and every cached list and facet page, which show quantities too. Other
+    products' details stay cached.
+    """
+    version = time.time_ns()
+    versions = {PRODUCT_VERSION_KEY.format(pk): version for pk in pks}
+    versions[LIST_VERSION_KEY] = version
+    cache.set_many(versions, None)
+
+def catalog_cache_key(request, scope, cache_params=CATALOG_CACHE_PARAMS):
+    # Normalize params the way ProductViewSet reads them, so equivalent
+    # queries share one entry
+    params = []
+    for name in cache_params:
+        value = request.query_params.get(name, '').strip()
+        if name in ('category', 'search'):
+            value = ' '.join(value.lower().split())
+            if name == 'category' and value == 'all':
+                value = ''
+        elif name == 'is_organic' and value:
+            value = str(value.lower() == 'true').lower()
+        if value:
+            params.append((name, value))
     
-    @action(detail=False, methods=['get'])
-    def farmers(self, request):
-        farmers = User.objects.filter(user_type='farmer')
-        serializer = self.get_serializer(farmers, many=True)
-        return Response(serializer.data)
+    if scope.startswith(DETAIL_SCOPE):
+        scope_key = PRODUCT_VERSION_KEY.format(scope[len(DETAIL_SCOPE):])
+    else:
+        scope_key = LIST_VERSION_KEY
+    version = f"{catalog_version()}.{cache.get(scope_key, 0)}"
     
-    @action(detail=False, methods=['get'])
-    def me(self, request):
-        serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+    # Pagination links are absolute, so the host is part of the response
+    raw = f"{request.get_host()}|{scope}|{urlencode(params)}"
+    return f"catalog:{version}:{hashlib.md5(raw.encode()).hexdigest()}"
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
-    serializer_class = ProductSerializer
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'description', 'category', 'location']
-    ordering_fields = ['price', 'created_at', 'harvest_date']
+def catalog_entry(data):
+    body = JSONRenderer().render(data)
+    return {'data': data, 'etag': f'"{hashlib.md5(body).hexdigest()}"'}
+
+def etag_matches(request, etag):
+    # Weak comparison: CompressionMiddleware hands out W/ versions of these
+    etags = {tag[2:] if tag.startswith('W/') else tag for tag in
+             parse_etags(request.headers.get('If-None-Match', ''))}
+    return etag in etags or '*' in etags
+
+class CatalogCacheMixin:
+    """
+    Serves list and retrieve from the cache until a product is written, and
+    answers a matching If-None-Match with 304 without touching the database
+    """
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, 'list', super().list, *args, **kwargs)
     
-    def get_queryset(self):
-        queryset = Product.objects.all()
-        
-        # Filter by category
-        category = self.request.query_params.get('category')
-        if category and category.lower() != 'all':
-            queryset = queryset.filter(category__iexact=category)
+    def retrieve(self, request, *args, **kwargs):
+        scope = f"{DETAIL_SCOPE}{kwargs.get(self.lookup_url_kwarg or self.lookup_field)}"
+        return self.cached_response(request, scope, super().retrieve, *args, **kwargs)
+    
+    def cached_response(self, request, scope, view, *args, cache_params=CATALOG_CACHE_PARAMS, **kwargs):
+        key = catalog_cache_key(request, scope, cache_params)
+        entry = cache.get(key)
         
-        # Filter by farmer
-        farmer_id = self.request.query_params.get('farmer')
-        if farmer_id:
-            queryset = queryset.filter(farmer_id=farmer_id)
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = catalog_entry(response.data)
+            cache.set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
         
-        # Filter by is_organic
-        is_organic = self.request.query_params.get('is_organic')
-        if is_organic:
-            is_organic_bool = is_organic.lower() == 'true'
-            queryset = queryset.filter(is_organic=is_organic_bool)
+        if etag_matches(request, entry['etag']):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry['etag']})
         
-        # Filter by price range
-        min_price = self.request.query_params.get('min_price')
+        return Response(entry['data'], headers={'ETag': entry['etag']})
+
+# authentication.py
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+class UserCache:
+    """
+    Authenticated users by id: an in-process LRU whose entries expire after
+    TIMEOUT seconds, in front of an optional shared Django cache
+    (SHARED_ALIAS) so workers warm each other. Saving or deleting a user
+    drops it from this process and the shared cache; other processes'
+    local entries can be stale for at most TIMEOUT seconds.
+    """
+    key_prefix = 'auth-user'
+    
+    def __init__(self):
+        options = getattr(settings, 'USER_CACHE', {})
+        self.size = options.get('SIZE', 1024)
+        self.timeout = options.get('TIMEOUT', 60)
+        self.shared_alias = options.get('SHARED_ALIAS')
+        self.shared_timeout = options.get('SHARED_TIMEOUT', 600)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+    
+    def shared_key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+    
+    def remember(self, key, user):
+        with self.lock:
+            self.entries[key] = (user, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+    
+    def get(self, user_id):
+        key = str(user_id)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                user, expires = entry
+                if expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return user
+                del self.entries[key]
+        
+        user = self.shared.get(self.shared_key(key)) if self.shared_alias else None
+        if user is None:
+            self.misses += 1
+            return None
+        self.remember(key, user)
+        self.hits += 1
+        return user
+    
+    def set(self, user_id, user):
+        key = str(user_id)
+        self.remember(key, user)
+        if self.shared_alias:
+            self.shared.set(self.shared_key(key), user, self.shared_timeout)
+    
+    def forget(self, user_id):
+        key = str(user_id)
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.shared_alias:
+            self.shared.delete(self.shared_key(key))
+    
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+user_cache = UserCache()
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user from user_cache, so
+    steady-state authenticated requests do no user lookup in MongoDB
+    """
+    def get_user(self, validated_token):
+        user = self.cached_user(validated_token)
+        if user is None:
+            # Cache miss: the usual lookup and checks, then keep the result
+            user = super().get_user(validated_token)
+            user_cache.set(validated_token[api_settings.USER_ID_CLAIM], user)
+        
+        # Requests get their own copy so attributes set on request.user never
+        # leak into the cached instance
+        return copy.copy(user)
+    
+    def cached_user(self, validated_token):
+        """
+        The token's user from user_cache, or None on a miss
+        """
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(user_id) if user_id is not None else None
+        if user is None:
+            return None
+        
+        # Checks the parent does against the database row, repeated against
+        # the cached one in case another process has not seen an update yet
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False) and validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed("The user's password has been changed.",
+                                       code='password_changed')
+        return user
+
+# analytics.py
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from pymongo import UpdateOne
+from .mongo import get_db
+
+CENTS = Decimal('0.01')
+
+# Orders in these states count as sales; cancelling one takes it back out
+SALES_STATUSES = ('pending', 'processing', 'shipped', 'delivered')
+
+def sales_rollups():
+    """
+    Daily per-farmer, per-product sales documents:
+    {farmer_id, product_id, day, revenue, units, orders}
+    """
+    return get_db()['sales_daily']
+
+def sales_day(moment):
+    """
+    The rollup day of a datetime (UTC when aware) or a plain date
+    """
+    if getattr(moment, 'tzinfo', None) is not None:
+        moment = moment.astimezone(dt_timezone.utc)
+    return datetime(moment.year, moment.month, moment.day)
+
+def record_order_sales(order, sign):
+    """
+    Add (sign=1) or remove (sign=-1) an order's items from the daily rollups.
+    Revenue is summed as Decimal128 so repeated $incs don't drift, and a
+    product listed on several items of the order counts as one order.
+    """
+    day = sales_day(order.created_at)
+    items = order.items.values_list('product_id', 'product__farmer_id', 'quantity', 'price')
+    totals = defaultdict(lambda: [Decimal(0), 0])
+    for product_id, farmer_id, quantity, price in items:
+        total = totals[product_id, farmer_id]
+        total[0] += quantity * price
+        total[1] += quantity
+    updates = [
+        UpdateOne(
+            {'farmer_id': farmer_id, 'product_id': product_id, 'day': day},
+            {'$inc': {
+                'revenue': Decimal128(sign * revenue),
+                'units': sign * units,
+                'orders': sign,
+            }},
+            upsert=True
+        )
+        for (product_id, farmer_id), (revenue, units) in totals.items()
+    ]
+    if updates:
+        sales_rollups().bulk_write(updates, ordered=False)
+
+def money(value):
+    # A rollup revenue (Decimal128, or a double from before it was one) in cents
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    return Decimal(str(value)).quantize(CENTS)
+
+def farmer_sales(farmer_id, start, end, product_id=None):
+    """
+    Per-product daily rows and overall totals for a farmer between two
+    dates (inclusive), in one aggregation over the rollups
+    """
+    match = {
+        'farmer_id': farmer_id,
+        'day': {'$gte': sales_day(start), '$lte': sales_day(end)},
+    }
+    if product_id is not None:
+        match['product_id'] = product_id
+    
+    result = next(sales_rollups().aggregate([
+        {'$match': match},
+        {'$facet': {
+            'days': [
+                {'$sort': {'day': 1, 'product_id': 1}},
+                {'$project': {'_id': 0, 'day': 1, 'product_id': 1, 'revenue': 1, 'units': 1, 'orders': 1}},
+            ],
+            'totals': [
+                {'$group': {
+                    '_id': None,
+                    'revenue': {'$sum': '$revenue'},
+                    'units': {'$sum': '$units'},
+                    'orders': {'$sum': '$orders'},
+                }},
+                {'$project': {'_id': 0}},
+            ],
+        }},
+    ]))
+    
+    for row in result['days']:
+        row['day'] = row['day'].date().isoformat()
+        row['revenue'] = money(row['revenue'])
+    totals = result['totals'][0] if result['totals'] else {'revenue': 0, 'units': 0, 'orders': 0}
+    totals['revenue'] = money(totals['revenue'])
+    return {'days': result['days'], 'totals': totals}
+
+# events.py
+import json
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from string import hexdigits
+from bson import ObjectId
+from bson.timestamp import Timestamp
+from django.conf import settings
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+from .mongo import get_client, get_db
+
+EVENTS_COLLECTION = 'order_events'
+
+DEFAULT_FEED_SETTINGS = {
+    'MODE': 'auto',
+    'POLL_INTERVAL': 2,
+    'HEARTBEAT': 15,
+    'STREAM_TIMEOUT': 300,
+    'LONG_POLL_TIMEOUT': 25,
+    'RETENTION_DAYS': 7,
+    # Polled events are served once the second their ObjectId was minted in
+    # is this long past (see settled_bound)
+    'SETTLE_SECONDS': 2,
+    'BATCH_SIZE': 100,
+}
+
+_change_streams = None
+
+class FeedReset(Exception):
+    """
+    The resume token is older than the events still kept; the client has
+    to reload its orders and follow the feed from now
+    """
+
+def feed_settings():
+    options = dict(DEFAULT_FEED_SETTINGS)
+    options.update(getattr(settings, 'ORDER_EVENTS', {}))
+    return options
+
+def order_events():
+    """
+    One document per order status change, expiring after RETENTION_DAYS:
+    {order_id, status, previous, buyer_id, farmer_ids, created_at, expires_at}
+    """
+    return get_db()[EVENTS_COLLECTION]
+
+def record_status_change(order, previous):
+    now = datetime.now(dt_timezone.utc)
+    order_events().insert_one({
+        'order_id': order.pk,
+        'status': order.status,
+        'previous': previous,
+        'buyer_id': order.buyer_id,
+        # Orders from before farmer_ids was tracked may not have it yet
+        'farmer_ids': list(order.farmer_ids or []),
+        'created_at': now,
+        'expires_at': now + timedelta(days=feed_settings()['RETENTION_DAYS']),
+    })
+
+def use_change_streams():
+    """
+    Follow change streams (replica sets and mongos) rather than poll. MODE
+    'auto' asks the server once per process.
+    """
+    global _change_streams
+    mode = feed_settings()['MODE']
+    if mode != 'auto':
+        return mode == 'stream'
+    if _change_streams is None:
+        reply = get_client().admin.command('ismaster')
+        _change_streams = 'setName' in reply or reply.get('msg') == 'isdbgrid'
+    return _change_streams
+
+def parse_token(value):
+    """
+    A resume token from a client: None, an event ObjectId (polling) or the
+    hex _data of a change stream resume token
+    """
+    if not value:
+        return None
+    if ObjectId.is_valid(value):
+        token = ObjectId(value)
+        retention = timedelta(days=feed_settings()['RETENTION_DAYS'])
+        if token.generation_time < datetime.now(dt_timezone.utc) - retention:
+            raise FeedReset
+        return token
+    if all(char in hexdigits for char in value):
+        return value
+    raise ValueError('Invalid resume token')
+
+def event_payload(doc):
+    return {
+        'id': str(doc['_id']),
+        'order': doc['order_id'],
+        'status': doc['status'],
+        'previous': doc['previous'],
+        'at': doc['created_at'].replace(tzinfo=None).isoformat() + 'Z',
+    }
+
+def audience(user):
+    # The buyer and every farmer with products in the order
+    return {'$or': [{'buyer_id': user.pk}, {'farmer_ids': user.pk}]}
+
+def settled_bound(options):
+    """
+    ObjectIds only order events across processes to the second, so polling
+    serves a second once every insert minted in it has landed; within it
+    the _id order is then fixed and _id > token resumes exactly
+    """
+    settled = datetime.now(dt_timezone.utc) - timedelta(seconds=options['SETTLE_SECONDS'])
+    return ObjectId.from_datetime(settled)
+
+def poll_query(user, after, bound):
+    query = audience(user)
+    query['_id'] = {'$gt': after, '$lt': bound}
+    return query
+
+def change_pipeline(user):
+    return [{'$match': {
+        'operationType': 'insert',
+        '$or': [{'fullDocument.buyer_id': user.pk}, {'fullDocument.farmer_ids': user.pk}],
+    }}]
+
+def stream_options(token, options):
+    kwargs = {'max_await_time_ms': int(options['POLL_INTERVAL'] * 1000)}
+    if isinstance(token, ObjectId):
+        # A polling token: replay its second and skip what polling already sent
+        kwargs['start_at_operation_time'] = Timestamp(token.generation_time, 0)
+    elif token:
+        kwargs['resume_after'] = {'_data': token}
+    return kwargs
+
+def already_sent(doc, token):
+    return isinstance(token, ObjectId) and doc['_id'] <= token
+
+def token_string(token):
+    if token is None or isinstance(token, str):
+        return token
+    if isinstance(token, ObjectId):
+        return str(token)
+    return token['_data']
+
+def event_feed(user, token, timeout):
+    """
+    (token, event) for each status change to user's orders after token,
+    with (token, None) ticks while idle, for about timeout seconds
+    """
+    if use_change_streams():
+        yield from stream_feed(user, token, timeout)
+    elif token is not None and not isinstance(token, ObjectId):
+        # A change stream token on a server that can no longer resume it
+        raise FeedReset
+    else:
+        yield from poll_feed(user, token, timeout)
+
+def stream_feed(user, token, timeout):
+    options = feed_settings()
+    deadline = time.monotonic() + timeout
+    last = token_string(token)
+    sent = False
+    try:
+        with order_events().watch(change_pipeline(user), **stream_options(token, options)) as stream:
+            while True:
+                change = stream.try_next()
+                if change is None:
+                    last = token_string(stream.resume_token) or last
+                    yield last, None
+                    if time.monotonic() >= deadline:
+                        return
+                    continue
+                last = token_string(change['_id'])
+                if not already_sent(change['fullDocument'], token):
+                    sent = True
+                    yield last, event_payload(change['fullDocument'])
+    except OperationFailure as exc:
+        # Before anything was sent a failure means the resume point is gone
+        # from the oplog (or never existed)
+        if token is None or sent:
+            raise
+        raise FeedReset from exc
+
+def poll_feed(user, after, timeout):
+    options = feed_settings()
+    collection = order_events()
+    deadline = time.monotonic() + timeout
+    if after is None:
+        after = settled_bound(options)
+    while True:
+        docs = list(collection.find(poll_query(user, after, settled_bound(options)))
+                    .sort('_id', ASCENDING).limit(options['BATCH_SIZE']))
+        for doc in docs:
+            after = doc['_id']
+            yield str(after), event_payload(doc)
+        if len(docs) == options['BATCH_SIZE']:
+            continue
+        yield str(after), None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(options['POLL_INTERVAL'], remaining))
+
+def long_poll(feed, token):
+    """
+    Events already waiting on the feed, or else the first ones to arrive
+    before it times out
+    """
+    events = []
+    for token, event in feed:
+        if event is not None:
+            events.append(event)
+        elif events:
+            break
+    return {'events': events, 'next': token}
+
+def event_stream(feed, options):
+    """
+    Server-sent events. Each carries its resume token as the id, which
+    EventSource sends back as Last-Event-ID when it reconnects.
+    """
+    heartbeat = options['HEARTBEAT']
+    yield f'retry: {int(options["POLL_INTERVAL"] * 1000)}\n\n'
+    beat = time.monotonic()
+    try:
+        for token, event in feed:
+            if event is not None:
+                yield f'id: {token}\nevent: order_status\ndata: {json.dumps(event)}\n\n'
+                beat = time.monotonic()
+            elif time.monotonic() - beat >= heartbeat:
+                # An id without data moves the client's resume point along
+                yield f'id: {token}\n: keepalive\n\n'
+                beat = time.monotonic()
+    except FeedReset:
+        yield 'event: reset\ndata: {}\n\n'
+
+# inventory.py
+import codecs
+import csv
+import json
+from itertools import islice
+from django.db import DatabaseError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .cache import invalidate_catalog
+from .models import Product
+from .mongo import current_time, get_collection, to_bson
+from .serializers import ProductSerializer
+
+def iter_inventory_rows(lines, file_format):
+    """
+    Parse an upload line by line, yielding (row number, row, error)
+    """
+    decoded = codecs.iterdecode(lines, 'utf-8-sig')
+    if file_format == 'csv':
+        for number, row in enumerate(csv.DictReader(decoded), start=1):
+            yield number, row, None
+        return
+    
+    number = 0
+    for line in decoded:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None, 'Invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Each line must be a JSON object'
+            continue
+        yield number, row, None
+
+def import_inventory(farmer, rows, batch_size=500):
+    """
+    Create or update the farmer's products by SKU, validating and writing a
+    batch at a time. Returns one result per row.
+    """
+    results = []
+    seen = set()
+    changed = False
+    rows = iter(rows)
+    
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        changed = _import_batch(farmer, batch, seen, results) or changed
+    
+    # Bulk writes skip the Product signals
+    if changed:
+        invalidate_catalog()
+    return results
+
+def _import_batch(farmer, batch, seen, results):
+    skus = [str(row.get('sku') or '').strip() for _, row, _ in batch if row]
+    existing = dict(
+        Product.objects.filter(farmer=farmer, sku__in=skus).values_list('sku', 'id')
+    )
+    creates, updates = [], []
+    
+    for number, row, error in batch:
+        if error:
+            results.append({'row': number, 'status': 'error', 'errors': {'non_field_errors': [error]}})
+            continue
+        
+        # Blank cells mean "leave as is" on updates
+        row = {
+            key: value.strip() if isinstance(value, str) else value
+            for key, value in row.items()
+            if key is not None and value not in ('', None)
+        }
+        if 'latitude' in row or 'longitude' in row:
+            row['coordinates'] = {
+                'latitude': row.pop('latitude', None),
+                'longitude': row.pop('longitude', None),
+            }
+        sku = str(row.pop('sku', '')).strip()
+        if not sku or sku in seen:
+            message = 'Duplicate SKU in upload' if sku else 'SKU is required'
+            results.append({'row': number, 'sku': sku, 'status': 'error', 'errors': {'sku': [message]}})
+            continue
+        seen.add(sku)
+        
+        pk = existing.get(sku)
+        serializer = ProductSerializer(data=row, partial=pk is not None)
+        if not serializer.is_valid():
+            results.append({'row': number, 'sku': sku, 'status': 'error', 'errors': serializer.errors})
+            continue
+        
+        if pk is None:
+            result = {'row': number, 'sku': sku, 'status': 'created'}
+            creates.append((Product(farmer=farmer, sku=sku, **serializer.validated_data), result))
+        else:
+            fields = {name: to_bson(value) for name, value in serializer.validated_data.items()}
+            fields['updated_at'] = current_time()
+            result = {'row': number, 'sku': sku, 'id': pk, 'status': 'updated'}
+            updates.append((UpdateOne({'id': pk}, {'$set': fields}), result))
+        results.append(result)
+    
+    written = False
+    if creates:
+        written = _write_creates(farmer, creates) or written
+    if updates:
+        try:
+            get_collection(Product).bulk_write([update for update, _ in updates], ordered=False)
+        except BulkWriteError as e:
+            _fail_rows([result for _, result in updates], e.details['writeErrors'])
+        written = written or any(result['status'] == 'updated' for _, result in updates)
+    return written
+
+def _write_creates(farmer, creates):
+    try:
+        Product.objects.bulk_create([product for product, _ in creates], batch_size=len(creates))
+        return True
+    except DatabaseError as e:
+        # djongo reports the insert's BulkWriteError as a DatabaseError (or
+        # IntegrityError), e.g. when another upload created the same SKU
+        # after this batch looked them up
+        error = e
+        while error is not None and not isinstance(error, BulkWriteError):
+            error = error.__cause__ or error.__context__
+        if error is None:
+            raise
+    
+    results = [result for _, result in creates]
+    _fail_rows(results, error.details['writeErrors'])
+    # An ordered insert stops at its first error; rows it never reached
+    # are reported rather than guessed at
+    skus = [result['sku'] for result in results if result['status'] == 'created']
+    stored = set(Product.objects.filter(farmer=farmer, sku__in=skus).values_list('sku', flat=True))
+    for result in results:
+        if result['status'] == 'created' and result['sku'] not in stored:
+            result.update(status='error', errors={'non_field_errors': ['Not saved, upload the row again']})
+    return bool(stored)
+
+def _fail_rows(results, write_errors):
+    # Turn a bulk write's errors into errors on the rows they came from
+    for write_error in write_errors:
+        result = results[write_error['index']]
+        if write_error['code'] == 11000:
+            errors = {'sku': ['You already have a product with this SKU']}
+        else:
+            errors = {'non_field_errors': [write_error['errmsg']]}
+        result.pop('id', None)
+        result.update(status='error', errors=errors)
+
+# exports.py
+import csv
+import json
+from datetime import datetime
+from bson.decimal128 import Decimal128
+from pymongo import ASCENDING
+from .archive import archive_collection
+from .models import Order, OrderItem, Product
+from .mongo import get_collection
+
+EXPORT_BATCH_SIZE = 1000
+# Ends on id so the (created_at, id) index serves the sort
+EXPORT_SORT = [('created_at', ASCENDING), ('id', ASCENDING)]
+ORDER_EXPORT_FIELDS = [
+    'id', 'buyer_id', 'status', 'total_amount', 'shipping_address',
+    'phone_number', 'created_at', 'updated_at',
+]
+ITEM_EXPORT_FIELDS = ['product_id', 'product_title', 'quantity', 'price']
+
+def export_value(value):
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def items_lookup(collection_name, field):
+    return {'$lookup': {
+        'from': collection_name,
+        'let': {'order_id': '$id'},
+        'pipeline': [
+            {'$match': {'$expr': {'$eq': ['$order_id', '$$order_id']}}},
+            {'$lookup': {
+                'from': Product._meta.db_table, 'localField': 'product_id',
+                'foreignField': 'id', 'as': 'product',
+            }},
+            {'$project': {
+                '_id': 0, 'product_id': 1, 'quantity': 1, 'price': 1,
+                'product_title': {'$arrayElemAt': ['$product.title', 0]},
+            }},
+        ],
+        'as': field,
+    }}
+
+def iter_export_orders(query, archived=False):
+    """
+    Orders matching a native query, each with its items, read in
+    created_at order from one server-side cursor so memory stays bounded.
+    archived adds the matching orders from the archive collections.
+    """
+    pipeline = [{'$match': query}]
+    if archived:
+        pipeline.append({'$unionWith': {
+            'coll': archive_collection(Order).name, 'pipeline': [{'$match': query}],
+        }})
+    pipeline += [
+        {'$sort': dict(EXPORT_SORT)},
+        items_lookup(OrderItem._meta.db_table, 'items'),
+    ]
+    if archived:
+        pipeline += [
+            items_lookup(archive_collection(OrderItem).name, 'archived_items'),
+            {'$set': {'items': {'$concatArrays': ['$items', '$archived_items']}}},
+        ]
+    pipeline.append({'$project': dict({field: 1 for field in ORDER_EXPORT_FIELDS}, _id=0, items=1)})
+    return get_collection(Order).aggregate(
+        pipeline, allowDiskUse=True, batchSize=EXPORT_BATCH_SIZE
+    )
+
+def stream_ndjson(orders):
+    for order in orders:
+        yield json.dumps(order, default=export_value) + '\n'
+
+class Echo:
+    """
+    File-like object that hands back what csv.writer writes
+    """
+    def write(self, value):
+        return value
+
+def stream_csv(orders):
+    # One row per item, order columns repeated
+    writer = csv.writer(Echo())
+    yield writer.writerow(
+        [f'order_{field}' for field in ORDER_EXPORT_FIELDS] +
+        [f'item_{field}' for field in ITEM_EXPORT_FIELDS]
+    )
+    for order in orders:
+        order_row = [export_value(order.get(field)) for field in ORDER_EXPORT_FIELDS]
+        for item in order['items'] or [{}]:
+            yield writer.writerow(
+                order_row + [export_value(item.get(field)) for field in ITEM_EXPORT_FIELDS]
+            )
+
+# archive.py
+from pymongo import DeleteOne, ReplaceOne
+from .models import Order, OrderItem
+from .mongo import get_collection, get_db
+
+# Orders in these states no longer change and can leave the hot collections
+ARCHIVE_STATUSES = ('delivered', 'cancelled')
+
+def archive_collection(model):
+    """
+    Cold counterpart of a model's collection: orders_archive, order_items_archive
+    """
+    return get_db()[f'{model._meta.db_table}_archive']
+
+def archive_state():
+    """
+    {_id: 'orders', horizon, pending}: every archived order was last updated
+    before horizon; pending holds the ids of a batch being moved
+    """
+    return get_db()['archive_state']
+
+def archive_horizon():
+    state = archive_state().find_one({'_id': 'orders'}, {'horizon': 1})
+    return state.get('horizon') if state else None
+
+def archive_orders(cutoff, batch_size, max_batches=None):
+    """
+    Move terminal orders last updated before cutoff, with their items, to
+    the archive collections. Yields the number moved per batch. Each batch
+    is copied, checkpointed, then removed from the hot collections, so an
+    interrupted run is finished off by the next one.
+    """
+    orders = get_collection(Order)
+    finish_pending()
+    # Raised before anything moves so reads look in the archive from the first batch
+    archive_state().update_one({'_id': 'orders'}, {'$max': {'horizon': cutoff}}, upsert=True)
+    
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        docs = list(orders.find(
+            {'status': {'$in': list(ARCHIVE_STATUSES)}, 'updated_at': {'$lt': cutoff}},
+            limit=batch_size
+        ))
+        if not docs:
+            return
+        ids = [doc['id'] for doc in docs]
+        items = list(get_collection(OrderItem).find({'order_id': {'$in': ids}}))
+        
+        archive_collection(Order).bulk_write(
+            [ReplaceOne({'id': doc['id']}, doc, upsert=True) for doc in docs], ordered=False
+        )
+        if items:
+            archive_collection(OrderItem).bulk_write(
+                [ReplaceOne({'id': item['id']}, item, upsert=True) for item in items], ordered=False
+            )
+        archive_state().update_one({'_id': 'orders'}, {'$set': {'pending': ids}})
+        
+        # Only while unchanged since the copy; an order saved meanwhile stays hot
+        orders.bulk_write([
+            DeleteOne({'_id': doc['_id'], 'status': doc['status'], 'updated_at': doc['updated_at']})
+            for doc in docs
+        ], ordered=False)
+        yield finish_pending()
+        batches += 1
+
+def finish_pending():
+    """
+    Complete a checkpointed batch: drop the items of orders that left the
+    hot collection and the archive copies of orders that stayed
+    """
+    state = archive_state().find_one({'_id': 'orders'}, {'pending': 1})
+    ids = (state or {}).get('pending')
+    if not ids:
+        return 0
+    
+    still_hot = [doc['id'] for doc in get_collection(Order).find({'id': {'$in': ids}}, {'id': 1})]
+    moved = sorted(set(ids) - set(still_hot))
+    if moved:
+        get_collection(OrderItem).delete_many({'order_id': {'$in': moved}})
+    if still_hot:
+        archive_collection(Order).delete_many({'id': {'$in': still_hot}})
+        archive_collection(OrderItem).delete_many({'order_id': {'$in': still_hot}})
+    archive_state().update_one({'_id': 'orders'}, {'$unset': {'pending': ''}})
+    return len(moved)
+
+# apps.py
+from django.apps import AppConfig
+
+class AgriconnectConfig(AppConfig):
+    name = 'agriconnect'
+    
+    def ready(self):
+        from django.db import connections
+        from . import signals  # noqa: F401
+        from .mongo import instrument_orm_client
+        instrument_orm_client(connections['default'].settings_dict)
+
+# signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .analytics import SALES_STATUSES, record_order_sales
+from .authentication import user_cache
+from .cache import invalidate_catalog
+from .events import record_status_change
+from .models import User, Product, Order, OrderItem, Review
+from .mongo import get_collection, adjust_rating
+from .sync import record_deletion
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Covers profile edits, deactivation and password changes
+    user_cache.forget(instance.pk)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_catalog()
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # Tells delta sync clients to drop it
+    record_deletion(instance)
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    """
+    Apply a review's rating to its product's aggregates
+    """
+    saved = getattr(instance, '_saved_rating', None)
+    current = (instance.product_id, instance.rating)
+    if not created and saved == current:
+        return
+    
+    if created or saved is None:
+        adjust_rating(Product, instance.product_id, instance.rating, 1)
+    elif saved[0] == instance.product_id:
+        adjust_rating(Product, instance.product_id, instance.rating - saved[1], 0)
+    else:
+        adjust_rating(Product, saved[0], -saved[1], -1)
+        adjust_rating(Product, instance.product_id, instance.rating, 1)
+    
+    instance._saved_rating = current
+    invalidate_catalog()
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    product_id, rating = getattr(instance, '_saved_rating', (instance.product_id, instance.rating))
+    adjust_rating(Product, product_id, -rating, -1)
+    invalidate_catalog()
+
+@receiver(post_save, sender=Order)
+def order_status_changed(sender, instance, created, **kwargs):
+    """
+    Publish status changes to the order feed and move an order in or out of
+    the sales rollups when it is cancelled or revived
+    """
+    saved = getattr(instance, '_saved_status', None)
+    instance._saved_status = instance.status
+    
+    # New orders are recorded by OrderSerializer.create once their items exist
+    if created or saved is None or saved == instance.status:
+        return
+    
+    record_status_change(instance, saved)
+    was_sale = saved in SALES_STATUSES
+    is_sale = instance.status in SALES_STATUSES
+    if was_sale != is_sale:
+        record_order_sales(instance, 1 if is_sale else -1)
+
+@receiver(post_save, sender=OrderItem)
+def track_order_farmer(sender, instance, created, **kwargs):
+    """
+    Keep Order.farmer_ids in step with the farmers whose products it contains
+    """
+    order = instance.order
+    if not created:
+        order.refresh_farmer_ids()
+        return
+    
+    farmer_id = instance.product.farmer_id
+    farmer_ids = order.farmer_ids or []
+    if farmer_id not in farmer_ids:
+        # $addToSet so concurrent item inserts cannot drop each other's farmer
+        get_collection(Order).update_one(
+            {'id': order.pk}, {'$addToSet': {'farmer_ids': farmer_id}}
+        )
+        order.farmer_ids = [*farmer_ids, farmer_id]
+
+@receiver(post_delete, sender=OrderItem)
+def untrack_order_farmer(sender, instance, **kwargs):
+    try:
+        order = Order.objects.get(pk=instance.order_id)
+    except Order.DoesNotExist:
+        # The whole order is being deleted
+        return
+    order.refresh_farmer_ids()
+
+# serializers.py
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from operator import attrgetter
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from django.db import models, transaction
+from rest_framework import ISO_8601, serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
+from .models import User, Product, Order, OrderItem, Review
+from .analytics import SALES_STATUSES, record_order_sales
+from .cache import invalidate_products
+from .metrics import request_phase
+from .mongo import take_stock, return_stock
+
+class TimedListSerializer(serializers.ListSerializer):
+    """
+    Records how long turning a page of objects into primitives takes
+    """
+    @property
+    def data(self):
+        with request_phase('serialize'):
+            return super().data
+
+def _model_path(model, attrs):
+    """
+    True if attrs walks plain model fields and relations, so reading it
+    can never call a method the way DRF's get_attribute might
+    """
+    for attr in attrs:
+        if model is None:
+            return False
+        try:
+            model = model._meta.get_field(attr).related_model
+        except FieldDoesNotExist:
+            return False
+    return True
+
+def _drf_getter(field):
+    def get(instance):
+        value = field.get_attribute(instance)
+        if isinstance(value, PKOnlyObject) and value.pk is None:
+            return None
+        return value
+    return get
+
+def _identity(value):
+    return value
+
+def _datetime_output(field):
+    """
+    DateTimeField.to_representation with the timezone and format looked up
+    once per page instead of once per row; anything but an aware datetime
+    rendered as ISO 8601 goes back to DRF
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None or output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    
+    def output(value):
+        if not isinstance(value, datetime) or value.utcoffset() is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return output
+
+def compile_representation(serializer):
+    """
+    (name, getter, output, field) per readable field of serializer: the
+    getter reads the raw value from an instance (None means the instance
+    itself) and output turns a non-None value into primitives, mirroring
+    what Serializer.to_representation does field by field
+    """
+    model = serializer.Meta.model
+    plan = []
+    for field in serializer._readable_fields:
+        pk_only = (
+            isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None
+            and field.use_pk_only_optimization() and len(field.source_attrs) == 1
+            and _model_path(model, field.source_attrs)
+        )
+        if field.source == '*':
+            getter = None
+        elif pk_only:
+            # Same as DRF's PKOnlyObject path: the raw *_id, no join
+            getter = attrgetter(model._meta.get_field(field.source).attname)
+        elif _model_path(model, field.source_attrs):
+            getter = attrgetter('.'.join(field.source_attrs))
+        else:
+            getter = _drf_getter(field)
+        
+        if isinstance(field, serializers.SerializerMethodField):
+            output = getattr(field.parent, field.method_name)
+        elif isinstance(field, serializers.ListSerializer):
+            output = _nested_output(compile_representation(field.child))
+        elif pk_only or isinstance(field, serializers.ReadOnlyField):
+            output = _identity
+        elif isinstance(field, serializers.DateTimeField):
+            output = _datetime_output(field)
+        else:
+            output = field.to_representation
+        plan.append((field.field_name, getter, output, field))
+    return plan
+
+def _nested_output(plan):
+    def output(value):
+        iterable = value.all() if isinstance(value, models.manager.BaseManager) else value
+        return [represent(plan, item) for item in iterable]
+    return output
+
+def represent(plan, instance):
+    ret = {}
+    for name, getter, output, field in plan:
+        try:
+            value = instance if getter is None else getter(instance)
+        except SkipField:
+            continue
+        except (AttributeError, ObjectDoesNotExist):
+            # A null hop on a dotted source; DRF decides between None, the
+            # default and leaving the key out
+            try:
+                value = _drf_getter(field)(instance)
+            except SkipField:
+                continue
+        ret[name] = None if value is None else output(value)
+    return ret
+
+class FastListSerializer(TimedListSerializer):
+    """
+    Read path for list responses. The child's fields are compiled once per
+    page, so each row is a few attribute reads instead of DRF's per-field
+    get_attribute/to_representation dispatch. Output is the same primitives
+    the child serializer would produce, key order included.
+    """
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        plan = compile_representation(self.child)
+        return [represent(plan, item) for item in iterable]
+
+@lru_cache(maxsize=None)
+def field_names(serializer_class):
+    return tuple(serializer_class().fields)
+
+def sparse_fields(request, serializer_class):
+    """
+    Names of serializer_class's fields a read keeps under ?fields= and
+    ?omit= (comma separated; id always stays), or None for all of them
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = request.query_params
+    keep = {name.strip() for name in params.get('fields', '').split(',') if name.strip()}
+    omit = {name.strip() for name in params.get('omit', '').split(',') if name.strip()}
+    if not keep and not omit:
+        return None
+    return frozenset(
+        name for name in field_names(serializer_class)
+        if name == 'id' or ((not keep or name in keep) and name not in omit)
+    )
+
+class SparseFieldsMixin:
+    """
+    Drops the fields ?fields= / ?omit= leave out of a read, for list
+    screens that show a few of them. Views narrow what they load from
+    MongoDB to match (repository.serialized_fields).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = sparse_fields(self.context.get('request'), type(self))
+        if selected is not None:
+            for name in set(self.fields) - selected:
+                self.fields.pop(name)
+
+class GeoPointField(serializers.Field):
+    """
+    GeoJSON point stored on the model, exposed as {latitude, longitude}
+    """
+    def to_representation(self, value):
+        longitude, latitude = value['coordinates']
+        return {'latitude': latitude, 'longitude': longitude}
+    
+    def to_internal_value(self, data):
+        try:
+            latitude = float(data['latitude'])
+            longitude = float(data['longitude'])
+        except (TypeError, KeyError, ValueError):
+            raise serializers.ValidationError('Expected {"latitude": ..., "longitude": ...}')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise serializers.ValidationError('Coordinates out of range')
+        return {'type': 'Point', 'coordinates': [longitude, latitude]}
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    coordinates = GeoPointField(source='geo_point', required=False, allow_null=True)
+    
+    class Meta:
+        model = User
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 
+                  'user_type', 'phone_number', 'address', 'profile_image',
+                  'coordinates']
+        read_only_fields = ['id']
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    farmer_name = serializers.SerializerMethodField()
+    coordinates = GeoPointField(source='geo_point', required=False, allow_null=True)
+    distance_km = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Product
+        list_serializer_class = FastListSerializer
+        fields = ['id', 'title', 'description', 'price', 'image_url', 
+                  'category', 'farmer', 'farmer_name', 'location', 
+                  'coordinates', 'distance_km', 'harvest_date', 'is_organic',
+                  'quantity', 'sku', 'rating_avg', 'rating_count', 'created_at']
+        read_only_fields = ['id', 'farmer', 'farmer_name', 'distance_km',
+                            'rating_avg', 'rating_count', 'created_at']
+    
+    def get_farmer_name(self, obj):
+        return f"{obj.farmer.first_name} {obj.farmer.last_name}"
+    
+    def get_distance_km(self, obj):
+        # Only set when the list was filtered with ?near=
+        distances = getattr(self.context.get('view'), 'distances', None)
+        if not distances or obj.pk not in distances:
+            return None
+        return round(distances[obj.pk] / 1000, 2)
+    
+    def validate_sku(self, value):
+        # (farmer, sku) is unique in MongoDB, so a clash would otherwise
+        # surface as a duplicate key error. Blank SKUs are stored as null,
+        # which the index leaves out.
+        if not value:
+            return None
+        farmer_id = self.instance.farmer_id if self.instance else self.context['request'].user.pk
+        duplicates = Product.objects.filter(farmer_id=farmer_id, sku=value)
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError('You already have a product with this SKU')
+        return value
+    
+    def create(self, validated_data):
+        validated_data['farmer'] = self.context['request'].user
+        return super().create(validated_data)
+    
+    def update(self, instance, validated_data):
+        # Write only the fields sent. A full-row save would put back the
+        # rating aggregates and stock this instance read before reviews and
+        # orders moved them.
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
+
+class ReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    user_name = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Review
+        list_serializer_class = FastListSerializer
+        fields = ['id', 'product', 'user', 'user_name', 'rating', 'comment', 'created_at']
+        read_only_fields = ['id', 'user', 'user_name', 'created_at']
+    
+    def get_user_name(self, obj):
+        return f"{obj.user.first_name} {obj.user.last_name}"
+    
+    def create(self, validated_data):
+        validated_data['user'] = self.context['request'].user
+        return super().create(validated_data)
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    product_title = serializers.ReadOnlyField(source='product.title')
+    
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product', 'product_title', 'quantity', 'price']
+        read_only_fields = ['id']
+
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True)
+    buyer_name = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Order
+        list_serializer_class = FastListSerializer
+        fields = ['id', 'buyer', 'buyer_name', 'items', 'total_amount', 
+                  'shipping_address', 'phone_number', 'status', 'created_at']
+        read_only_fields = ['id', 'buyer', 'buyer_name', 'created_at']
+    
+    def get_buyer_name(self, obj):
+        return f"{obj.buyer.first_name} {obj.buyer.last_name}"
+    
+    def create(self, validated_data):
+        items_data = validated_data.pop('items')
+        validated_data['buyer'] = self.context['request'].user
+        validated_data['farmer_ids'] = sorted({
+            item_data['product'].farmer_id for item_data in items_data
+        })
+        
+        # Reserve stock first so concurrent buyers can never oversell a product
+        quantities = Counter()
+        for item_data in items_data:
+            quantities[item_data['product'].pk] += item_data['quantity']
+        
+        short_pk = take_stock(Product, quantities)
+        # Stock is written around the ORM, so product signals do not fire
+        invalidate_products(quantities)
+        if short_pk is not None:
+            product = next(d['product'] for d in items_data if d['product'].pk == short_pk)
+            raise serializers.ValidationError(
+                {'items': [f"Insufficient stock for {product.title}"]}
+            )
+        
+        order = None
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(**validated_data)
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, **item_data) for item_data in items_data
+                ])
+        except Exception:
+            return_stock(Product, quantities)
+            invalidate_products(quantities)
+            # atomic() rolls nothing back on a standalone MongoDB server
+            if order is not None and order.pk is not None:
+                Order.objects.filter(pk=order.pk).delete()
+            raise
+        
+        if order.status in SALES_STATUSES:
+            record_order_sales(order, 1)
+        
+        return order
+
+# pagination.py
+import base64
+import json
+import operator
+from collections import OrderedDict
+from functools import reduce
+from django.db.models import Q
+from pymongo import ASCENDING, DESCENDING
+from rest_framework import filters
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .mongo import to_bson
+
+RELEVANCE = 'relevance'
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on every ordering field plus the primary key,
+    e.g. (created_at, id). Each page is a range query on those fields rather
+    than a skip, so deep pages cost the same as the first one on MongoDB.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+    
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+    
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        explicit = False
+        
+        # Follow the view's OrderingFilter (e.g. ?ordering=price on products)
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, filters.OrderingFilter):
+                explicit = bool(request.query_params.get(backend.ordering_param))
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        
+        # Text search hits are ranked by relevance unless the client picked an ordering
+        if self.ranking is not None and not explicit:
+            return [RELEVANCE]
+        
+        # Views without an OrderingFilter can still set their own (e.g. models
+        # without created_at)
+        ordering = list(ordering or getattr(view, 'ordering', None) or self.ordering)
+        
+        # End on the primary key so every position in the ordering is unique
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        
+        return ordering
+    
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            position, reverse = cursor['p'], bool(cursor['r'])
+            ordering = cursor['o']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        
+        # A cursor only makes sense for the ordering it was issued under
+        if ordering != self.keyset_ordering or len(position) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        
+        return position, reverse
+    
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps(
+            {'o': self.keyset_ordering, 'p': position, 'r': int(reverse)},
+            default=str
+        )
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+    
+    def get_position(self, instance):
+        if self.keyset_ordering == [RELEVANCE]:
+            return [self.ranking[instance.pk]]
+        return [getattr(instance, field.lstrip('-')) for field in self.keyset_ordering]
+    
+    def position_filter(self, position, reverse):
+        # (a, b) after (x, y)  ==  a > x  OR  (a == x AND b > y)
+        clauses = []
+        equal = {}
+        for field, value in zip(self.keyset_ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            clauses.append(Q(**equal, **{f'{name}__{lookup}': value}))
+            equal[name] = value
+        return reduce(operator.or_, clauses)
+    
+    def document_filter(self, model, position, reverse):
+        # position_filter as a MongoDB query. Cursor values went through JSON,
+        # so the model field parses them back before they are compared.
+        clauses = []
+        equal = {}
+        for field, value in zip(self.keyset_ordering, position):
+            name = field.lstrip('-')
+            value = to_bson(model._meta.get_field(name).to_python(value))
+            descending = field.startswith('-') != reverse
+            clauses.append({**equal, name: {'$lt' if descending else '$gt': value}})
+            equal[name] = value
+        return {'$or': clauses}
+    
+    def walk_ordering(self, reverse):
+        # Walking backwards is the same range query with the ordering flipped
+        if not reverse:
+            return self.keyset_ordering
+        return [f[1:] if f.startswith('-') else f'-{f}' for f in self.keyset_ordering]
+    
+    def document_sort(self, reverse):
+        return [
+            (f.lstrip('-'), DESCENDING if f.startswith('-') else ASCENDING)
+            for f in self.walk_ordering(reverse)
+        ]
+    
+    def ranked_results(self, queryset, position, reverse):
+        # Search hits are capped by the text search filter, so rank them in memory
+        results = sorted(queryset, key=lambda obj: self.ranking[obj.pk], reverse=reverse)
+        if position is not None:
+            if reverse:
+                results = [obj for obj in results if self.ranking[obj.pk] < position[0]]
+            else:
+                results = [obj for obj in results if self.ranking[obj.pk] > position[0]]
+        return results[:self.page_size + 1]
+    
+    def begin(self, request, queryset, view):
+        """
+        Read the page size, ordering and cursor; returns (position, reverse).
+        Raw query paths call this and end() around their own fetch of
+        page_size + 1 rows sorted by document_sort().
+        """
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ranking = getattr(view, 'search_ranking', None)
+        self.truncated = getattr(view, 'search_truncated', False)
+        self.keyset_ordering = self.get_ordering(request, queryset, view)
+        return self.decode_cursor(request)
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        position, reverse = self.begin(request, queryset, view)
+        
+        if self.keyset_ordering == [RELEVANCE]:
+            results = self.ranked_results(queryset, position, reverse)
+        else:
+            queryset = queryset.order_by(*self.walk_ordering(reverse))
+            if position is not None:
+                queryset = queryset.filter(self.position_filter(position, reverse))
+            results = list(queryset[:self.page_size + 1])
+        
+        return self.end(results, position, reverse)
+    
+    def end(self, results, position, reverse):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        
+        # An empty page past either end can still link back to where it started
+        if self.page:
+            self.next_position = self.get_position(self.page[-1])
+            self.previous_position = self.get_position(self.page[0])
+        else:
+            self.next_position = self.previous_position = position
+        
+        return self.page
+    
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+    
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+    
+    def get_paginated_response(self, data):
+        page = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+        if self.truncated:
+            # Only the best-ranked search hits are paged through
+            page['truncated'] = True
+        return Response(page)
+
+# filters.py
+import re
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from .mongo import nearby_ids, text_search_ids
+
+def narrow(query, condition):
+    return {'$and': [query, condition]} if query else condition
+
+def view_filter(view):
+    # The view's own filters as a MongoDB query, so they apply before a result cap
+    filter_document = getattr(view, 'filter_document', None)
+    return filter_document() if filter_document else {}
+
+class MongoTextSearchFilter(filters.SearchFilter):
+    """
+    Routes ?search= through the collection's MongoDB text index instead of
+    regex scans, leaving the hits ranked by textScore on view.search_ranking.
+    Terms too short for the text index fall back to a title prefix match.
+    The view's filter_document() goes into the text query, so the cap on
+    hits counts only products the list would show; view.search_truncated
+    says when the cap was reached.
+    """
+    min_text_length = 3
+    max_text_results = 500
+    
+    def filter_queryset(self, request, queryset, view):
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+        
+        if len(terms) < self.min_text_length:
+            view.search_condition = self.prefix_condition(terms)
+            return queryset.filter(title__istartswith=terms)
+        
+        ranked_ids = text_search_ids(queryset.model, terms, self.max_text_results,
+                                     view_filter(view))
+        view.search_ranking = {pk: rank for rank, pk in enumerate(ranked_ids)}
+        view.search_truncated = len(ranked_ids) >= self.max_text_results
+        view.search_condition = {'id': {'$in': ranked_ids}}
+        return queryset.filter(id__in=ranked_ids)
+    
+    def prefix_condition(self, terms):
+        return {'title': {'$regex': '^' + re.escape(terms), '$options': 'i'}}
+    
+    def filter_query(self, request, query, model):
+        """
+        The same search applied to a native MongoDB query, for aggregations
+        """
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms:
+            return query
+        
+        if len(terms) < self.min_text_length:
+            return narrow(query, self.prefix_condition(terms))
+        
+        ranked_ids = text_search_ids(model, terms, self.max_text_results, query)
+        return narrow(query, {'id': {'$in': ranked_ids}})
+
+class GeoNearFilter(filters.BaseFilterBackend):
+    """
+    ?near=lat,lng&radius_km= keeps documents within the radius using the
+    2dsphere index and ranks them nearest first on view.search_ranking, with
+    distances on view.distances. Runs after text search, so a search term
+    narrows the matches and distance decides the order. The view's filters
+    and the search's matches go into $geoNear's query, so the cap on
+    results counts only products the list would show.
+    """
+    default_radius_km = 25
+    max_radius_km = 500
+    max_results = 500
+    
+    def filter_queryset(self, request, queryset, view):
+        query = view_filter(view)
+        search_condition = getattr(view, 'search_condition', None)
+        if search_condition:
+            query = narrow(query, search_condition)
+        hits = self.nearby(request, queryset.model, query)
+        if hits is None:
+            return queryset
+        
+        view.search_ranking = {pk: rank for rank, (pk, _) in enumerate(hits)}
+        view.search_truncated = getattr(view, 'search_truncated', False) or len(hits) >= self.max_results
+        view.distances = dict(hits)
+        return queryset.filter(id__in=list(view.distances))
+    
+    def filter_query(self, request, query, model):
+        hits = self.nearby(request, model, query)
+        if hits is None:
+            return query
+        return narrow(query, {'id': {'$in': [pk for pk, _ in hits]}})
+    
+    def nearby(self, request, model, query=None):
+        """
+        (pk, distance in meters) within the requested radius among documents
+        matching query, or None without ?near=
+        """
+        near = request.query_params.get('near')
+        if not near:
+            return None
+        
+        try:
+            latitude, longitude = (float(value) for value in near.split(','))
+            radius_km = float(request.query_params.get('radius_km', self.default_radius_km))
+        except ValueError:
+            raise ValidationError({'near': ['Expected near=lat,lng and a numeric radius_km']})
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or radius_km <= 0:
+            raise ValidationError({'near': ['Coordinates or radius out of range']})
+        
+        return nearby_ids(
+            model, longitude, latitude,
+            min(radius_km, self.max_radius_km) * 1000, self.max_results, query
+        )
+
+# repository.py
+from collections import defaultdict
+from decimal import Decimal
+from functools import lru_cache
+from operator import attrgetter
+from bson.decimal128 import Decimal128
+from .archive import archive_collection
+from .models import Product, Order, OrderItem, Review
+from .mongo import from_document, get_collection, to_bson
+
+# Hot reads straight from MongoDB with pymongo, for settings.DIRECT_MONGO_READS:
+# no SQL generation and re-parsing by djongo, only the fields the serializer
+# shows, and filters and sorts the indexes in indexes.py serve. Results are
+# model instances with their relations loaded, so serializers, pagination
+# and permissions work on them unchanged.
+
+# Query parameters only the ORM path handles (the filter backends), and the
+# ones ProductViewSet.get_queryset applies, which also scope detail lookups
+ORM_ONLY_PARAMS = ('search', 'near')
+PRODUCT_FILTER_PARAMS = ('category', 'farmer', 'is_organic', 'min_price', 'max_price')
+
+NAME_FIELDS = ('first_name', 'last_name')
+
+# Product fields /products/facets/ counts by
+FACET_FIELDS = ('category', 'is_organic', 'price')
+
+# Fields the models' from_db() reads, which must never be deferred
+FROM_DB_FIELDS = {
+    Order: ('status',),
+    Review: ('product', 'rating'),
+}
+
+# Relations the serializers' method fields read, and the fields they read
+# from them
+METHOD_FIELD_RELATIONS = {
+    'farmer_name': ('farmer', NAME_FIELDS),
+    'user_name': ('user', NAME_FIELDS),
+    'buyer_name': ('buyer', NAME_FIELDS),
+}
+
+@lru_cache(maxsize=None)
+def serialized_fields(serializer_class, names=None):
+    """
+    Model field names serializer_class reads, for projections; names (from
+    serializers.sparse_fields) limits it to those serializer fields
+    """
+    model = serializer_class.Meta.model
+    model_fields = {field.name for field in model._meta.concrete_fields}
+    fields = {model._meta.pk.name, *FROM_DB_FIELDS.get(model, ())}
+    for name, field in serializer_class().fields.items():
+        if names is not None and name not in names:
+            continue
+        if name in METHOD_FIELD_RELATIONS:
+            fields.add(METHOD_FIELD_RELATIONS[name][0])
+        elif field.source_attrs and field.source_attrs[0] in model_fields:
+            fields.add(field.source_attrs[0])
+    return tuple(sorted(fields))
+
+def shown(names, name):
+    # Whether a sparse fieldset (None: all fields) includes name
+    return names is None or name in names
+
+def projection(field_names, model):
+    fields = [model._meta.get_field(name) for name in field_names]
+    return {'_id': 0, **{field.attname: 1 for field in fields}}
+
+def product_filter(params):
+    # ProductViewSet.get_queryset's filters as a MongoDB query
+    query = {}
+    category = params.get('category')
+    if category and category.lower() != 'all':
+        query['category'] = category.lower()
+    farmer_id = params.get('farmer')
+    if farmer_id:
+        query['farmer_id'] = int(farmer_id)
+    is_organic = params.get('is_organic')
+    if is_organic:
+        query['is_organic'] = is_organic.lower() == 'true'
+    price = {}
+    if params.get('min_price'):
+        price['$gte'] = to_bson(Decimal(params['min_price']))
+    if params.get('max_price'):
+        price['$lte'] = to_bson(Decimal(params['max_price']))
+    if price:
+        query['price'] = price
+    return query
+
+def set_prefetched(instance, name, objects):
+    # What prefetch_related leaves behind, so instance.<name>.all() runs no query
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    instance._prefetched_objects_cache = {name: queryset}
+
+def attach_items(orders, items):
+    items_by_order = defaultdict(list)
+    for item in items:
+        items_by_order[item.order_id].append(item)
+    for order in orders:
+        set_prefetched(order, 'items', items_by_order[order.pk])
+
+def find(model, query, sort=None, limit=0, field_names=None, collection=None):
+    kwargs = {'projection': projection(field_names, model)} if field_names else {}
+    if collection is None:
+        collection = get_collection(model)
+    cursor = collection.find(query, limit=limit, **kwargs)
+    if sort:
+        cursor = cursor.sort(sort)
+    return [from_document(model, doc, field_names) for doc in cursor]
+
+def load_related(instances, name, field_names):
+    """
+    select_related for name over instances with one $in query, loading only
+    field_names of the related rows
+    """
+    if not instances:
+        return
+    field = type(instances[0])._meta.get_field(name)
+    ids = list({getattr(obj, field.attname) for obj in instances} - {None})
+    related = find(field.related_model, {'id': {'$in': ids}},
+                   field_names=('id',) + tuple(field_names))
+    by_id = {obj.pk: obj for obj in related}
+    for obj in instances:
+        if getattr(obj, field.attname) in by_id:
+            setattr(obj, name, by_id[getattr(obj, field.attname)])
+
+def merge_ordered(instances, ordering):
+    """
+    Rows from several collections in one ordering, each pk once (the first
+    seen wins: archive_orders copies an order before removing it)
+    """
+    seen = set()
+    merged = []
+    for obj in instances:
+        if obj.pk not in seen:
+            seen.add(obj.pk)
+            merged.append(obj)
+    for field in reversed(ordering):
+        merged.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+    return merged
+
+def keyset_page(paginator, request, view, model, query, field_names=None, archived=False):
+    """
+    KeysetPagination.paginate_queryset for a raw query, over the model's
+    archive collection as well when archived
+    """
+    position, reverse = paginator.begin(request, None, view)
+    if position is not None:
+        query = {'$and': [query, paginator.document_filter(model, position, reverse)]}
+    if field_names:
+        # get_position reads the ordering fields off each row
+        field_names = tuple(set(field_names) | {f.lstrip('-') for f in paginator.keyset_ordering})
+    results = find(model, query, sort=paginator.document_sort(reverse),
+                   limit=paginator.page_size + 1, field_names=field_names)
+    if archived:
+        results = merge_ordered(
+            results + find(model, query, sort=paginator.document_sort(reverse),
+                           limit=paginator.page_size + 1, field_names=field_names,
+                           collection=archive_collection(model)),
+            paginator.walk_ordering(reverse)
+        )[:paginator.page_size + 1]
+    return paginator.end(results, position, reverse)
+
+def product_page(paginator, request, view, serializer_class, names=None):
+    products = keyset_page(paginator, request, view, Product,
+                           product_filter(request.query_params),
+                           serialized_fields(serializer_class, names))
+    if shown(names, 'farmer_name'):
+        load_related(products, 'farmer', NAME_FIELDS)
+    return products
+
+def get_product(pk, serializer_class, names=None):
+    products = find(Product, {'id': pk}, limit=1,
+                    field_names=serialized_fields(serializer_class, names))
+    if shown(names, 'farmer_name'):
+        load_related(products, 'farmer', NAME_FIELDS)
+    return products[0] if products else None
+
+def product_reviews(product_id, serializer_class, names=None):
+    reviews = find(Review, {'product_id': product_id},
+                   field_names=serialized_fields(serializer_class, names))
+    if shown(names, 'user_name'):
+        load_related(reviews, 'user', NAME_FIELDS)
+    return reviews
+
+def product_facets(query, selected, price_bounds):
+    """
+    Product counts per category, organic flag and price range in one $facet
+    aggregation. query narrows every facet; selected ({field: condition}
+    for FACET_FIELDS, from product_filter) narrows every facet but its own,
+    so each count is what choosing that value would list.
+    """
+    def match(skip=None):
+        return {'$match': {field: cond for field, cond in selected.items() if field != skip}}
+    
+    def count_by(field):
+        return [match(field), {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}}]
+    
+    bounds = [Decimal(str(bound)) for bound in price_bounds]
+    result = next(get_collection(Product).aggregate([
+        {'$match': query},
+        {'$project': {'_id': 0, **{field: 1 for field in FACET_FIELDS}}},
+        {'$facet': {
+            'total': [match(), {'$count': 'count'}],
+            'category': count_by('category'),
+            'is_organic': count_by('is_organic'),
+            'price': [match('price'), {'$bucket': {
+                'groupBy': '$price',
+                'boundaries': [to_bson(bound) for bound in bounds],
+                'default': 'above',
+                'output': {'count': {'$sum': 1}},
+            }}],
+        }},
+    ]))
+    
+    def counts(rows):
+        return {
+            row['_id'].to_decimal() if isinstance(row['_id'], Decimal128) else row['_id']: row['count']
+            for row in rows
+        }
+    
+    categories = counts(result['category'])
+    organic = counts(result['is_organic'])
+    prices = counts(result['price'])
+    # $bucket keys each range by its lower bound; the last one is open-ended
+    prices[bounds[-1]] = prices.pop('above', 0)
+    return {
+        'total': result['total'][0]['count'] if result['total'] else 0,
+        'category': [
+            {'value': value, 'count': categories.get(value, 0)}
+            for value, _ in Product.CATEGORY_CHOICES
+        ],
+        'is_organic': [{'value': value, 'count': organic.get(value, 0)} for value in (True, False)],
+        'price': [
+            {'min': f'{low:.2f}', 'max': f'{high:.2f}' if high is not None else None,
+             'count': prices.get(low, 0)}
+            for low, high in zip(bounds, bounds[1:] + [None])
+        ],
+    }
+
+def find_items(orders, archived=False):
+    query = {'order_id': {'$in': [order.pk for order in orders]}}
+    items = find(OrderItem, query)
+    if archived:
+        items = merge_ordered(items + find(OrderItem, query, collection=archive_collection(OrderItem)),
+                              ['id'])
+    load_related(items, 'product', ('title',))
+    return items
+
+def order_relations(orders, names, archived):
+    if shown(names, 'buyer_name'):
+        load_related(orders, 'buyer', NAME_FIELDS)
+    if shown(names, 'items'):
+        attach_items(orders, find_items(orders, archived))
+
+def order_page(paginator, request, view, query, serializer_class, archived=False, names=None):
+    orders = keyset_page(paginator, request, view, Order, query,
+                         serialized_fields(serializer_class, names), archived=archived)
+    order_relations(orders, names, archived)
+    return orders
+
+def archived_order(query, serializer_class, names=None):
+    orders = find(Order, query, limit=1, field_names=serialized_fields(serializer_class, names),
+                  collection=archive_collection(Order))
+    order_relations(orders, names, archived=True)
+    return orders[0] if orders else None
+
+# sync.py
+import base64
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from pymongo import ASCENDING as ASC
+from .models import Product
+from .mongo import current_time, get_db
+from .repository import NAME_FIELDS, find, load_related, serialized_fields, shown
+
+# Delta sync for client-side catalog caches (/products/changes/): products
+# written since a cursor, read in (updated_at, id) order, merged with
+# tombstones of the products deleted since, in (deleted_at, product_id)
+# order. A cursor holds the position of the last change served and when
+# the client's copy was started, which is what tombstone expiry is checked
+# against: a first sync walks products last written long ago.
+
+DEFAULT_SYNC_SETTINGS = {
+    'PAGE_SIZE': 200,
+    'MAX_PAGE_SIZE': 1000,
+    'TOMBSTONE_DAYS': 30,
+    # Changes are served once they are this old, so a write still in flight
+    # with an earlier updated_at cannot land behind a cursor
+    'SETTLE_SECONDS': 5,
+}
+
+class SyncReset(Exception):
+    """
+    The client's copy is older than the tombstones still kept; it has to
+    drop it and sync again from scratch
+    """
+
+def sync_settings():
+    options = dict(DEFAULT_SYNC_SETTINGS)
+    options.update(getattr(settings, 'CATALOG_SYNC', {}))
+    return options
+
+def product_tombstones():
+    """
+    One document per deleted product, expiring after TOMBSTONE_DAYS:
+    {product_id, deleted_at, expires_at}
+    """
+    return get_db()['product_tombstones']
+
+def as_stored(moment):
+    # MongoDB hands datetimes back naive (UTC when they were aware)
+    if moment.tzinfo is not None:
+        return moment.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return moment
+
+def record_deletion(product):
+    now = current_time()
+    product_tombstones().insert_one({
+        'product_id': product.pk,
+        'deleted_at': now,
+        'expires_at': as_stored(now) + timedelta(days=sync_settings()['TOMBSTONE_DAYS']),
+    })
+
+def encode_cursor(position, started):
+    moment, pk = position
+    data = {'t': moment.isoformat(), 'id': pk, 'since': started.isoformat()}
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+
+def decode_cursor(value):
+    """
+    ((updated_at, id), started) from a cursor; ValueError if it is not one
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(value.encode()))
+        position = (as_stored(datetime.fromisoformat(data['t'])), int(data['id']))
+        return position, as_stored(datetime.fromisoformat(data['since']))
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def after(position, time_field, id_field, bound):
+    query = {time_field: {'$lt': bound}}
+    if position is not None:
+        moment, pk = position
+        query['$or'] = [
+            {time_field: {'$gt': moment}},
+            {time_field: moment, id_field: {'$gt': pk}},
+        ]
+    return query
+
+def catalog_changes(position, started, limit, serializer_class, names=None):
+    """
+    Up to limit changes after position (None for the whole catalog), oldest
+    first, for a copy started at started: (products written, ids of products
+    deleted, next position, its started, whether more changes are ready).
+    Raises SyncReset for copies older than the tombstones kept.
+    """
+    options = sync_settings()
+    bound = as_stored(current_time()) - timedelta(seconds=options['SETTLE_SECONDS'])
+    if position is None:
+        started = bound
+    elif started < bound - timedelta(days=options['TOMBSTONE_DAYS']):
+        raise SyncReset()
+    
+    field_names = tuple(sorted({*serialized_fields(serializer_class, names), 'updated_at'}))
+    products = find(
+        Product, after(position, 'updated_at', 'id', bound),
+        sort=[('updated_at', ASC), ('id', ASC)], limit=limit + 1, field_names=field_names
+    )
+    tombstones = product_tombstones().find(
+        after(position, 'deleted_at', 'product_id', bound),
+        {'_id': 0, 'product_id': 1, 'deleted_at': 1},
+        sort=[('deleted_at', ASC), ('product_id', ASC)], limit=limit + 1
+    )
+    
+    changes = [((as_stored(product.updated_at), product.pk), product) for product in products]
+    changes += [((tombstone['deleted_at'], tombstone['product_id']), None) for tombstone in tombstones]
+    changes.sort(key=lambda change: change[0])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    
+    if has_more:
+        position = changes[-1][0]
+    else:
+        # Everything before bound has been served, so the copy is current
+        # as of bound and later calls start there
+        position = max(position or (bound, 0), (bound, 0))
+        started = max(started, bound)
+    changed = [product for _, product in changes if product is not None]
+    deleted = [pk for (_, pk), product in changes if product is None]
+    if shown(names, 'farmer_name'):
+        load_related(changed, 'farmer', NAME_FIELDS)
+    return changed, deleted, position, started, has_more
+
+# views.py
+from datetime import datetime, time, timedelta
+from decimal import InvalidOperation
+from rest_framework import viewsets, permissions, status, filters
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from django.conf import settings
+from django.db.models import Q, Prefetch
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import repository
+from .models import User, Product, Order, OrderItem, Review
+from .analytics import farmer_sales
+from .archive import archive_horizon
+from .authentication import user_cache
+from .cache import FACET_CACHE_PARAMS, CatalogCacheMixin
+from .events import FeedReset, event_feed, event_stream, feed_settings, long_poll, parse_token
+from .exports import iter_export_orders, stream_csv, stream_ndjson
+from .inventory import iter_inventory_rows, import_inventory
+from .filters import GeoNearFilter, MongoTextSearchFilter
+from .metrics import render_metrics
+from .mongo import matching_ids, pool_stats
+from .serializers import (
+    UserSerializer, ProductSerializer, OrderSerializer, ReviewSerializer,
+    field_names, sparse_fields
+)
+from .sync import SyncReset, catalog_changes, decode_cursor, encode_cursor, sync_settings
+
+# Serializers read farmer/user/buyer names and item product titles, so load
+# those relations up front instead of one query per row.
+ORDER_ITEMS_PREFETCH = Prefetch(
+    'items', queryset=OrderItem.objects.select_related('product')
+)
+
+def orm_range(name, condition):
+    # A MongoDB range ({'$gte': a, '$lt': b}) as ORM lookups on name
+    return {f'{name}__{operator[1:]}': value for operator, value in condition.items()}
+
+class IsOwnerOrReadOnly(permissions.BasePermission):
+    """
+    Custom permission to only allow owners of an object to edit it.
+    """
+    def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        
+        # Check if the object has a farmer attribute (Product)
+        if hasattr(obj, 'farmer'):
+            return obj.farmer == request.user
+        
+        # Check if the object has a buyer attribute (Order)
+        if hasattr(obj, 'buyer'):
+            return obj.buyer == request.user
+        
+        # Check if the object has a user attribute (Review)
+        if hasattr(obj, 'user'):
+            return obj.user == request.user
+        
+        return obj == request.user
+
+class IsFarmer(permissions.BasePermission):
+    """
+    Only allow users registered as farmers.
+    """
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.user_type == 'farmer'
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets clients negotiate text/event-stream (or ?format=sse); the view
+    streams the events itself, so this only renders error bodies
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+class ProjectionMixin:
+    """
+    ?fields= and ?omit= on reads: the serializer leaves out the fields not
+    asked for and querysets neither load them nor join the relations only
+    they read
+    """
+    def sparse_fields(self, serializer_class=None):
+        return sparse_fields(self.request, serializer_class or self.get_serializer_class())
+    
+    def project(self, queryset, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        names = self.sparse_fields(serializer_class)
+        relations = [
+            repository.METHOD_FIELD_RELATIONS[name] for name in field_names(serializer_class)
+            if name in repository.METHOD_FIELD_RELATIONS and repository.shown(names, name)
+        ]
+        if relations:
+            queryset = queryset.select_related(*(relation for relation, _ in relations))
+        if names is None:
+            return queryset
+        
+        fields = set(repository.serialized_fields(serializer_class, names))
+        for relation, related_fields in relations:
+            fields.update(f'{relation}__{name}' for name in related_fields)
+        # Pagination reads the fields it orders by off the rows
+        model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        ordering = (
+            *getattr(self, 'ordering_fields', ()), *(getattr(self, 'ordering', None) or ()),
+            *getattr(self.paginator, 'ordering', ()),
+        )
+        fields.update(name for name in (field.lstrip('-') for field in ordering) if name in model_fields)
+        return queryset.only(*fields)
+
+class UserViewSet(ProjectionMixin, viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = UserSerializer
+    permission_classes = [IsOwnerOrReadOnly]
+    # Users have date_joined, not the paginator's default created_at
+    ordering = ['-date_joined']
+    
+    def get_queryset(self):
+        return self.project(User.objects.all())
+    
+    @action(detail=False, methods=['get'])
+    def farmers(self, request):
+        farmers = self.project(User.objects.filter(user_type='farmer'))
+        serializer = self.get_serializer(farmers, many=True)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def me(self, request):
+        serializer = self.get_serializer(request.user)
+        return Response(serializer.data)
+
+class ProductViewSet(CatalogCacheMixin, ProjectionMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.select_related('farmer')
+    serializer_class = ProductSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+    filter_backends = [MongoTextSearchFilter, GeoNearFilter, filters.OrderingFilter]
+    ordering_fields = ['price', 'created_at', 'harvest_date', 'rating_avg', 'rating_count']
+    ordering = ['-created_at']
+    
+    def get_queryset(self):
+        queryset = self.project(Product.objects.all())
+        
+        # Filter by category
+        category = self.request.query_params.get('category')
+        # Categories are stored lowercase; an exact match can use the index
+        # where iexact becomes a case-insensitive regex scan
+        if category and category.lower() != 'all':
+            queryset = queryset.filter(category=category.lower())
+        
+        # Filter by farmer
+        farmer_id = self.request.query_params.get('farmer')
+        if farmer_id:
+            queryset = queryset.filter(farmer_id=farmer_id)
+        
+        # Filter by is_organic
+        is_organic = self.request.query_params.get('is_organic')
+        if is_organic:
+            is_organic_bool = is_organic.lower() == 'true'
+            queryset = queryset.filter(is_organic=is_organic_bool)
+        
+        # Filter by price range
+        min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
         if min_price:
             queryset = queryset.filter(price__gte=min_price)
         if max_price:
             queryset = queryset.filter(price__lte=max_price)
         
-        return queryset
+        return queryset
+    
+    def filter_document(self):
+        """
+        get_queryset's filters as a MongoDB query, for the search backends
+        to apply before capping their hits
+        """
+        try:
+            return repository.product_filter(self.request.query_params)
+        except (ValueError, InvalidOperation):
+            raise ValidationError({'error': 'Invalid filter'})
+    
+    def direct_reads(self, orm_only_params=repository.ORM_ONLY_PARAMS):
+        # pymongo reads when enabled, unless the request needs the ORM path
+        return settings.DIRECT_MONGO_READS and not any(
+            self.request.query_params.get(name) for name in orm_only_params
+        )
+    
+    def paginate_queryset(self, queryset):
+        if self.action == 'list' and self.direct_reads():
+            return repository.product_page(
+                self.paginator, self.request, self, self.get_serializer_class(),
+                self.sparse_fields()
+            )
+        return super().paginate_queryset(queryset)
+    
+    def get_object(self):
+        orm_only = repository.ORM_ONLY_PARAMS + repository.PRODUCT_FILTER_PARAMS
+        if self.action not in ('retrieve', 'reviews') or not self.direct_reads(orm_only):
+            return super().get_object()
+        
+        # Same message get_object_or_404 would use on the ORM path
+        missing = Http404('No %s matches the given query.' % Product._meta.object_name)
+        try:
+            pk = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise missing
+        product = repository.get_product(pk, self.get_serializer_class(), self.sparse_fields())
+        if product is None:
+            raise missing
+        self.check_object_permissions(self.request, product)
+        return product
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsFarmer],
+            parser_classes=[MultiPartParser])
+    def bulk_upload(self, request):
+        """
+        Create or update the farmer's products by SKU from a CSV or JSON-lines
+        file, sent as the multipart 'file' field or as the raw request body
+        """
+        if request.content_type.startswith('multipart/'):
+            source = request.FILES.get('file')
+            name = source.name.lower() if source else ''
+        else:
+            source = request.stream
+            name = ''
+        
+        if source is None:
+            return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if name.endswith('.csv') or request.content_type == 'text/csv':
+            file_format = 'csv'
+        elif name.endswith(('.jsonl', '.ndjson')) or request.content_type in (
+                'application/x-ndjson', 'application/jsonl'):
+            file_format = 'jsonl'
+        else:
+            return Response(
+                {'error': 'Upload a .csv or .jsonl file'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = import_inventory(request.user, iter_inventory_rows(source, file_format))
+        summary = {
+            outcome: sum(1 for result in results if result['status'] == outcome)
+            for outcome in ('created', 'updated', 'error')
+        }
+        return Response({'summary': summary, 'results': results})
+    
+    @action(detail=False, methods=['get'])
+    def my_products(self, request):
+        my_products = self.project(Product.objects.filter(farmer=request.user))
+        page = self.paginate_queryset(my_products)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(my_products, many=True)
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def reviews(self, request, pk=None):
+        product = self.get_object()
+        if settings.DIRECT_MONGO_READS:
+            reviews = repository.product_reviews(
+                product.pk, ReviewSerializer, self.sparse_fields(ReviewSerializer)
+            )
+        else:
+            reviews = self.project(product.reviews.all(), ReviewSerializer)
+        serializer = ReviewSerializer(reviews, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Counts per category, organic flag and price range for the current
+        filters, search and near-me context, for the catalog's chips and
+        toggles. Cached like the list until a product changes.
+        """
+        return self.cached_response(request, 'facets', self.facet_counts,
+                                    cache_params=FACET_CACHE_PARAMS)
+    
+    def facet_counts(self, request):
+        try:
+            query = repository.product_filter(request.query_params)
+        except (ValueError, InvalidOperation):
+            return Response({'error': 'Invalid filter'}, status=status.HTTP_400_BAD_REQUEST)
+        selected = {field: query.pop(field) for field in repository.FACET_FIELDS if field in query}
+        # Search and near-me narrow every facet, as they narrow the list
+        for backend in self.filter_backends:
+            if hasattr(backend, 'filter_query'):
+                query = backend().filter_query(request, query, Product)
+        return Response(repository.product_facets(query, selected, settings.CATALOG_PRICE_BUCKETS))
+    
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Delta sync: products created or updated and ids of products deleted
+        since ?since= (the previous response's next; leave it out for the
+        whole catalog), oldest first. Keep following next while has_more.
+        A 410 means the cursor is too old to tell what was deleted, so the
+        client should drop its copy and sync from scratch.
+        """
+        options = sync_settings()
+        since = request.query_params.get('since')
+        try:
+            position, started = decode_cursor(since) if since else (None, None)
+            limit = int(request.query_params.get('page_size', options['PAGE_SIZE']))
+        except ValueError:
+            return Response({'error': 'Invalid since or page_size'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, options['MAX_PAGE_SIZE']))
+        
+        try:
+            changed, deleted, position, started, has_more = catalog_changes(
+                position, started, limit, self.get_serializer_class(), self.sparse_fields()
+            )
+        except SyncReset:
+            return Response(
+                {'error': 'Cursor expired; sync again without since'},
+                status=status.HTTP_410_GONE
+            )
+        return Response({
+            'changed': self.get_serializer(changed, many=True).data,
+            'deleted': deleted,
+            'next': encode_cursor(position, started),
+            'has_more': has_more,
+        })
+
+class OrderViewSet(ProjectionMixin, viewsets.ModelViewSet):
+    """
+    Lists and retrieve cover the hot orders. ?include_archived, or a
+    start/end date range reaching back past the archive horizon, reads the
+    archived orders as well.
+    """
+    serializer_class = OrderSerializer
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+    
+    def get_queryset(self):
+        user = self.request.user
+        created = self.created_range()
+        
+        # If user is a farmer, show orders containing their products. The
+        # list pages farmer_ids directly (see list); only a single order's
+        # id goes through the ORM, as farmer_ids is a JSONField it can't query
+        if user.user_type == 'farmer':
+            query = self.order_query(created)
+            lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+            if lookup is not None:
+                try:
+                    query['id'] = int(lookup)
+                except ValueError:
+                    return Order.objects.none()
+            order_ids = matching_ids(Order, query)
+            return self.order_queryset().filter(id__in=order_ids)
+        
+        # If user is a buyer, show only their orders
+        return self.order_queryset().filter(buyer=user, **orm_range('created_at', created))
+    
+    def order_queryset(self):
+        queryset = self.project(Order.objects.all())
+        if repository.shown(self.sparse_fields(), 'items'):
+            queryset = queryset.prefetch_related(ORDER_ITEMS_PREFETCH)
+        return queryset
+    
+    def created_range(self):
+        """
+        ?start= and ?end= (dates, both inclusive) as a MongoDB condition on
+        created_at
+        """
+        try:
+            start = parse_date(self.request.query_params.get('start', ''))
+            end = parse_date(self.request.query_params.get('end', ''))
+        except ValueError:
+            raise ValidationError({'error': 'Invalid start or end'})
+        
+        created = {}
+        if start:
+            created['$gte'] = datetime.combine(start, time.min)
+        if end:
+            created['$lt'] = datetime.combine(end + timedelta(days=1), time.min)
+        return created
+    
+    def include_archived(self, created):
+        flag = self.request.query_params.get('include_archived')
+        if flag is not None:
+            return flag.lower() not in ('false', '0')
+        if not created:
+            return False
+        horizon = archive_horizon()
+        return horizon is not None and created.get('$gte', datetime.min) < horizon
+    
+    def order_query(self, created):
+        # get_queryset's scope as a MongoDB query
+        user = self.request.user
+        if user.user_type == 'farmer' and self.action != 'my_orders':
+            query = {'farmer_ids': user.id}
+        else:
+            query = {'buyer_id': user.id}
+        if created:
+            query['created_at'] = created
+        return query
+    
+    def list(self, request, *args, **kwargs):
+        created = self.created_range()
+        archived = self.include_archived(created)
+        # A farmer's page is a keyset range on the (farmer_ids, created_at,
+        # id) index, rather than an id__in over every order they're part of
+        if not archived and request.user.user_type != 'farmer':
+            return super().list(request, *args, **kwargs)
+        page = repository.order_page(
+            self.paginator, request, self, self.order_query(created),
+            self.get_serializer_class(), archived=archived, names=self.sparse_fields()
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action != 'retrieve' or not self.include_archived({}):
+                raise
+            order = self.get_archived_object()
+            if order is None:
+                raise
+        self.check_object_permissions(self.request, order)
+        return order
+    
+    def get_archived_object(self):
+        try:
+            pk = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            return None
+        return repository.archived_order(
+            dict(self.order_query({}), id=pk), self.get_serializer_class(), self.sparse_fields()
+        )
+    
+    @action(detail=False, methods=['get'])
+    def my_orders(self, request):
+        created = self.created_range()
+        archived = self.include_archived(created)
+        my_orders = self.order_queryset().filter(buyer=request.user, **orm_range('created_at', created))
+        if settings.DIRECT_MONGO_READS or archived:
+            page = repository.order_page(
+                self.paginator, request, self, self.order_query(created),
+                self.get_serializer_class(), archived=archived, names=self.sparse_fields()
+            )
+        else:
+            page = self.paginate_queryset(my_orders)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(my_orders, many=True)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def events(self, request):
+        """
+        Status changes to the user's orders, as buyer or as one of the
+        farmers, instead of re-polling the order list. Sent as server-sent
+        events to text/event-stream clients, otherwise long-polled as
+        {events, next} (wait: seconds to hold the request open). Resume with
+        the last event id as Last-Event-ID or ?since=; a 410 or a reset
+        event means the events since then are gone and the orders need
+        reloading.
+        """
+        options = feed_settings()
+        try:
+            token = parse_token(
+                request.headers.get('Last-Event-ID') or request.query_params.get('since')
+            )
+            wait = min(int(request.query_params.get('wait', options['LONG_POLL_TIMEOUT'])),
+                       options['LONG_POLL_TIMEOUT'])
+        except ValueError:
+            return Response({'error': 'Invalid since or wait'}, status=status.HTTP_400_BAD_REQUEST)
+        except FeedReset:
+            return Response({'error': 'Resume token expired'}, status=status.HTTP_410_GONE)
+        
+        if request.accepted_renderer.format == 'sse':
+            if settings.ASYNC_VIEWS:
+                # Django 3.x's ASGI handler iterates streaming responses on the
+                # event loop, which the feed would block
+                return Response({'error': 'Event streams are served under WSGI; long-poll instead'},
+                                status=status.HTTP_406_NOT_ACCEPTABLE)
+            # Holds a worker for up to STREAM_TIMEOUT; use threaded workers
+            response = StreamingHttpResponse(
+                event_stream(event_feed(request.user, token, options['STREAM_TIMEOUT']), options),
+                content_type='text/event-stream'
+            )
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+        
+        try:
+            response = Response(long_poll(event_feed(request.user, token, max(wait, 0)), token))
+        except FeedReset:
+            return Response({'error': 'Resume token expired'}, status=status.HTTP_410_GONE)
+        response.held_open = True
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream orders with their items as NDJSON (one order per line) or CSV
+        (one row per item). Staff export every order, farmers and buyers
+        their own. Filters: start, end (dates), status (comma separated),
+        include_archived.
+        """
+        user = request.user
+        created = self.created_range()
+        archived = self.include_archived(created)
+        if user.is_staff:
+            query = {'created_at': created} if created else {}
+        else:
+            query = self.order_query(created)
+        
+        statuses = [s for s in request.query_params.get('status', '').split(',') if s]
+        if statuses:
+            if not set(statuses) <= set(dict(Order.STATUS_CHOICES)):
+                return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
+            query['status'] = {'$in': statuses}
+        
+        # ?format= is taken by DRF's format override
+        output = request.query_params.get('output', 'ndjson')
+        if output == 'csv':
+            response = StreamingHttpResponse(
+                stream_csv(iter_export_orders(query, archived)), content_type='text/csv'
+            )
+        elif output == 'ndjson':
+            response = StreamingHttpResponse(
+                stream_ndjson(iter_export_orders(query, archived)), content_type='application/x-ndjson'
+            )
+        else:
+            return Response({'error': 'output must be ndjson or csv'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response['Content-Disposition'] = f'attachment; filename="orders.{output}"'
+        return response
+    
+    @action(detail=True, methods=['post'])
+    def update_status(self, request, pk=None):
+        order = self.get_object()
+        # Not named status: that would shadow the rest_framework module
+        new_status = request.data.get('status')
+        
+        if not new_status:
+            return Response({'error': 'Status is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if new_status not in dict(Order.STATUS_CHOICES).keys():
+            return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        order.status = new_status
+        order.save()
+        serializer = self.get_serializer(order)
+        return Response(serializer.data)
+
+class ReviewViewSet(ProjectionMixin, viewsets.ModelViewSet):
+    queryset = Review.objects.select_related('user')
+    serializer_class = ReviewSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+    
+    def get_queryset(self):
+        queryset = self.project(Review.objects.all())
+        
+        # Filter by product
+        product_id = self.request.query_params.get('product')
+        if product_id:
+            queryset = queryset.filter(product_id=product_id)
+        
+        # Filter by user
+        user_id = self.request.query_params.get('user')
+        if user_id:
+            queryset = queryset.filter(user_id=user_id)
+        
+        return queryset
+    
+    @action(detail=False, methods=['get'])
+    def my_reviews(self, request):
+        my_reviews = self.project(Review.objects.filter(user=request.user))
+        page = self.paginate_queryset(my_reviews)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(my_reviews, many=True)
+        return Response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([IsFarmer])
+def sales_analytics(request):
+    """
+    Revenue, units and orders per product per day for the requesting farmer,
+    read from the daily sales rollups
+    """
+    today = timezone.now().date()
+    start = request.query_params.get('start')
+    end = request.query_params.get('end')
+    product_id = request.query_params.get('product')
+    
+    try:
+        end = parse_date(end) if end else today
+        start = parse_date(start) if start else end - timedelta(days=29)
+        product_id = int(product_id) if product_id else None
+    except ValueError:
+        return Response({'error': 'Invalid start, end or product'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if start is None or end is None or start > end:
+        return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = farmer_sales(request.user.id, start, end, product_id)
+    data.update({'start': start.isoformat(), 'end': end.isoformat()})
+    return Response(data)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def mongo_pool_stats(request):
+    """
+    Connection pool usage of this worker's MongoDB clients: the shared
+    pymongo and motor clients and djongo's ORM connections
+    """
+    return Response(pool_stats())
+
+def prometheus_metrics(request):
+    """
+    Request histograms, MongoDB pool and user cache gauges for this worker, in the
+    Prometheus text format
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    gauges = {f'agriconnect_mongo_pool_{name}': value for name, value in pool_stats().items()}
+    gauges.update(
+        (f'agriconnect_user_cache_{name}', value) for name, value in user_cache.stats().items()
+    )
+    return HttpResponse(render_metrics(gauges), content_type='text/plain; version=0.0.4')
+
+# async_views.py
+import asyncio
+import time
+from decimal import InvalidOperation
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import HttpResponse
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from .authentication import CachedJWTAuthentication
+from .cache import DETAIL_SCOPE, catalog_cache_key, catalog_entry, etag_matches
+from .events import (
+    EVENTS_COLLECTION, FeedReset, already_sent, change_pipeline, event_payload, feed_settings,
+    parse_token, poll_query, settled_bound, stream_options, token_string, use_change_streams
+)
+from .metrics import current_metrics
+from .models import Product, Order, OrderItem, Review
+from .mongo import from_document, get_async_db
+from .pagination import KeysetPagination
+from .repository import (
+    NAME_FIELDS, ORM_ONLY_PARAMS, PRODUCT_FILTER_PARAMS, attach_items, product_filter,
+    projection, serialized_fields, shown
+)
+from .serializers import ProductSerializer, ReviewSerializer, OrderSerializer, sparse_fields
+from .views import ProductViewSet, OrderViewSet
+
+# Served by ASGI deployments for the hot reads (see urls.py). Everything the
+# async path does not answer itself goes to the synchronous viewsets: writes,
+# text and geo search, the browsable API, bad tokens and every error response.
+product_list_view = ProductViewSet.as_view({'get': 'list', 'post': 'create'})
+product_detail_view = ProductViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'
+})
+product_reviews_view = ProductViewSet.as_view({'get': 'reviews'})
+my_orders_view = OrderViewSet.as_view({'get': 'my_orders'})
+# The router applies an action's renderer_classes; as_view() needs them passed
+order_events_view = OrderViewSet.as_view({'get': 'events'}, **OrderViewSet.events.kwargs)
+
+jwt_authentication = CachedJWTAuthentication()
+cache_get = sync_to_async(cache.get, thread_sensitive=False)
+cache_set = sync_to_async(cache.set, thread_sensitive=False)
+
+class Fallback(Exception):
+    """
+    The request needs the synchronous view
+    """
+
+def async_view(view):
+    # csrf_exempt() returns a sync wrapper on Django 3.x; DRF views are exempt
+    # too and authenticate with JWTs, not sessions
+    view.csrf_exempt = True
+    return view
+
+def check_handled(request, sync_only_params=()):
+    if request.method != 'GET' or 'format' in request.GET:
+        raise Fallback
+    if 'text/html' in request.headers.get('Accept', ''):
+        raise Fallback
+    if any(request.GET.get(name) for name in sync_only_params):
+        raise Fallback
+
+async def delegate(view, request, **kwargs):
+    return await sync_to_async(view)(request, **kwargs)
+
+async def authenticate(request):
+    """
+    The JWT's user, or None without a token. A rejected token falls back to
+    the sync view, which produces the 401.
+    """
+    header = jwt_authentication.get_header(request)
+    raw_token = jwt_authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        token = jwt_authentication.get_validated_token(raw_token)
+        user = jwt_authentication.cached_user(token)
+        if user is None:
+            user = await sync_to_async(jwt_authentication.get_user)(token)
+    except APIException:
+        raise Fallback
+    return user
+
+async def timed(command, awaitable):
+    # Charged to the request like the pymongo command listener does for sync code
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.record_mongo(command, time.perf_counter() - started)
+
+# The async counterparts of repository.find, load_related and keyset_page
+
+async def find(db, model, query, sort=None, limit=0, field_names=None):
+    kwargs = {'projection': projection(field_names, model)} if field_names else {}
+    cursor = db[model._meta.db_table].find(query, limit=limit, **kwargs)
+    if sort:
+        cursor = cursor.sort(sort)
+    docs = await timed('find', cursor.to_list(None))
+    return [from_document(model, doc, field_names) for doc in docs]
+
+async def load_related(db, instances, name, field_names):
+    """
+    select_related for name over instances with one $in query, loading only
+    field_names of the related rows
+    """
+    if not instances:
+        return
+    field = type(instances[0])._meta.get_field(name)
+    ids = list({getattr(obj, field.attname) for obj in instances} - {None})
+    related = await find(db, field.related_model, {'id': {'$in': ids}},
+                         field_names=('id',) + tuple(field_names))
+    by_id = {obj.pk: obj for obj in related}
+    for obj in instances:
+        if getattr(obj, field.attname) in by_id:
+            setattr(obj, name, by_id[getattr(obj, field.attname)])
+
+def json_response(data):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json')
+
+def catalog_response(request, entry):
+    if etag_matches(request, entry['etag']):
+        response = HttpResponse(status=304)
+    else:
+        response = json_response(entry['data'])
+    response['ETag'] = entry['etag']
+    return response
+
+async def cached_catalog(request, scope, build):
+    key = catalog_cache_key(request, scope)
+    entry = await cache_get(key)
+    if entry is None:
+        entry = catalog_entry(await build())
+        await cache_set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+    return catalog_response(request, entry)
+
+async def paginated(request, view, model, query, field_names, build_page):
+    paginator = KeysetPagination()
+    position, reverse = paginator.begin(request, None, view)
+    if position is not None:
+        query = {'$and': [query, paginator.document_filter(model, position, reverse)]}
+    field_names = tuple(set(field_names) | {f.lstrip('-') for f in paginator.keyset_ordering})
+    results = await find(get_async_db(), model, query, sort=paginator.document_sort(reverse),
+                         limit=paginator.page_size + 1, field_names=field_names)
+    page = paginator.end(results, position, reverse)
+    data = await build_page(page)
+    return paginator.get_paginated_response(data).data
+
+@async_view
+async def product_list(request):
+    try:
+        check_handled(request, sync_only_params=ORM_ONLY_PARAMS)
+        await authenticate(request)
+        drf_request = Request(request)
+        view = ProductViewSet(request=drf_request, action='list', format_kwarg=None)
+        query = product_filter(drf_request.query_params)
+        names = sparse_fields(drf_request, ProductSerializer)
+        
+        async def build_page(products):
+            if shown(names, 'farmer_name'):
+                await load_related(get_async_db(), products, 'farmer', NAME_FIELDS)
+            context = {'request': drf_request, 'view': view}
+            return ProductSerializer(products, many=True, context=context).data
+        
+        return await cached_catalog(drf_request, 'list', lambda: paginated(
+            drf_request, view, Product, query, serialized_fields(ProductSerializer, names), build_page
+        ))
+    except (Fallback, APIException, ValueError, InvalidOperation, DjangoValidationError):
+        return await delegate(product_list_view, request)
+
+@async_view
+async def product_detail(request, pk):
+    try:
+        check_handled(request, sync_only_params=ORM_ONLY_PARAMS + PRODUCT_FILTER_PARAMS)
+        await authenticate(request)
+        drf_request = Request(request)
+        view = ProductViewSet(request=drf_request, action='retrieve', format_kwarg=None)
+        names = sparse_fields(drf_request, ProductSerializer)
+        
+        async def build():
+            db = get_async_db()
+            products = await find(db, Product, {'id': int(pk)}, limit=1,
+                                  field_names=serialized_fields(ProductSerializer, names))
+            if not products:
+                raise Fallback
+            if shown(names, 'farmer_name'):
+                await load_related(db, products, 'farmer', NAME_FIELDS)
+            return ProductSerializer(products[0], context={'request': drf_request, 'view': view}).data
+        
+        return await cached_catalog(drf_request, f'{DETAIL_SCOPE}{pk}', build)
+    except (Fallback, ValueError):
+        return await delegate(product_detail_view, request, pk=pk)
+
+@async_view
+async def product_reviews(request, pk):
+    try:
+        check_handled(request, sync_only_params=ORM_ONLY_PARAMS + PRODUCT_FILTER_PARAMS)
+        await authenticate(request)
+        drf_request = Request(request)
+        names = sparse_fields(drf_request, ReviewSerializer)
+        db = get_async_db()
+        product_id = int(pk)
+        if not await timed('find', db[Product._meta.db_table].find_one({'id': product_id}, {'_id': 1})):
+            raise Fallback
+        reviews = await find(db, Review, {'product_id': product_id},
+                             field_names=serialized_fields(ReviewSerializer, names))
+        if shown(names, 'user_name'):
+            await load_related(db, reviews, 'user', NAME_FIELDS)
+        return json_response(ReviewSerializer(reviews, many=True, context={'request': drf_request}).data)
+    except (Fallback, ValueError):
+        return await delegate(product_reviews_view, request, pk=pk)
+
+@async_view
+async def my_orders(request):
+    try:
+        # Date ranges and archived orders are left to the sync view
+        check_handled(request, sync_only_params=('start', 'end'))
+        if 'include_archived' in request.GET:
+            raise Fallback
+        user = await authenticate(request)
+        if user is None:
+            raise Fallback
+        drf_request = Request(request)
+        view = OrderViewSet(request=drf_request, action='my_orders', format_kwarg=None)
+        names = sparse_fields(drf_request, OrderSerializer)
+        
+        async def build_page(orders):
+            db = get_async_db()
+            if shown(names, 'buyer_name'):
+                await load_related(db, orders, 'buyer', NAME_FIELDS)
+            if shown(names, 'items'):
+                items = await find(db, OrderItem, {'order_id': {'$in': [order.pk for order in orders]}})
+                await load_related(db, items, 'product', ('title',))
+                attach_items(orders, items)
+            context = {'request': drf_request, 'view': view}
+            return OrderSerializer(orders, many=True, context=context).data
+        
+        return json_response(await paginated(
+            drf_request, view, Order, {'buyer_id': user.pk}, serialized_fields(OrderSerializer, names),
+            build_page
+        ))
+    except (Fallback, APIException):
+        return await delegate(my_orders_view, request)
+
+# The async counterparts of events.event_feed and long_poll, so a long poll
+# waits on the event loop instead of holding a thread
+
+async def stream_feed(db, user, token, timeout):
+    options = feed_settings()
+    deadline = time.monotonic() + timeout
+    last = token_string(token)
+    sent = False
+    try:
+        async with db[EVENTS_COLLECTION].watch(
+            change_pipeline(user), **stream_options(token, options)
+        ) as stream:
+            while True:
+                change = await timed('getMore', stream.try_next())
+                if change is None:
+                    last = token_string(stream.resume_token) or last
+                    yield last, None
+                    if time.monotonic() >= deadline:
+                        return
+                    continue
+                last = token_string(change['_id'])
+                if not already_sent(change['fullDocument'], token):
+                    sent = True
+                    yield last, event_payload(change['fullDocument'])
+    except OperationFailure as exc:
+        if token is None or sent:
+            raise
+        raise FeedReset from exc
+
+async def poll_feed(db, user, after, timeout):
+    options = feed_settings()
+    deadline = time.monotonic() + timeout
+    if after is None:
+        after = settled_bound(options)
+    while True:
+        cursor = db[EVENTS_COLLECTION].find(poll_query(user, after, settled_bound(options)))
+        cursor = cursor.sort('_id', ASCENDING).limit(options['BATCH_SIZE'])
+        docs = await timed('find', cursor.to_list(None))
+        for doc in docs:
+            after = doc['_id']
+            yield str(after), event_payload(doc)
+        if len(docs) == options['BATCH_SIZE']:
+            continue
+        yield str(after), None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(options['POLL_INTERVAL'], remaining))
+
+async def event_feed(db, user, token, timeout):
+    if await sync_to_async(use_change_streams, thread_sensitive=False)():
+        return stream_feed(db, user, token, timeout)
+    if token is not None and not isinstance(token, ObjectId):
+        raise FeedReset
+    return poll_feed(db, user, token, timeout)
+
+async def long_poll(feed, token):
+    events = []
+    try:
+        async for token, event in feed:
+            if event is not None:
+                events.append(event)
+            elif events:
+                break
+    finally:
+        # Closes the change stream now rather than when the generator is collected
+        await feed.aclose()
+    return {'events': events, 'next': token}
+
+@async_view
+async def order_events(request):
+    try:
+        # Event streams and every error response come from the sync view
+        check_handled(request)
+        if 'text/event-stream' in request.headers.get('Accept', ''):
+            raise Fallback
+        user = await authenticate(request)
+        if user is None:
+            raise Fallback
+        options = feed_settings()
+        token = parse_token(request.headers.get('Last-Event-ID') or request.GET.get('since'))
+        wait = min(int(request.GET.get('wait', options['LONG_POLL_TIMEOUT'])),
+                   options['LONG_POLL_TIMEOUT'])
+        feed = await event_feed(get_async_db(), user, token, max(wait, 0))
+        response = json_response(await long_poll(feed, token))
+        response.held_open = True
+        return response
+    except (Fallback, APIException, ValueError, FeedReset):
+        return await delegate(order_events_view, request)
+
+# middleware.py
+import asyncio
+import logging
+import time
+from django.conf import settings
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from .metrics import RequestMetrics, current_metrics, observe_request, request_phase
+
+try:
+    from asgiref.sync import markcoroutinefunction
+except ImportError:
+    # asgiref < 3.6 (Django 3.x) marks coroutine callables this way
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('agriconnect.performance')
+
+class PerformanceMiddleware:
+    """
+    Measures DB queries and time (ORM through djongo plus raw pymongo),
+    serialization and total time per request. Reports them in a
+    Server-Timing header, feeds the /metrics/ histograms and logs slow
+    requests with the statements they ran. Runs natively in both modes so
+    it never pushes async views back onto a thread under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = asyncio.iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self.record_query(metrics)):
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+    
+    async def __acall__(self, request):
+        # ORM calls made here run on sync_to_async threads with their own
+        # connections, so only async views' own Mongo timings are recorded
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+    
+    def finish(self, request, response, metrics, total):
+        # Route names keep label cardinality bounded, unlike raw paths
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        observe_request(view, request.method, metrics, total)
+        
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.queries} queries"',
+            f'mongo;dur={metrics.mongo_seconds * 1000:.1f};desc="{metrics.mongo_commands} commands"',
+            f'serialize;dur={metrics.serialize_seconds * 1000:.1f}',
+            f'compress;dur={metrics.compress_seconds * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+        
+        # Long polls are slow on purpose
+        if total >= settings.SLOW_REQUEST_SECONDS and not getattr(response, 'held_open', False):
+            statements = '\n'.join(
+                f'  {seconds * 1000:8.1f}ms  {sql}' for seconds, sql in metrics.statements
+            )
+            logger.warning(
+                'Slow request %s %s (%s) took %.0fms: %d queries in %.0fms, '
+                '%d mongo commands in %.0fms, serialize %.0fms\n%s',
+                request.method, request.path, view, total * 1000,
+                metrics.queries, metrics.db_seconds * 1000,
+                metrics.mongo_commands, metrics.mongo_seconds * 1000,
+                metrics.serialize_seconds * 1000, statements
+            )
+        
+        return response
+    
+    @staticmethod
+    def record_query(metrics):
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                metrics.record_query(sql, time.perf_counter() - started)
+        return wrapper
+
+DEFAULT_COMPRESSION_SETTINGS = {
+    'MIN_SIZE': 1024,
+    'BROTLI_QUALITY': 5,
+}
+
+# Bodies worth compressing; the browsable API's HTML carries a CSRF token
+# and is left alone (BREACH)
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain')
+
+def compression_settings():
+    options = dict(DEFAULT_COMPRESSION_SETTINGS)
+    options.update(getattr(settings, 'RESPONSE_COMPRESSION', {}))
+    return options
+
+def negotiate_encoding(accept_encoding):
+    """
+    'br', 'gzip' or None for an Accept-Encoding header: the supported
+    coding with the highest q-value, brotli on a tie
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding] = weight
+    
+    best, best_weight = None, 0.0
+    for coding in ('br', 'gzip') if brotli is not None else ('gzip',):
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least MIN_SIZE bytes as negotiated
+    through Accept-Encoding. Time spent is reported as the compress phase.
+    Runs natively in both modes, like PerformanceMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = asyncio.iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+    
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+    
+    def compress(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        options = compression_settings()
+        if content_type not in COMPRESSIBLE_TYPES or len(response.content) < options['MIN_SIZE']:
+            return response
+        
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+        if coding is None:
+            return response
+        with request_phase('compress'):
+            if coding == 'br':
+                body = brotli.compress(response.content, quality=options['BROTLI_QUALITY'])
+            else:
+                body = compress_string(response.content)
+        if len(body) >= len(response.content):
+            return response
+        
+        response.content = body
+        response['Content-Length'] = str(len(body))
+        response['Content-Encoding'] = coding
+        # Same content, different bytes: only a weak validator still holds
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        return response
+
+# urls.py
+from django.conf import settings
+from django.urls import path, include, re_path
+from rest_framework.routers import DefaultRouter
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .views import (
+    UserViewSet, ProductViewSet, OrderViewSet, ReviewViewSet, mongo_pool_stats,
+    prometheus_metrics, sales_analytics
+)
+
+router = DefaultRouter()
+router.register(r'users', UserViewSet)
+router.register(r'products', ProductViewSet)
+router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'reviews', ReviewViewSet)
+
+# ASGI deployments answer the hot reads with async views. They come first so
+# they win over the router's routes, and hand anything else to the viewsets.
+# Detail routes only take numeric ids, so the products viewset's list
+# actions (my_products/, bulk_upload/, facets/, changes/) still reach the
+# router.
+async_urlpatterns = []
+if settings.ASYNC_VIEWS:
+    from . import async_views
+    async_urlpatterns = [
+        re_path(r'^products/$', async_views.product_list, name='async-product-list'),
+        re_path(r'^products/(?P<pk>\d+)/$', async_views.product_detail,
+                name='async-product-detail'),
+        re_path(r'^products/(?P<pk>\d+)/reviews/$', async_views.product_reviews,
+                name='async-product-reviews'),
+        re_path(r'^orders/my_orders/$', async_views.my_orders, name='async-order-my-orders'),
+        re_path(r'^orders/events/$', async_views.order_events, name='async-order-events'),
+    ]
+
+urlpatterns = async_urlpatterns + [
+    path('', include(router.urls)),
+    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('analytics/sales/', sales_analytics, name='sales_analytics'),
+    path('health/mongo-pool/', mongo_pool_stats, name='mongo_pool_stats'),
+    path('metrics/', prometheus_metrics, name='prometheus_metrics'),
+    path('password-reset/', include('django_rest_passwordreset.urls', namespace='password_reset')),
+]
+
+# asgi.py
+# Serving through this module turns on the async views for the hot reads,
+# e.g. DJANGO_SETTINGS_MODULE=<project>.settings uvicorn agriconnect.asgi:application
+import os
+os.environ.setdefault('AGRICONNECT_ASYNC_VIEWS', '1')
+
+from django.core.asgi import get_asgi_application
+
+application = get_asgi_application()
+
+# management/commands/backfill_order_farmers.py
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from agriconnect.models import Order, OrderItem
+from agriconnect.mongo import get_collection
+
+class Command(BaseCommand):
+    help = 'Populate Order.farmer_ids for orders placed before it was tracked'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        orders = get_collection(Order)
+        
+        # Walk all items once, grouped by order, instead of querying per order
+        items = (
+            OrderItem.objects.order_by('order_id')
+            .values_list('order_id', 'product__farmer_id')
+            .iterator(chunk_size=batch_size)
+        )
+        
+        updates = []
+        updated = 0
+        current_order, farmer_ids = None, set()
+        for order_id, farmer_id in items:
+            if order_id != current_order:
+                if current_order is not None:
+                    updates.append(UpdateOne(
+                        {'id': current_order}, {'$set': {'farmer_ids': sorted(farmer_ids)}}
+                    ))
+                current_order, farmer_ids = order_id, set()
+            # Items whose product was deleted have no farmer
+            if farmer_id is not None:
+                farmer_ids.add(farmer_id)
+            
+            if len(updates) >= batch_size:
+                updated += orders.bulk_write(updates, ordered=False).modified_count
+                updates = []
+        
+        if current_order is not None:
+            updates.append(UpdateOne(
+                {'id': current_order}, {'$set': {'farmer_ids': sorted(farmer_ids)}}
+            ))
+        if updates:
+            updated += orders.bulk_write(updates, ordered=False).modified_count
+        
+        # Orders without items still need the field for the farmer_ids index
+        # and the event writer
+        updated += orders.update_many(
+            {'farmer_ids': None}, {'$set': {'farmer_ids': []}}
+        ).modified_count
+        
+        self.stdout.write(self.style.SUCCESS(f'Backfilled farmer_ids on {updated} orders'))
+
+# management/commands/recompute_product_ratings.py
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from agriconnect.models import Product, Review
+from agriconnect.mongo import current_time, get_collection
+from agriconnect.cache import invalidate_catalog
+
+class Command(BaseCommand):
+    help = 'Rebuild product rating aggregates from reviews and repair any drift'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        products = get_collection(Product)
+        
+        totals = {
+            row['_id']: (row['sum'], row['count'])
+            for row in get_collection(Review).aggregate([
+                {'$group': {'_id': '$product_id', 'sum': {'$sum': '$rating'}, 'count': {'$sum': 1}}}
+            ])
+        }
+        
+        updates = []
+        repaired = 0
+        fields = {'id': 1, 'rating_sum': 1, 'rating_count': 1, 'rating_avg': 1}
+        for product in products.find({}, fields).batch_size(batch_size):
+            rating_sum, rating_count = totals.get(product['id'], (0, 0))
+            rating_avg = rating_sum / rating_count if rating_count else 0
+            current = (product.get('rating_sum'), product.get('rating_count'), product.get('rating_avg'))
+            if current == (rating_sum, rating_count, rating_avg):
+                continue
+            
+            updates.append(UpdateOne({'id': product['id']}, {'$set': {
+                'rating_sum': rating_sum,
+                'rating_count': rating_count,
+                'rating_avg': rating_avg,
+                'updated_at': current_time(),
+            }}))
+            if len(updates) >= batch_size:
+                repaired += products.bulk_write(updates, ordered=False).modified_count
+                updates = []
+        
+        if updates:
+            repaired += products.bulk_write(updates, ordered=False).modified_count
+        
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(f'Repaired rating aggregates on {repaired} products'))
+
+# management/commands/rebuild_sales_rollups.py
+from django.core.management.base import BaseCommand
+from agriconnect.analytics import SALES_STATUSES, sales_rollups
+from agriconnect.archive import archive_collection
+from agriconnect.models import Order, OrderItem, Product
+from agriconnect.mongo import get_collection
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollups from orders and order items, archived ones included'
+    
+    def handle(self, *args, **options):
+        rollups = sales_rollups()
+        rollups.delete_many({})
+        
+        # Whole rebuild runs server-side and writes straight into the rollups.
+        # Archived items join their archived order. Not to be run alongside
+        # archive_orders, which briefly keeps a batch in both places.
+        get_collection(OrderItem).aggregate([
+            {'$unionWith': archive_collection(OrderItem).name},
+            {'$lookup': {
+                'from': Order._meta.db_table, 'localField': 'order_id',
+                'foreignField': 'id', 'as': 'order',
+            }},
+            {'$lookup': {
+                'from': archive_collection(Order).name, 'localField': 'order_id',
+                'foreignField': 'id', 'as': 'archived_order',
+            }},
+            {'$set': {'order': {'$arrayElemAt': [{'$concatArrays': ['$order', '$archived_order']}, 0]}}},
+            {'$match': {'order': {'$exists': True}}},
+            {'$match': {'order.status': {'$in': list(SALES_STATUSES)}}},
+            {'$lookup': {
+                'from': Product._meta.db_table, 'localField': 'product_id',
+                'foreignField': 'id', 'as': 'product',
+            }},
+            {'$unwind': '$product'},
+            # Per order first, so an order counts once per product however
+            # many of its items list it (as record_order_sales does)
+            {'$group': {
+                '_id': {
+                    'order_id': '$order_id',
+                    'farmer_id': '$product.farmer_id',
+                    'product_id': '$product_id',
+                    'day': {'$dateFromParts': {
+                        'year': {'$year': '$order.created_at'},
+                        'month': {'$month': '$order.created_at'},
+                        'day': {'$dayOfMonth': '$order.created_at'},
+                    }},
+                },
+                'revenue': {'$sum': {'$multiply': ['$quantity', {'$toDecimal': '$price'}]}},
+                'units': {'$sum': '$quantity'},
+            }},
+            {'$group': {
+                '_id': {
+                    'farmer_id': '$_id.farmer_id',
+                    'product_id': '$_id.product_id',
+                    'day': '$_id.day',
+                },
+                'revenue': {'$sum': '$revenue'},
+                'units': {'$sum': '$units'},
+                'orders': {'$sum': 1},
+            }},
+            {'$project': {
+                '_id': 0,
+                'farmer_id': '$_id.farmer_id',
+                'product_id': '$_id.product_id',
+                'day': '$_id.day',
+                'revenue': 1,
+                'units': 1,
+                'orders': 1,
+            }},
+            {'$merge': {'into': rollups.name}},
+        ], allowDiskUse=True)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rollups.estimated_document_count()} daily sales rollups'
+        ))
+
+# management/commands/archive_orders.py
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from agriconnect.archive import ARCHIVE_STATUSES, archive_orders
+
+class Command(BaseCommand):
+    help = 'Move delivered and cancelled orders, with their items, to the archive collections'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE['AFTER_DAYS'],
+                            help='Archive orders last updated more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_ARCHIVE['BATCH_SIZE'])
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches; the next run carries on')
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        moved = 0
+        for count in archive_orders(cutoff, options['batch_size'], options['max_batches']):
+            moved += count
+            self.stdout.write(f'{moved} orders archived')
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} {'/'.join(ARCHIVE_STATUSES)} orders last updated before {cutoff:%Y-%m-%d}"
+        ))
+
+# management/commands/ensure_indexes.py
+from django.core.management.base import BaseCommand, CommandError
+from agriconnect.indexes import apply_indexes, check_query_plans
+from agriconnect.mongo import get_db
+
+class Command(BaseCommand):
+    help = 'Apply the compound indexes the API relies on and check query plans use them'
     
-    @action(detail=False, methods=['get'])
-    def my_products(self, request):
-        my_products = Product.objects.filter(farmer=request.user)
-        serializer = self.get_serializer(my_products, many=True)
-        return Response(serializer.data)
+    def add_arguments(self, parser):
+        parser.add_argument('--check-only', action='store_true',
+                            help='Only explain the query shapes, do not change indexes')
     
-    @action(detail=True, methods=['get'])
-    def reviews(self, request, pk=None):
-        product = self.get_object()
-        reviews = product.reviews.all()
-        serializer = ReviewSerializer(reviews, many=True)
-        return Response(serializer.data)
+    def handle(self, *args, **options):
+        db = get_db()
+        if not options['check_only']:
+            changes = apply_indexes(db)
+            for change in changes:
+                self.stdout.write(change)
+            self.stdout.write(self.style.SUCCESS(f'{len(changes)} index changes applied'))
+        
+        problems = check_query_plans(db)
+        for name, problem in problems:
+            self.stderr.write(f'{name}: {problem}')
+        if problems:
+            raise CommandError(f'{len(problems)} queries are not fully served by an index')
+        self.stdout.write(self.style.SUCCESS('All query shapes use an index for filter and sort'))
 
-class OrderViewSet(viewsets.ModelViewSet):
-    serializer_class = OrderSerializer
-    permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+# management/commands/geocode_locations.py
+import csv
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import UpdateOne
+from agriconnect.cache import invalidate_catalog
+from agriconnect.models import User, Product
+from agriconnect.mongo import current_time, get_collection
+
+def normalize_place(name):
+    return ' '.join((name or '').lower().split())
+
+class Command(BaseCommand):
+    help = 'Fill in coordinates for products and farmers from an offline gazetteer'
     
-    def get_queryset(self):
-        user = self.request.user
+    def add_arguments(self, parser):
+        parser.add_argument('gazetteer', help='CSV file with name,latitude,longitude columns')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--overwrite', action='store_true',
+                            help='Re-geocode documents that already have coordinates')
+    
+    def handle(self, *args, **options):
+        try:
+            with open(options['gazetteer'], newline='', encoding='utf-8') as f:
+                places = {
+                    normalize_place(row['name']): (float(row['longitude']), float(row['latitude']))
+                    for row in csv.DictReader(f)
+                }
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f'Could not read gazetteer: {e}')
         
-        # If user is a farmer, show orders containing their products
-        if user.user_type == 'farmer':
-            farmer_products = Product.objects.filter(farmer=user).values_list('id', flat=True)
-            return Order.objects.filter(items__product_id__in=farmer_products).distinct()
+        # Farmers are placed by their address, products by their location
+        for model, field, query in (
+            (Product, 'location', {}),
+            (User, 'address', {'user_type': 'farmer'}),
+        ):
+            if not options['overwrite']:
+                query = dict(query, geo_point=None)
+            matched, unmatched = self.geocode(model, field, query, places, options['batch_size'])
+            self.stdout.write(
+                f'{model._meta.db_table}: {matched} geocoded, {unmatched} without a gazetteer match'
+            )
         
-        # If user is a buyer, show only their orders
-        return Order.objects.filter(buyer=user)
+        invalidate_catalog()
     
-    @action(detail=False, methods=['get'])
-    def my_orders(self, request):
-        my_orders = Order.objects.filter(buyer=request.user)
-        serializer = self.get_serializer(my_orders, many=True)
-        return Response(serializer.data)
+    def lookup(self, text, places):
+        # Try the full string, then each comma separated part ("Farm Road 1, Nakuru")
+        candidates = [text] + [part for part in text.split(',')]
+        for candidate in candidates:
+            point = places.get(normalize_place(candidate))
+            if point:
+                return point
+        return None
     
-    @action(detail=True, methods=['post'])
-    def update_status(self, request, pk=None):
-        order = self.get_object()
-        status = request.data.get('status')
+    def geocode(self, model, field, query, places, batch_size):
+        collection = get_collection(model)
+        updates = []
+        matched = unmatched = 0
+        for doc in collection.find(query, {'id': 1, field: 1}).batch_size(batch_size):
+            point = self.lookup(doc.get(field) or '', places)
+            if point is None:
+                unmatched += 1
+                continue
+            matched += 1
+            fields = {'geo_point': {'type': 'Point', 'coordinates': list(point)}}
+            if model is Product:
+                # Coordinates are part of the product payload delta sync serves
+                fields['updated_at'] = current_time()
+            updates.append(UpdateOne({'id': doc['id']}, {'$set': fields}))
+            if len(updates) >= batch_size:
+                collection.bulk_write(updates, ordered=False)
+                updates = []
+        if updates:
+            collection.bulk_write(updates, ordered=False)
+        return matched, unmatched
+
+# management/commands/run_benchmarks.py
+import json
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import date
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from agriconnect.cache import invalidate_catalog
+from agriconnect.indexes import apply_indexes
+from agriconnect.middleware import brotli
+from agriconnect.models import User, Product, Order, OrderItem, Review
+from agriconnect.mongo import get_db, pool_metrics
+
+# What a mobile catalog screen shows
+LIST_SCREEN_FIELDS = 'id,title,price,image_url'
+# Usernames and product descriptions of benchmark-owned rows start with these
+BENCHMARK_USER_PREFIX = 'bench'
+BENCHMARK_PRODUCT_PREFIX = 'Benchmark produce'
+
+@contextmanager
+def benchmark_database(keepdb=False):
+    """
+    Point the ORM, the raw pymongo and motor clients and every cache alias
+    at a dedicated database (the test database name, e.g.
+    test_agriconnect_db) and private in-process caches, so benchmark orders
+    and cache flushes never reach live data. The database is dropped
+    afterwards unless keepdb.
+    """
+    old_name = connection.settings_dict['NAME']
+    name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    caches = {
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'benchmark-{alias}'}
+        for alias in settings.CACHES
+    }
+    try:
+        with override_settings(MONGO_CLIENT=dict(settings.MONGO_CLIENT, NAME=name), CACHES=caches):
+            apply_indexes(get_db())
+            yield name
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+def benchmark_users(user_type):
+    return User.objects.filter(username__startswith=BENCHMARK_USER_PREFIX, user_type=user_type)
+
+def benchmark_products():
+    return Product.objects.filter(description__startswith=BENCHMARK_PRODUCT_PREFIX)
+
+class Command(BaseCommand):
+    help = 'Benchmark the main API endpoints and compare against a saved baseline'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--scenarios', nargs='*', help='Only run these scenarios')
+        parser.add_argument('--cold-cache', action='store_true',
+                            help='Drop the catalog cache before every request')
+        parser.add_argument('--load', action='store_true',
+                            help='Add a dataset even if the benchmark database has one')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the benchmark database (and reuse its dataset) between runs')
+        parser.add_argument('--farmers', type=int, default=50)
+        parser.add_argument('--buyers', type=int, default=200)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--reviews', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--save', metavar='PATH', help='Write results as a new baseline')
+        parser.add_argument('--compare', metavar='PATH', help='Baseline to compare against')
+    
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('--requests must be at least 2 to report percentiles')
+        setup_test_environment()
+        self.rng = random.Random(options['seed'])
+        with benchmark_database(options['keepdb']) as name:
+            self.stdout.write(f'Benchmarking against {name}')
+            self.benchmark(options)
+    
+    def benchmark(self, options):
+        if options['load'] or not benchmark_products().exists():
+            self.load_dataset(options)
         
-        if not status:
-            return Response({'error': 'Status is required'}, status=status.HTTP_400_BAD_REQUEST)
+        self.farmer = benchmark_users('farmer').filter(products__isnull=False).first()
+        self.buyer = benchmark_users('buyer').first()
+        self.product_ids = list(
+            benchmark_products().filter(quantity__gt=0).values_list('id', flat=True)[:1000]
+        )
+        if not (self.farmer and self.buyer and self.product_ids):
+            raise CommandError('The benchmark dataset is incomplete; run with --load')
         
-        if status not in dict(Order.STATUS_CHOICES).keys():
-            return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
+        scenarios = self.get_scenarios()
+        names = options['scenarios'] or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
         
-        order.status = status
-        order.save()
-        serializer = self.get_serializer(order)
-        return Response(serializer.data)
+        results = {}
+        for name in names:
+            results[name] = self.run_scenario(scenarios[name], options)
+        
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        self.report(results, baseline)
+        self.report_variants(results)
+        
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Saved baseline to {options['save']}")
+    
+    def client_for(self, user):
+        token = RefreshToken.for_user(user).access_token
+        return Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def get_scenarios(self):
+        buyer = self.client_for(self.buyer)
+        farmer = self.client_for(self.farmer)
+        product_list = reverse('product-list')
+        
+        def random_product():
+            return self.rng.choice(self.product_ids)
+        
+        def create_order():
+            items = [
+                {'product': pk, 'quantity': 1, 'price': '1.00'}
+                for pk in self.rng.sample(self.product_ids, min(3, len(self.product_ids)))
+            ]
+            return buyer.post(reverse('order-list'), {
+                'items': items,
+                'total_amount': '3.00',
+                'shipping_address': 'Benchmark Lane 1',
+                'phone_number': '+254700000000',
+            }, content_type='application/json')
+        
+        scenarios = {
+            'product_list': lambda: buyer.get(product_list),
+            # Sparse fieldsets and compression against product_list (report_variants)
+            'product_list_sparse': lambda: buyer.get(product_list, {'fields': LIST_SCREEN_FIELDS}),
+            'product_list_gzip': lambda: buyer.get(product_list, HTTP_ACCEPT_ENCODING='gzip'),
+            'product_list_mobile': lambda: buyer.get(
+                product_list, {'fields': LIST_SCREEN_FIELDS}, HTTP_ACCEPT_ENCODING='br, gzip'
+            ),
+            'product_search': lambda: buyer.get(product_list, {'search': 'fresh tomatoes'}),
+            'product_filter': lambda: buyer.get(product_list, {
+                'category': 'vegetables', 'is_organic': 'true',
+                'min_price': '1', 'max_price': '10', 'ordering': 'price',
+            }),
+            'product_detail': lambda: buyer.get(reverse('product-detail', args=[random_product()])),
+            'product_reviews': lambda: buyer.get(reverse('product-reviews', args=[random_product()])),
+            'review_list': lambda: buyer.get(reverse('review-list'), {'product': random_product()}),
+            'order_create': create_order,
+            'farmer_orders': lambda: farmer.get(reverse('order-list')),
+            'buyer_orders': lambda: buyer.get(reverse('order-my-orders')),
+        }
+        if brotli is not None:
+            scenarios['product_list_br'] = lambda: buyer.get(product_list, HTTP_ACCEPT_ENCODING='br')
+        return scenarios
+    
+    def run_scenario(self, request, options):
+        for _ in range(options['warmup']):
+            request()
+        
+        latencies, queries, checkouts, sizes = [], [], [], []
+        failures = 0
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            if options['cold_cache']:
+                invalidate_catalog()
+            checkouts_before = pool_metrics.checkouts
+            with CaptureQueriesContext(connection) as captured:
+                begin = time.perf_counter()
+                response = request()
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+                latencies.append(time.perf_counter() - begin)
+            queries.append(len(captured))
+            checkouts.append(pool_metrics.checkouts - checkouts_before)
+            sizes.append(len(content))
+            if response.status_code >= 400:
+                failures += 1
+        elapsed = time.perf_counter() - started
+        
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        return {
+            'requests': len(latencies),
+            'failures': failures,
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(cuts[49] * 1000, 2),
+            'p95_ms': round(cuts[94] * 1000, 2),
+            'p99_ms': round(cuts[98] * 1000, 2),
+            'queries_per_request': round(statistics.mean(queries), 2),
+            'mongo_checkouts_per_request': round(statistics.mean(checkouts), 2),
+            'bytes_per_response': round(statistics.mean(sizes)),
+        }
+    
+    def report(self, results, baseline):
+        columns = ['throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request',
+                   'mongo_checkouts_per_request', 'bytes_per_response']
+        self.stdout.write(f"{'scenario':<20}" + ''.join(f'{c:>28}' for c in columns))
+        for name, result in results.items():
+            cells = []
+            for column in columns:
+                cell = f'{result[column]}'
+                previous = (baseline or {}).get(name, {}).get(column)
+                if previous:
+                    cell += f' ({(result[column] - previous) / previous * 100:+.1f}%)'
+                cells.append(f'{cell:>28}')
+            line = f'{name:<20}' + ''.join(cells)
+            if result['failures']:
+                line += f"  [{result['failures']} failed]"
+            self.stdout.write(line)
+    
+    def report_variants(self, results):
+        # Payload and latency of the product list variants against the plain list
+        plain = results.get('product_list')
+        variants = [name for name in results if name.startswith('product_list_')]
+        if not plain or not variants:
+            return
+        self.stdout.write('\nproduct_list variants vs product_list:')
+        for name in variants:
+            changes = ', '.join(
+                f'{column} {(results[name][column] - plain[column]) / plain[column] * 100:+.1f}%'
+                for column in ('bytes_per_response', 'p50_ms', 'p95_ms') if plain[column]
+            )
+            self.stdout.write(f'  {name:<20}{changes}')
+    
+    def load_dataset(self, options):
+        rng = self.rng
+        categories = [choice for choice, _ in Product.CATEGORY_CHOICES]
+        # Unique per run, and used to read the rows back: bulk_create does not
+        # return primary keys on every backend
+        tag = f'{BENCHMARK_USER_PREFIX}{int(time.time())}'
+        self.stdout.write(f'Loading benchmark dataset {tag}...')
+        
+        User.objects.bulk_create([
+            User(username=f'{tag}_farmer{i}', email=f'{tag}_farmer{i}@example.com',
+                 user_type='farmer', first_name='Farmer', last_name=str(i))
+            for i in range(options['farmers'])
+        ])
+        User.objects.bulk_create([
+            User(username=f'{tag}_buyer{i}', email=f'{tag}_buyer{i}@example.com',
+                 user_type='buyer', first_name='Buyer', last_name=str(i))
+            for i in range(options['buyers'])
+        ])
+        farmers = list(User.objects.filter(username__startswith=f'{tag}_farmer'))
+        buyers = list(User.objects.filter(username__startswith=f'{tag}_buyer'))
+        
+        Product.objects.bulk_create([
+            Product(
+                title=f"Fresh {rng.choice(['Tomatoes', 'Kale', 'Mangoes', 'Maize', 'Milk'])} {i}",
+                description=f'{BENCHMARK_PRODUCT_PREFIX} {tag}',
+                price=rng.randint(50, 2000) / 100,
+                image_url=f'https://example.com/products/{i}.jpg',
+                category=rng.choice(categories),
+                farmer=rng.choice(farmers),
+                location='Nakuru',
+                harvest_date=date.today(),
+                is_organic=rng.random() < 0.3,
+                quantity=1_000_000,
+            )
+            for i in range(options['products'])
+        ])
+        products = list(Product.objects.filter(description=f'{BENCHMARK_PRODUCT_PREFIX} {tag}'))
+        
+        Order.objects.bulk_create([
+            Order(
+                buyer=rng.choice(buyers),
+                total_amount=0,
+                shipping_address=f'Benchmark Lane {tag}',
+                phone_number='+254700000000',
+            )
+            for _ in range(options['orders'])
+        ])
+        orders = list(Order.objects.filter(shipping_address=f'Benchmark Lane {tag}'))
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price=product.price)
+            for order in orders
+            for product in rng.sample(products, min(3, len(products)))
+        ])
+        
+        pairs = {(rng.choice(products), rng.choice(buyers)) for _ in range(options['reviews'])}
+        Review.objects.bulk_create([
+            Review(product=product, user=user, rating=rng.randint(1, 5), comment='Benchmark review')
+            for product, user in pairs
+        ])
+        
+        # bulk_create skips the signals that maintain the denormalized fields
+        call_command('backfill_order_farmers')
+        call_command('recompute_product_ratings')
+        call_command('rebuild_sales_rollups')
 
-class ReviewViewSet(viewsets.ModelViewSet):
-    queryset = Review.objects.all()
-    serializer_class = ReviewSerializer
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+# management/commands/benchmark_concurrency.py
+import asyncio
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from agriconnect.cache import invalidate_catalog
+from agriconnect.management.commands.run_benchmarks import (
+    benchmark_database, benchmark_products, benchmark_users,
+)
+
+class Command(BaseCommand):
+    help = (
+        'Throughput of one worker through the ASGI handler at increasing '
+        'concurrency, against the dataset run_benchmarks --keepdb leaves in '
+        'the benchmark database. Run with AGRICONNECT_ASYNC_VIEWS=1 for the '
+        'async views and without it for the sync views, and compare.'
+    )
     
-    def get_queryset(self):
-        queryset = Review.objects.all()
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50],
+                            help='In-flight requests per level')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per level')
+        parser.add_argument('--scenarios', nargs='*', help='Only run these scenarios')
+        parser.add_argument('--cold-cache', action='store_true',
+                            help='Drop the catalog cache before every request')
+    
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('--requests must be at least 2 to report percentiles')
+        setup_test_environment()
+        with benchmark_database(keepdb=True):
+            self.benchmark(options)
+    
+    def benchmark(self, options):
+        buyer = benchmark_users('buyer').filter(orders__isnull=False).first()
+        product_ids = list(benchmark_products().values_list('id', flat=True)[:1000])
+        if not (buyer and product_ids):
+            raise CommandError('No data to benchmark against; run run_benchmarks --keepdb first')
         
-        # Filter by product
-        product_id = self.request.query_params.get('product')
-        if product_id:
-            queryset = queryset.filter(product_id=product_id)
+        token = RefreshToken.for_user(buyer).access_token
+        headers = {'authorization': f'Bearer {token}'}
+        scenarios = {
+            'product_list': lambda i: (reverse('product-list'), {}),
+            'product_detail': lambda i: (reverse('product-detail', args=[product_ids[i % len(product_ids)]]), {}),
+            'product_reviews': lambda i: (reverse('product-reviews', args=[product_ids[i % len(product_ids)]]), {}),
+            'buyer_orders': lambda i: (reverse('order-my-orders'), {}),
+        }
+        names = options['scenarios'] or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
         
-        # Filter by user
-        user_id = self.request.query_params.get('user')
-        if user_id:
-            queryset = queryset.filter(user_id=user_id)
+        mode = 'async views' if settings.ASYNC_VIEWS else 'sync views'
+        self.stdout.write(f'{mode}, {options["requests"]} requests per level')
+        self.stdout.write(f"{'scenario':<16}{'concurrency':>12}{'rps':>10}{'p50_ms':>10}{'p95_ms':>10}")
+        for name in names:
+            for concurrency in options['concurrency']:
+                result = asyncio.run(self.run_level(
+                    scenarios[name], headers, concurrency, options['requests'], options['cold_cache']
+                ))
+                line = (f"{name:<16}{concurrency:>12}{result['rps']:>10}"
+                        f"{result['p50_ms']:>10}{result['p95_ms']:>10}")
+                if result['failures']:
+                    line += f"  [{result['failures']} failed]"
+                self.stdout.write(line)
+    
+    async def run_level(self, scenario, headers, concurrency, requests, cold_cache):
+        client = AsyncClient()
+        latencies = []
+        failures = 0
+        counter = iter(range(requests))
         
-        return queryset
+        async def worker():
+            nonlocal failures
+            for i in counter:
+                if cold_cache:
+                    invalidate_catalog()
+                path, params = scenario(i)
+                begin = time.perf_counter()
+                response = await client.get(path, params, **headers)
+                latencies.append(time.perf_counter() - begin)
+                if response.status_code >= 400:
+                    failures += 1
+        
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        return {
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(cuts[49] * 1000, 2),
+            'p95_ms': round(cuts[94] * 1000, 2),
+            'failures': failures,
+        }
+
+# tests/__init__.py
+from datetime import date
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from agriconnect.models import Product
+
+class MongoTestMixin:
+    """
+    Points the raw pymongo reads and writes (mongo.get_db) at the test
+    database the ORM was switched to, and starts each test on a cold cache
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._mongo_settings = override_settings(
+            MONGO_CLIENT=dict(settings.MONGO_CLIENT, NAME=connection.settings_dict['NAME'])
+        )
+        cls._mongo_settings.enable()
     
-    @action(detail=False, methods=['get'])
-    def my_reviews(self, request):
-        my_reviews = Review.objects.filter(user=request.user)
-        serializer = self.get_serializer(my_reviews, many=True)
-        return Response(serializer.data)
+    @classmethod
+    def tearDownClass(cls):
+        cls._mongo_settings.disable()
+        super().tearDownClass()
+    
+    def setUp(self):
+        super().setUp()
+        cache.clear()
 
-# urls.py
-from django.urls import path, include
-from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import UserViewSet, ProductViewSet, OrderViewSet, ReviewViewSet
+def create_product(farmer, **fields):
+    defaults = {
+        'title': 'Tomatoes', 'description': 'Fresh', 'price': Decimal('10.00'),
+        'image_url': 'https://example.com/tomatoes.jpg', 'category': 'vegetables',
+        'location': 'Nakuru', 'harvest_date': date(2024, 1, 1), 'quantity': 100,
+    }
+    return Product.objects.create(farmer=farmer, **dict(defaults, **fields))
 
-router = DefaultRouter()
-router.register(r'users', UserViewSet)
-router.register(r'products', ProductViewSet)
-router.register(r'orders', OrderViewSet, basename='order')
-router.register(r'reviews', ReviewViewSet)
+# tests/test_orders.py
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from django.db import connections
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from agriconnect.models import Order, OrderItem, Product, User
+from agriconnect.tests import MongoTestMixin, create_product
 
-urlpatterns = [
-    path('', include(router.urls)),
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('password-reset/', include('django_rest_passwordreset.urls', namespace='password_reset')),
+class OrderStockTests(MongoTestMixin, TransactionTestCase):
+    """
+    Orders reserve stock with conditional updates on the products
+    collection; committed rows and real threads, so no test transaction
+    hides a race
+    """
+    stock = 50
+    orders = 300
+    workers = 32
+    
+    def setUp(self):
+        super().setUp()
+        farmer = User.objects.create_user('farmer', 'farmer@example.com', 'pass', user_type='farmer')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass', user_type='buyer')
+        self.token = str(RefreshToken.for_user(self.buyer).access_token)
+        self.product = create_product(farmer, quantity=self.stock)
+    
+    def place_order(self, quantity=1):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        try:
+            return client.post(reverse('order-list'), {
+                'items': [{'product': self.product.pk, 'quantity': quantity, 'price': '10.00'}],
+                'total_amount': str(10 * quantity),
+                'shipping_address': 'Nakuru',
+                'phone_number': '+254700000000',
+            }, format='json')
+        finally:
+            # Each worker thread has its own connection
+            connections.close_all()
+    
+    def test_parallel_orders_never_oversell(self):
+        with ThreadPoolExecutor(self.workers) as pool:
+            codes = [response.status_code for response in pool.map(
+                lambda _: self.place_order(), range(self.orders)
+            )]
+        
+        self.assertEqual(codes.count(201), self.stock)
+        self.assertEqual(codes.count(400), self.orders - self.stock)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(Order.objects.count(), self.stock)
+        self.assertEqual(sum(OrderItem.objects.values_list('quantity', flat=True)), self.stock)
+    
+    def test_failed_order_is_removed_and_stock_returned(self):
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.place_order(quantity=5)
+        
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, self.stock)
+        self.assertFalse(Order.objects.exists())
+    
+    def test_full_product_save_keeps_stock_taken_by_orders(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(self.place_order(quantity=3).status_code, 201)
+        
+        stale.title = 'Plum tomatoes'
+        stale.save()
+        
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.title, 'Plum tomatoes')
+        self.assertEqual(self.product.quantity, self.stock - 3)
+    
+    def test_full_product_save_writes_edited_stock(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.quantity = 80
+        product.save()
+        
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 80)
+    
+    def test_order_refreshes_cached_stock(self):
+        client = APIClient()
+        other = create_product(self.product.farmer, title='Kale')
+        detail = reverse('product-detail', args=[self.product.pk])
+        other_detail = reverse('product-detail', args=[other.pk])
+        self.assertEqual(client.get(detail).json()['quantity'], self.stock)
+        other_etag = client.get(other_detail)['ETag']
+        list_etag = client.get(reverse('product-list'))['ETag']
+        
+        self.assertEqual(self.place_order(quantity=2).status_code, 201)
+        
+        self.assertEqual(client.get(detail).json()['quantity'], self.stock - 2)
+        response = client.get(reverse('product-list'))
+        self.assertNotEqual(response['ETag'], list_etag)
+        stock = {row['id']: row['quantity'] for row in response.json()['results']}
+        self.assertEqual(stock[self.product.pk], self.stock - 2)
+        # Products the order didn't touch keep their cached detail
+        self.assertEqual(client.get(other_detail, HTTP_IF_NONE_MATCH=other_etag).status_code, 304)
+
+# tests/test_queries.py
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from agriconnect.models import Order, OrderItem, Review, User
+from agriconnect.tests import MongoTestMixin, create_product
+
+@override_settings(DIRECT_MONGO_READS=False)
+class QueryBudgetTests(MongoTestMixin, TestCase):
+    """
+    Each list endpoint runs a fixed number of ORM queries however many rows
+    it returns, so an N+1 in a serializer fails here before it ships
+    """
+    sizes = (3, 15)
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmers = [
+            User.objects.create_user(f'farmer{i}', f'farmer{i}@example.com', 'pass', user_type='farmer')
+            for i in range(3)
+        ]
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass', user_type='buyer')
+        cls.product = create_product(cls.farmers[0])
+    
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+    
+    def add_products(self, count):
+        for i in range(count):
+            create_product(self.farmers[i % len(self.farmers)], title=f'Product {i}')
+    
+    def add_reviews(self, count):
+        for i in range(count):
+            reviewer = User.objects.create_user(f'reviewer{Review.objects.count()}', user_type='buyer')
+            Review.objects.create(product=self.product, user=reviewer, rating=1 + i % 5, comment='Good')
+    
+    def add_orders(self, count):
+        for i in range(count):
+            order = Order.objects.create(
+                buyer=self.buyer, total_amount=Decimal('20.00'),
+                shipping_address='Nakuru', phone_number='+254700000000',
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=create_product(farmer), quantity=1, price=Decimal('10.00'))
+                for farmer in self.farmers[:2]
+            ])
+    
+    def assert_budget(self, path, add_rows, budget):
+        """
+        Exactly budget queries at each of sizes
+        """
+        counts = []
+        shown = 0
+        for size in self.sizes:
+            add_rows(size - shown)
+            shown = size
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path, {'page_size': 100})
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts, [budget] * len(self.sizes), f'{path} queries per size')
+    
+    def test_product_list(self):
+        self.assert_budget(reverse('product-list'), self.add_products, budget=1)
+    
+    def test_review_list(self):
+        self.assert_budget(reverse('review-list'), self.add_reviews, budget=1)
+    
+    def test_order_list(self):
+        self.assert_budget(reverse('order-list'), self.add_orders, budget=2)
+    
+    def test_my_orders(self):
+        self.assert_budget(reverse('order-my-orders'), self.add_orders, budget=2)
+
+# tests/test_equivalence.py
+from datetime import date
+from decimal import Decimal
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from agriconnect.models import Order, OrderItem, Review, User
+from agriconnect.tests import MongoTestMixin, create_product
+
+class DirectReadEquivalenceTests(MongoTestMixin, TestCase):
+    """
+    DIRECT_MONGO_READS must not change a byte of any response it serves:
+    every request here is made through the ORM and through pymongo, and
+    the two bodies compared
+    """
+    @classmethod
+    def setUpTestData(cls):
+        farmers = [
+            User.objects.create_user(f'farmer{i}', f'farmer{i}@example.com', 'pass',
+                                     user_type='farmer', first_name=f'Farmer{i}', last_name='Kamau')
+            for i in range(3)
+        ]
+        cls.buyer, other = [
+            User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'pass',
+                                     user_type='buyer', first_name=f'Buyer{i}', last_name='Wanjiru')
+            for i in range(2)
+        ]
+        categories = ['vegetables', 'fruits', 'dairy']
+        cls.products = [
+            create_product(
+                farmers[i % 3], title=f'Product {i}', category=categories[i % 3],
+                # Repeated prices and harvest dates, so cursors have ties to break
+                price=Decimal('2.50') * (1 + i % 4), is_organic=i % 2 == 0,
+                harvest_date=date(2024, 1, 1 + i % 5), quantity=10 + i,
+            )
+            for i in range(14)
+        ]
+        for i in range(6):
+            Review.objects.create(product=cls.products[i // 2], user=(cls.buyer, other)[i % 2],
+                                  rating=1 + i % 5, comment=f'Review {i}')
+        for i in range(5):
+            order = Order.objects.create(
+                buyer=(cls.buyer, other)[i % 2], total_amount=Decimal('12.50'),
+                shipping_address='Nakuru', phone_number='+254700000000',
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=cls.products[i + j], quantity=1 + j, price=Decimal('2.50'))
+                for j in range(2)
+            ])
+    
+    def get_both(self, path, params=None, user=None):
+        """
+        The ORM path's response, after checking pymongo answers the same
+        """
+        responses = []
+        for direct in (False, True):
+            cache.clear()
+            client = APIClient()
+            if user is not None:
+                client.force_authenticate(user)
+            with override_settings(DIRECT_MONGO_READS=direct):
+                responses.append(client.get(path, params))
+        orm, direct = responses
+        self.assertEqual(orm.status_code, direct.status_code, f'{path} {params}')
+        self.assertEqual(orm.content, direct.content, f'{path} {params}')
+        return orm
+    
+    def walk(self, path, params, user=None):
+        """
+        Follow next links to the end and previous links back to the start
+        """
+        response = self.get_both(path, params, user)
+        ids = [item['id'] for item in response.json()['results']]
+        while response.json()['next']:
+            response = self.get_both(response.json()['next'], user=user)
+            ids += [item['id'] for item in response.json()['results']]
+        while response.json()['previous']:
+            response = self.get_both(response.json()['previous'], user=user)
+        return ids
+    
+    def test_product_list_cursor_walks(self):
+        for ordering in ('', 'price', '-price', 'harvest_date', '-rating_avg', 'created_at'):
+            ids = self.walk(reverse('product-list'), {'ordering': ordering, 'page_size': 4})
+            self.assertCountEqual(ids, [product.pk for product in self.products])
+    
+    def test_product_filters(self):
+        for params in (
+            {'category': 'fruits'},
+            {'category': 'ALL', 'is_organic': 'true'},
+            {'farmer': self.products[1].farmer_id},
+            {'min_price': '5', 'max_price': '7.50', 'ordering': '-price'},
+            {'fields': 'id,title,price,farmer_name'},
+            {'omit': 'description,coordinates'},
+        ):
+            self.walk(reverse('product-list'), dict(params, page_size=3))
+    
+    def test_product_detail(self):
+        self.get_both(reverse('product-detail', args=[self.products[3].pk]))
+        self.get_both(reverse('product-detail', args=[self.products[3].pk]), {'fields': 'title'})
+        self.assertEqual(self.get_both(reverse('product-detail', args=[999999])).status_code, 404)
+    
+    def test_product_reviews(self):
+        self.get_both(reverse('product-reviews', args=[self.products[0].pk]))
+        self.get_both(reverse('product-reviews', args=[self.products[5].pk]))
+        self.assertEqual(self.get_both(reverse('product-reviews', args=[999999])).status_code, 404)
+    
+    def test_my_orders(self):
+        ids = self.walk(reverse('order-my-orders'), {'page_size': 2}, user=self.buyer)
+        self.assertCountEqual(ids, Order.objects.filter(buyer=self.buyer).values_list('id', flat=True))
+        self.get_both(reverse('order-my-orders'), {'fields': 'id,status,items'}, user=self.buyer)
+
+# tests/test_serializers.py
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.test import TestCase, override_settings
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from agriconnect.models import Order, OrderItem, Review, User
+from agriconnect.repository import set_prefetched
+from agriconnect.serializers import (
+    FastListSerializer, OrderSerializer, ProductSerializer, ReviewSerializer,
+)
+from agriconnect.tests import MongoTestMixin, create_product
+
+NAIROBI = dt_timezone(timedelta(hours=3))
+
+class FastListSerializerTests(MongoTestMixin, TestCase):
+    """
+    FastListSerializer renders the same bytes as DRF's own ListSerializer
+    around the same child, with and without USE_TZ and in and out of UTC
+    """
+    @classmethod
+    def setUpTestData(cls):
+        farmer = User.objects.create_user('farmer', 'farmer@example.com', 'pass', user_type='farmer',
+                                          first_name='Wanjiku', last_name='Mwangi')
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass', user_type='buyer',
+                                         first_name='Otieno', last_name='Ochieng')
+        tomatoes = create_product(
+            farmer, price=Decimal('12.50'), sku='TOM-1',
+            geo_point={'type': 'Point', 'coordinates': [36.07, -0.3]},
+        )
+        # No coordinates and no SKU
+        milk = create_product(farmer, title='Milk', price=Decimal('0.99'), category='dairy', is_organic=True)
+        Review.objects.create(product=tomatoes, user=buyer, rating=4, comment='Sweet')
+        Review.objects.create(product=milk, user=buyer, rating=2, comment='')
+        order = Order.objects.create(buyer=buyer, total_amount=Decimal('26.99'),
+                                     shipping_address='Nakuru', phone_number='+254700000000')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=tomatoes, quantity=2, price=Decimal('12.50')),
+            OrderItem(order=order, product=milk, quantity=1, price=Decimal('1.99')),
+        ])
+    
+    def assert_same_bytes(self, serializer_class, instances):
+        for use_tz, time_zone in ((False, 'UTC'), (True, 'UTC'), (True, 'Africa/Nairobi')):
+            with self.subTest(serializer=serializer_class.__name__, use_tz=use_tz, time_zone=time_zone), \
+                    override_settings(USE_TZ=use_tz, TIME_ZONE=time_zone):
+                stock = serializers.ListSerializer(instances, child=serializer_class())
+                fast = FastListSerializer(instances, child=serializer_class())
+                self.assertEqual(JSONRenderer().render(fast.data), JSONRenderer().render(stock.data))
+    
+    def with_aware_created_at(self, instances):
+        for hour, instance in enumerate(instances):
+            instance.created_at = datetime(2024, 3, 1, hour, 30, 15, 250000,
+                                           tzinfo=(dt_timezone.utc, NAIROBI)[hour % 2])
+        return instances
+    
+    def test_products(self):
+        products = list(ProductSerializer.Meta.model.objects.select_related('farmer').order_by('id'))
+        self.assert_same_bytes(ProductSerializer, products)
+        self.assert_same_bytes(ProductSerializer, self.with_aware_created_at(products))
+    
+    def test_reviews(self):
+        reviews = list(Review.objects.select_related('user').order_by('id'))
+        self.assert_same_bytes(ReviewSerializer, reviews)
+        self.assert_same_bytes(ReviewSerializer, self.with_aware_created_at(reviews))
+    
+    def test_orders_with_nested_items(self):
+        orders = list(Order.objects.select_related('buyer').prefetch_related('items__product'))
+        self.assert_same_bytes(OrderSerializer, orders)
+        
+        # An item whose product is gone: a null foreign key and a null hop
+        # on product.title
+        order = orders[0]
+        items = list(order.items.all())
+        set_prefetched(order, 'items', items + [
+            OrderItem(order=order, product=None, quantity=1, price=Decimal('3.00'))
+        ])
+        self.assert_same_bytes(OrderSerializer, self.with_aware_created_at(orders))
+
+# tests/test_query_plans.py
+from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from agriconnect.exports import EXPORT_SORT
+from agriconnect.indexes import QUERY_SHAPES, apply_indexes, check_query_plans
+from agriconnect.models import Order, Review, User
+from agriconnect.mongo import get_db
+from agriconnect.tests import MongoTestMixin, create_product
+from agriconnect.views import OrderViewSet, ProductViewSet, ReviewViewSet, UserViewSet
+
+# Filters the list endpoints take, as query params. Products sort on any
+# ordering field unfiltered, and by price within a category and organic flag.
+PRODUCT_FILTERS = [
+    ({}, [f'{sign}{field}' for field in ProductViewSet.ordering_fields for sign in ('', '-')]),
+    ({'category': 'vegetables'}, []),
+    ({'category': 'vegetables', 'is_organic': 'true'}, ['price', '-price']),
+    ({'category': 'vegetables', 'is_organic': 'true', 'min_price': '1', 'max_price': '10'}, ['price']),
+    ({'farmer': '1'}, []),
 ]
+REVIEW_FILTERS = [{}, {'product': '1'}, {'user': '1'}]
+ORDER_RANGES = [{}, {'start': '2024-01-01'}, {'start': '2024-01-01', 'end': '2024-01-31'}]
+
+class QueryPlanTests(MongoTestMixin, TestCase):
+    """
+    Every filter and ordering the list endpoints send, built by the views'
+    own filter and paginator code, is served by an index for both the match
+    and the sort
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = User.objects.create_user('farmer', 'farmer@example.com', 'pass', user_type='farmer')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass', user_type='buyer')
+        product = create_product(cls.farmer)
+        Review.objects.create(product=product, user=cls.buyer, rating=5, comment='Good')
+        Order.objects.create(buyer=cls.buyer, total_amount=product.price,
+                             shipping_address='Nakuru', phone_number='+254700000000')
+    
+    def setUp(self):
+        super().setUp()
+        self.db = get_db()
+        apply_indexes(self.db)
+    
+    def view(self, viewset, params, user=None, action='list'):
+        request = Request(APIRequestFactory().get('/', params))
+        request.user = user
+        return viewset(request=request, action=action, kwargs={}, format_kwarg=None)
+    
+    def sort(self, view):
+        # What a list page sorts on: the OrderingFilter or view ordering, ended on id
+        paginator = view.paginator
+        paginator.ranking = None
+        paginator.keyset_ordering = paginator.get_ordering(view.request, None, view)
+        return paginator.document_sort(False)
+    
+    def list_shapes(self):
+        shapes = []
+        for params, orderings in PRODUCT_FILTERS:
+            for ordering in [None, *orderings]:
+                query_params = dict(params, ordering=ordering) if ordering else params
+                view = self.view(ProductViewSet, query_params)
+                shapes.append((f'products {query_params}', 'products', view.filter_document(), self.sort(view)))
+        
+        for params in REVIEW_FILTERS:
+            view = self.view(ReviewViewSet, params)
+            query = {f'{name}_id': int(value) for name, value in params.items()}
+            shapes.append((f'reviews {params}', 'reviews', query, self.sort(view)))
+        
+        view = self.view(UserViewSet, {})
+        shapes.append(('users', 'users', {}, self.sort(view)))
+        
+        for params in ORDER_RANGES:
+            for user in (self.buyer, self.farmer):
+                for action in ('list', 'my_orders'):
+                    view = self.view(OrderViewSet, params, user, action)
+                    query = view.order_query(view.created_range())
+                    shapes.append((f'{action} {user.user_type} {params}', 'orders', query, self.sort(view)))
+            # Staff export every order in the range
+            view = self.view(OrderViewSet, params, self.buyer, 'export')
+            created = view.created_range()
+            query = {'created_at': created} if created else {}
+            shapes.append((f'export {params}', 'orders', query, EXPORT_SORT))
+        return shapes
+    
+    def test_list_queries_use_indexes(self):
+        self.assertEqual(check_query_plans(self.db, self.list_shapes()), [])
+    
+    def test_query_shapes_use_indexes(self):
+        self.assertEqual(check_query_plans(self.db, QUERY_SHAPES), [])
+
+# tests/test_inventory.py
+from decimal import Decimal
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from agriconnect.indexes import apply_indexes
+from agriconnect.inventory import _write_creates, iter_inventory_rows
+from agriconnect.models import Product, User
+from agriconnect.mongo import get_db
+from agriconnect.tests import MongoTestMixin, create_product
+
+CSV_UPLOAD = '\ufeff' + '\n'.join([
+    'sku,title,description,price,image_url,category,location,harvest_date,quantity,latitude,longitude',
+    'TOM-1,Tomatoes,Fresh,12.50,https://example.com/t.jpg,vegetables,Nakuru,2024-01-01,40,,',
+    'KAL-1,Kale,Leafy,5.00,https://example.com/k.jpg,vegetables,Nakuru,2024-01-02,10,-0.30,36.07',
+    ',Onions,Red,3.00,https://example.com/o.jpg,vegetables,Nakuru,2024-01-03,5,,',
+    'KAL-1,Kale,Leafy,6.00,https://example.com/k.jpg,vegetables,Nakuru,2024-01-02,10,,',
+    'BAD-1,Beans,Dry,not a price,https://example.com/b.jpg,vegetables,Nakuru,2024-01-04,5,,',
+]) + '\n'
+
+NDJSON_UPLOAD = '\n'.join([
+    '{"sku": "TOM-1", "quantity": 75}',
+    '',
+    '{"sku": "MAN-1", "title": "Mangoes", "description": "Ripe", "price": "20.00",'
+    ' "image_url": "https://example.com/m.jpg", "category": "fruits", "location": "Kilifi",'
+    ' "harvest_date": "2024-02-01", "quantity": 30}',
+    '{"sku": ',
+    '["MAN-2"]',
+]) + '\n'
+
+class InventoryUploadTests(MongoTestMixin, TestCase):
+    """
+    Bulk uploads parse CSV and JSON lines and report an outcome per row,
+    including rows the database itself rejects
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = User.objects.create_user('farmer', 'farmer@example.com', 'pass', user_type='farmer')
+        cls.other_farmer = User.objects.create_user('other', 'other@example.com', 'pass', user_type='farmer')
+    
+    def setUp(self):
+        super().setUp()
+        apply_indexes(get_db())
+        self.client = APIClient()
+        self.client.force_authenticate(self.farmer)
+    
+    def upload(self, name, content):
+        upload = SimpleUploadedFile(name, content.encode())
+        response = self.client.post(reverse('product-bulk-upload'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+    
+    def test_parse_csv(self):
+        rows = list(iter_inventory_rows(CSV_UPLOAD.encode().splitlines(keepends=True), 'csv'))
+        self.assertEqual([number for number, _, _ in rows], [1, 2, 3, 4, 5])
+        number, row, error = rows[0]
+        # The byte order mark is not part of the first header
+        self.assertEqual(row['sku'], 'TOM-1')
+        self.assertIsNone(error)
+    
+    def test_parse_ndjson(self):
+        rows = list(iter_inventory_rows(NDJSON_UPLOAD.encode().splitlines(keepends=True), 'jsonl'))
+        # Blank lines are skipped, not numbered
+        self.assertEqual([(number, error) for number, _, error in rows], [
+            (1, None), (2, None), (3, 'Invalid JSON'), (4, 'Each line must be a JSON object'),
+        ])
+        self.assertEqual(rows[0][1], {'sku': 'TOM-1', 'quantity': 75})
+    
+    def test_csv_report(self):
+        create_product(self.other_farmer, sku='KAL-1')
+        data = self.upload('stock.csv', CSV_UPLOAD)
+        
+        self.assertEqual(data['summary'], {'created': 2, 'updated': 0, 'error': 3})
+        self.assertEqual([(r['row'], r['status']) for r in data['results']], [
+            (1, 'created'), (2, 'created'), (3, 'error'), (4, 'error'), (5, 'error'),
+        ])
+        self.assertEqual(data['results'][2]['errors'], {'sku': ['SKU is required']})
+        self.assertEqual(data['results'][3]['errors'], {'sku': ['Duplicate SKU in upload']})
+        self.assertIn('price', data['results'][4]['errors'])
+        
+        # Another farmer's SKU does not clash
+        kale = Product.objects.get(farmer=self.farmer, sku='KAL-1')
+        self.assertEqual(kale.price, Decimal('5.00'))
+        self.assertEqual(kale.geo_point['coordinates'], [36.07, -0.30])
+    
+    def test_ndjson_report_updates_by_sku(self):
+        tomatoes = create_product(self.farmer, sku='TOM-1', quantity=10)
+        data = self.upload('stock.jsonl', NDJSON_UPLOAD)
+        
+        self.assertEqual(data['summary'], {'created': 1, 'updated': 1, 'error': 2})
+        self.assertEqual(data['results'][0], {'row': 1, 'sku': 'TOM-1', 'id': tomatoes.pk, 'status': 'updated'})
+        self.assertEqual(data['results'][1]['status'], 'created')
+        self.assertEqual(data['results'][2]['errors'], {'non_field_errors': ['Invalid JSON']})
+        
+        tomatoes.refresh_from_db()
+        self.assertEqual((tomatoes.quantity, tomatoes.title), (75, 'Tomatoes'))
+    
+    def test_duplicate_key_becomes_row_error(self):
+        # A SKU created after the batch looked its SKUs up
+        create_product(self.farmer, sku='TOM-1')
+        fields = {
+            'title': 'Tomatoes', 'description': 'Fresh', 'price': Decimal('10.00'),
+            'image_url': 'https://example.com/t.jpg', 'category': 'vegetables',
+            'location': 'Nakuru', 'harvest_date': '2024-01-01', 'quantity': 5,
+        }
+        results = [
+            {'row': 1, 'sku': 'CAB-1', 'status': 'created'},
+            {'row': 2, 'sku': 'TOM-1', 'status': 'created'},
+            {'row': 3, 'sku': 'KAL-1', 'status': 'created'},
+        ]
+        creates = [
+            (Product(farmer=self.farmer, sku=result['sku'], **fields), result) for result in results
+        ]
+        
+        self.assertTrue(_write_creates(self.farmer, creates))
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertEqual(results[1]['status'], 'error')
+        self.assertEqual(results[1]['errors'], {'sku': ['You already have a product with this SKU']})
+        # Rows after the clash are either written or reported, never lost
+        stored = Product.objects.filter(farmer=self.farmer, sku='KAL-1').exists()
+        self.assertEqual(results[2]['status'], 'created' if stored else 'error')
+    
+    def test_serializer_rejects_duplicate_sku(self):
+        create_product(self.farmer, sku='TOM-1')
+        other = create_product(self.farmer, sku='TOM-2')
+        response = self.client.patch(reverse('product-detail', args=[other.pk]), {'sku': 'TOM-1'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('sku', response.data)
+        
+        # Keeping its own SKU, or clearing it, is fine
+        response = self.client.patch(reverse('product-detail', args=[other.pk]), {'sku': 'TOM-2'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(reverse('product-detail', args=[other.pk]), {'sku': ''}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['sku'])
+
+# tests/test_events.py
+from datetime import datetime, timedelta, timezone as dt_timezone
+from bson import ObjectId
+from bson.timestamp import Timestamp
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from agriconnect.events import FeedReset, order_events, parse_token, stream_options
+from agriconnect.models import User
+from agriconnect.tests import MongoTestMixin
+
+# A change stream resume token's _data, which a polling server can't resume
+STREAM_TOKEN = '8265A1B2C3000000012B022C0100296E5A1004'
+
+def event_id(seconds_ago):
+    # A fresh ObjectId minted seconds_ago, so it has already settled
+    moment = datetime.now(dt_timezone.utc) - timedelta(seconds=seconds_ago)
+    return ObjectId(ObjectId.from_datetime(moment).binary[:4] + ObjectId().binary[4:])
+
+@override_settings(ASYNC_VIEWS=False, ORDER_EVENTS={
+    'MODE': 'poll', 'POLL_INTERVAL': 0, 'STREAM_TIMEOUT': 0, 'SETTLE_SECONDS': 0,
+})
+class OrderEventFeedTests(MongoTestMixin, TestCase):
+    """
+    The polled order status feed resumes exactly after the client's token,
+    and tells clients whose token it can no longer resume to reload
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass', user_type='buyer')
+        cls.farmer = User.objects.create_user('farmer', 'farmer@example.com', 'pass', user_type='farmer')
+        cls.other = User.objects.create_user('other', 'other@example.com', 'pass', user_type='buyer')
+    
+    def setUp(self):
+        super().setUp()
+        order_events().delete_many({})
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+    
+    def add_event(self, seconds_ago, order_id, status, buyer=None):
+        doc = {
+            '_id': event_id(seconds_ago), 'order_id': order_id, 'status': status,
+            'previous': 'pending', 'buyer_id': (buyer or self.buyer).pk,
+            'farmer_ids': [self.farmer.pk], 'created_at': datetime.now(dt_timezone.utc),
+        }
+        order_events().insert_one(doc)
+        return str(doc['_id'])
+    
+    def poll(self, since=None, **headers):
+        params = {'wait': 0, **({'since': since} if since else {})}
+        return self.client.get(reverse('order-events'), params, **headers)
+    
+    def test_resumes_after_token(self):
+        first = self.add_event(30, 1, 'processing')
+        self.add_event(25, 2, 'processing', buyer=self.other)
+        second = self.add_event(20, 1, 'shipped')
+        third = self.add_event(10, 1, 'delivered')
+        
+        response = self.poll(first)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['id'] for event in response.data['events']], [second, third])
+        self.assertEqual(response.data['events'][0]['status'], 'shipped')
+        self.assertEqual(response.data['next'], third)
+        
+        # Nothing new: the token stays where it was
+        response = self.poll(response.data['next'])
+        self.assertEqual((response.data['events'], response.data['next']), ([], third))
+    
+    def test_farmers_follow_orders_with_their_products(self):
+        first = self.add_event(30, 1, 'processing')
+        second = self.add_event(20, 2, 'shipped', buyer=self.other)
+        self.client.force_authenticate(self.farmer)
+        response = self.poll(first)
+        self.assertEqual([event['id'] for event in response.data['events']], [second])
+    
+    def test_without_token_starts_from_now(self):
+        self.add_event(30, 1, 'processing')
+        response = self.poll()
+        self.assertEqual(response.data['events'], [])
+        self.assertIsNotNone(response.data['next'])
+    
+    def test_expired_token_is_gone(self):
+        expired = str(event_id(8 * 24 * 3600))
+        self.assertEqual(self.poll(expired).status_code, 410)
+        with self.assertRaises(FeedReset):
+            parse_token(expired)
+    
+    def test_stream_token_on_polling_server_is_gone(self):
+        self.assertEqual(self.poll(STREAM_TOKEN).status_code, 410)
+    
+    def test_invalid_token(self):
+        self.assertEqual(self.poll('not-a-token').status_code, 400)
+    
+    def test_event_stream_resumes_from_last_event_id(self):
+        first = self.add_event(30, 1, 'processing')
+        second = self.add_event(20, 1, 'shipped')
+        response = self.client.get(reverse('order-events'), HTTP_ACCEPT='text/event-stream',
+                                   HTTP_LAST_EVENT_ID=first)
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn(f'id: {second}\nevent: order_status\n', body)
+        self.assertNotIn(f'id: {first}\nevent', body)
+    
+    def test_event_stream_resets_unresumable_token(self):
+        response = self.client.get(reverse('order-events'), HTTP_ACCEPT='text/event-stream',
+                                   HTTP_LAST_EVENT_ID=STREAM_TOKEN)
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.endswith('event: reset\ndata: {}\n\n'))
+    
+    def test_stream_options_for_each_token(self):
+        token = event_id(60)
+        self.assertEqual(stream_options(token, {'POLL_INTERVAL': 2}), {
+            'max_await_time_ms': 2000,
+            'start_at_operation_time': Timestamp(token.generation_time, 0),
+        })
+        self.assertEqual(stream_options(STREAM_TOKEN, {'POLL_INTERVAL': 2})['resume_after'],
+                         {'_data': STREAM_TOKEN})
+
+# tests/test_archive.py
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from agriconnect.archive import (
+    archive_collection, archive_horizon, archive_orders, archive_state, finish_pending,
+)
+from agriconnect.models import Order, OrderItem, User
+from agriconnect.mongo import get_collection
+from agriconnect.tests import MongoTestMixin, create_product
+
+class OrderArchiveTests(MongoTestMixin, TestCase):
+    """
+    Archiving moves terminal orders and their items in checkpointed batches
+    that a later run can finish, and archived order lists merge the hot and
+    archive collections into one keyset ordering
+    """
+    @classmethod
+    def setUpTestData(cls):
+        farmer = User.objects.create_user('farmer', 'farmer@example.com', 'pass', user_type='farmer')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass', user_type='buyer')
+        product = create_product(farmer)
+        cls.orders = []
+        for i in range(6):
+            order = Order.objects.create(
+                buyer=cls.buyer, total_amount=Decimal('10.00'), shipping_address='Nakuru',
+                phone_number='+254700000000', status='delivered' if i % 2 else 'pending',
+            )
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=Decimal('10.00'))
+            cls.orders.append(order)
+    
+    def setUp(self):
+        super().setUp()
+        for collection in (archive_collection(Order), archive_collection(OrderItem), archive_state()):
+            collection.delete_many({})
+        # Last touched over a year ago, placed on consecutive days with the
+        # first two on the same instant so the id breaks the tie
+        now = timezone.now()
+        self.cutoff = now - timedelta(days=365)
+        for i, order in enumerate(self.orders):
+            get_collection(Order).update_one({'id': order.pk}, {'$set': {
+                'created_at': now - timedelta(days=30 - max(i, 1)),
+                'updated_at': now - timedelta(days=400),
+            }})
+        self.delivered = [order.pk for order in self.orders if order.status == 'delivered']
+        self.pending = [order.pk for order in self.orders if order.status == 'pending']
+    
+    def ids(self, collection, field='id', **query):
+        return sorted(doc[field] for doc in collection.find(query))
+    
+    def test_moves_terminal_orders_with_items(self):
+        self.assertEqual(list(archive_orders(self.cutoff, batch_size=2)), [2, 1])
+        
+        self.assertEqual(self.ids(get_collection(Order)), self.pending)
+        self.assertEqual(self.ids(archive_collection(Order)), self.delivered)
+        self.assertEqual(self.ids(get_collection(OrderItem), 'order_id'), self.pending)
+        self.assertEqual(self.ids(archive_collection(OrderItem), 'order_id'), self.delivered)
+        self.assertIsNotNone(archive_horizon())
+        self.assertNotIn('pending', archive_state().find_one({'_id': 'orders'}))
+    
+    def test_next_run_finishes_interrupted_batch(self):
+        # Stop after the batch left the hot orders, before its items did
+        with mock.patch('agriconnect.archive.finish_pending', side_effect=[0, RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                list(archive_orders(self.cutoff, batch_size=10))
+        self.assertEqual(archive_state().find_one({'_id': 'orders'})['pending'], self.delivered)
+        self.assertEqual(self.ids(get_collection(OrderItem), 'order_id'), sorted(self.pending + self.delivered))
+        
+        self.assertEqual(list(archive_orders(self.cutoff, batch_size=10)), [])
+        self.assertEqual(self.ids(get_collection(OrderItem), 'order_id'), self.pending)
+        self.assertEqual(self.ids(archive_collection(OrderItem), 'order_id'), self.delivered)
+        self.assertNotIn('pending', archive_state().find_one({'_id': 'orders'}))
+    
+    def test_order_saved_during_batch_stays_hot(self):
+        # A batch checkpointed and copied, where one order was saved before
+        # the delete reached it, so only the other left the hot collection
+        moved, saved = self.delivered[:2]
+        for model in (Order, OrderItem):
+            field = 'id' if model is Order else 'order_id'
+            docs = list(get_collection(model).find({field: {'$in': [moved, saved]}}))
+            archive_collection(model).insert_many(docs)
+        archive_state().insert_one({'_id': 'orders', 'pending': [moved, saved]})
+        get_collection(Order).delete_one({'id': moved})
+        
+        self.assertEqual(finish_pending(), 1)
+        self.assertEqual(self.ids(archive_collection(Order)), [moved])
+        self.assertEqual(self.ids(archive_collection(OrderItem), 'order_id'), [moved])
+        self.assertIn(saved, self.ids(get_collection(Order)))
+        self.assertIn(saved, self.ids(get_collection(OrderItem), 'order_id'))
+        self.assertNotIn(moved, self.ids(get_collection(OrderItem), 'order_id'))
+    
+    def walk(self, params):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        response = client.get(reverse('order-list'), params)
+        pages = [response.json()]
+        while pages[-1]['next']:
+            pages.append(client.get(pages[-1]['next']).json())
+        forward = [order['id'] for page in pages for order in page['results']]
+        
+        backward = []
+        page = pages[-1]
+        while page['previous']:
+            page = client.get(page['previous']).json()
+            backward = [order['id'] for order in page['results']] + backward
+        self.assertEqual(backward, forward[:len(backward)])
+        return forward
+    
+    def test_archived_list_merges_by_keyset(self):
+        list(archive_orders(self.cutoff, batch_size=10))
+        expected = sorted(
+            get_collection(Order).find({}, {'id': 1, 'created_at': 1}),
+            key=lambda doc: (doc['created_at'], doc['id']), reverse=True
+        )
+        newest_first = sorted(
+            [*get_collection(Order).find(), *archive_collection(Order).find()],
+            key=lambda doc: (doc['created_at'], doc['id']), reverse=True
+        )
+        
+        self.assertEqual(self.walk({'include_archived': 'true', 'page_size': 2}),
+                         [doc['id'] for doc in newest_first])
+        self.assertEqual(self.walk({'page_size': 2}), [doc['id'] for doc in expected])
+
+# tests/test_sync.py
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from agriconnect.models import Product, User
+from agriconnect.mongo import get_collection
+from agriconnect.sync import as_stored, encode_cursor, product_tombstones
+from agriconnect.tests import MongoTestMixin, create_product
+
+class CatalogSyncTests(MongoTestMixin, TestCase):
+    """
+    Delta sync merges written products and deletion tombstones into one
+    (time, id) order, so a client paging through them one change at a time
+    sees each exactly once even where their timestamps tie
+    """
+    @classmethod
+    def setUpTestData(cls):
+        farmer = User.objects.create_user('farmer', 'farmer@example.com', 'pass', user_type='farmer')
+        cls.products = [create_product(farmer, title=f'Product {i}') for i in range(4)]
+    
+    def setUp(self):
+        super().setUp()
+        product_tombstones().delete_many({})
+        self.client = APIClient()
+        # A fixed clock, so the settle bound is where the test puts it
+        self.now = as_stored(timezone.now()).replace(microsecond=0)
+        clock = mock.patch('agriconnect.sync.current_time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        
+        # products[2] deleted on the same instant products[1] and [3] were
+        # written; products[0] written a second before
+        self.tied = self.now - timedelta(hours=1)
+        first, second, deleted, last = self.products
+        self.write(first, self.tied - timedelta(seconds=1))
+        for product in (second, last):
+            self.write(product, self.tied)
+        Product.objects.filter(pk=deleted.pk).delete()
+        product_tombstones().update_one({'product_id': deleted.pk}, {'$set': {'deleted_at': self.tied}})
+    
+    def write(self, product, moment):
+        get_collection(Product).update_one({'id': product.pk}, {'$set': {'updated_at': moment}})
+    
+    def changes(self, since=None, page_size=1):
+        params = {'page_size': page_size, **({'since': since} if since else {})}
+        response = self.client.get(reverse('product-changes'), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+    
+    def walk(self, since=None):
+        served = []
+        while True:
+            page = self.changes(since)
+            served += [('changed', product['id']) for product in page['changed']]
+            served += [('deleted', pk) for pk in page['deleted']]
+            since = page['next']
+            if not page['has_more']:
+                return served, since
+    
+    def test_tied_changes_are_served_once_in_order(self):
+        first, second, deleted, last = (product.pk for product in self.products)
+        served, since = self.walk()
+        self.assertEqual(served, [
+            ('changed', first), ('changed', second), ('deleted', deleted), ('changed', last),
+        ])
+        
+        # Caught up: nothing more until something is written
+        self.assertEqual(self.changes(since)['changed'], [])
+        self.now += timedelta(minutes=2)
+        self.write(self.products[0], self.now - timedelta(minutes=1))
+        served, _ = self.walk(since)
+        self.assertEqual(served, [('changed', first)])
+    
+    def test_one_page_matches_walk(self):
+        page = self.changes(page_size=10)
+        self.assertEqual([product['id'] for product in page['changed']],
+                         [self.products[i].pk for i in (0, 1, 3)])
+        self.assertEqual(page['deleted'], [self.products[2].pk])
+        self.assertFalse(page['has_more'])
+    
+    def test_unsettled_writes_wait(self):
+        # Written after the settle bound: a write with an earlier timestamp
+        # could still land, so it is held back
+        self.write(self.products[0], self.now)
+        served, _ = self.walk()
+        self.assertNotIn(('changed', self.products[0].pk), served)
+    
+    def test_copy_older_than_tombstones_resets(self):
+        stale = encode_cursor((self.tied, 0), self.now - timedelta(days=31))
+        response = self.client.get(reverse('product-changes'), {'since': stale})
+        self.assertEqual(response.status_code, 410)
+        response = self.client.get(reverse('product-changes'), {'since': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
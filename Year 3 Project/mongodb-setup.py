@@ -1,6 +1,8 @@
 # MongoDB Setup
 # For djongo to work with MongoDB, we need to install the required packages
 # pip install djongo pymongo
+# Run from the project root so the shared client pool in agriconnect.mongo is
+# importable; set MONGODB_URI to point at a server other than localhost
 
 # MongoDB Schema Design
 '''
@@ -18,6 +20,7 @@ MongoDB Collections:
     "phone_number": String,
     "address": String,
     "profile_image": String (URL),
+    "geo_point": GeoJSON Point (optional, 2dsphere indexed),
     "date_joined": Date,
     "is_active": Boolean
 }
@@ -32,9 +35,14 @@ MongoDB Collections:
     "category": String (enum: ["vegetables", "fruits", "grains", "dairy", "other"]),
     "farmer_id": ObjectId (reference to users),
     "location": String,
+    "geo_point": GeoJSON Point (optional, 2dsphere indexed),
     "harvest_date": Date,
     "is_organic": Boolean,
     "quantity": Integer,
+    "sku": String (optional, unique per farmer),
+    "rating_sum": Integer,
+    "rating_count": Integer,
+    "rating_avg": Double,
     "created_at": Date,
     "updated_at": Date
 }
@@ -54,6 +62,7 @@ MongoDB Collections:
     "shipping_address": String,
     "phone_number": String,
     "status": String (enum: ["pending", "processing", "shipped", "delivered", "cancelled"]),
+    "farmer_ids": [ObjectId] (farmers whose products are in the order),
     "created_at": Date,
     "updated_at": Date
 }
@@ -67,57 +76,77 @@ MongoDB Collections:
     "comment": String,
     "created_at": Date
 }
+
+5. sales_daily (rollups maintained by the Django app)
+{
+    "_id": ObjectId,
+    "farmer_id": ObjectId (reference to users),
+    "product_id": ObjectId (reference to products),
+    "day": Date (midnight UTC),
+    "revenue": Double,
+    "units": Integer,
+    "orders": Integer
+}
+
+6. order_events (status changes for the order feed, kept 7 days by default)
+{
+    "_id": ObjectId,
+    "order_id": ObjectId (reference to orders),
+    "status": String,
+    "previous": String,
+    "buyer_id": ObjectId (reference to users),
+    "farmer_ids": [ObjectId],
+    "created_at": Date,
+    "expires_at": Date (TTL indexed)
+}
+
+7. orders_archive, order_items_archive (filled by the archive_orders command)
+Delivered and cancelled orders past ORDER_ARCHIVE['AFTER_DAYS'] and their
+items, in the same shape as orders and order_items. archive_state holds
+{"_id": "orders", "horizon": Date, "pending": [order ids]}: archived orders
+were all last updated before horizon; pending is a batch being moved.
+
+8. product_tombstones (deleted products for delta sync, kept 30 days by default)
+{
+    "_id": ObjectId,
+    "product_id": ObjectId (reference to the deleted product),
+    "deleted_at": Date,
+    "expires_at": Date (TTL indexed)
+}
 '''
 
 # MongoDB Initial Setup Script
-from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError
+from agriconnect.indexes import INDEXES, apply_indexes
+from agriconnect.mongo import get_db
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
 import os
 import json
+import argparse
+import multiprocessing
+import random
 from bson import ObjectId
+from bson.decimal128 import Decimal128
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 def setup_mongodb():
     """
     Initialize MongoDB database with collections and indexes
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient('mongodb://localhost:27017/')
-        
-        # Create or access the database
-        db = client['agriconnect_db']
+        # Create or access the database through the shared client pool
+        db = get_db()
         
         # Create collections if they don't exist
-        if 'users' not in db.list_collection_names():
-            users = db.create_collection('users')
-            # Create indexes for users collection
-            users.create_index('username', unique=True)
-            users.create_index('email', unique=True)
-            print("Users collection created with indexes")
-        
-        if 'products' not in db.list_collection_names():
-            products = db.create_collection('products')
-            # Create indexes for products collection
-            products.create_index('farmer_id')
-            products.create_index('category')
-            products.create_index([('title', 'text'), ('description', 'text')])
-            print("Products collection created with indexes")
+        existing = db.list_collection_names()
+        for name in INDEXES:
+            if name not in existing:
+                db.create_collection(name)
+                print(f"{name} collection created")
         
-        if 'orders' not in db.list_collection_names():
-            orders = db.create_collection('orders')
-            # Create indexes for orders collection
-            orders.create_index('buyer_id')
-            orders.create_index('status')
-            orders.create_index('created_at')
-            print("Orders collection created with indexes")
-        
-        if 'reviews' not in db.list_collection_names():
-            reviews = db.create_collection('reviews')
-            # Create indexes for reviews collection
-            reviews.create_index([('product_id', 1), ('user_id', 1)], unique=True)
-            reviews.create_index('product_id')
-            print("Reviews collection created with indexes")
+        # Indexes are applied on every run, so existing databases pick up new ones
+        for change in apply_indexes(db):
+            print(f"Index {change}")
         
         print("MongoDB setup completed successfully")
         return True
@@ -134,8 +163,7 @@ def seed_demo_data():
     Seed the database with demo data for testing
     """
     try:
-        client = MongoClient('mongodb://localhost:27017/')
-        db = client['agriconnect_db']
+        db = get_db()
         
         # Only seed if collections are empty
         if db.users.count_documents({}) == 0:
@@ -277,6 +305,7 @@ def seed_demo_data():
                             "price": 4.50
                         }
                     ],
+                    "farmer_ids": [farmer_ids[0]],
                     "total_amount": 5 * 2.99 + 2 * 4.50,
                     "shipping_address": "123 Main St, City",
                     "phone_number": "+1122334455",
@@ -293,6 +322,7 @@ def seed_demo_data():
                             "price": 1.99
                         }
                     ],
+                    "farmer_ids": [farmer_ids[1]],
                     "total_amount": 10 * 1.99,
                     "shipping_address": "123 Main St, City",
                     "phone_number": "+1122334455",
@@ -335,24 +365,256 @@ def seed_demo_data():
         print(f"Error seeding demo data: {str(e)}")
         return False
 
+# Synthetic data generator for capacity planning
+# Documents follow the layout djongo writes (integer ids and *_id references),
+# so the Django app can read the generated data directly.
+CATEGORIES = ['vegetables', 'fruits', 'grains', 'dairy', 'other']
+PRODUCE = {
+    'vegetables': ['Tomatoes', 'Kale', 'Cabbage', 'Carrots', 'Onions', 'Spinach'],
+    'fruits': ['Apples', 'Mangoes', 'Bananas', 'Avocados', 'Oranges', 'Passion Fruit'],
+    'grains': ['Brown Rice', 'Maize', 'Wheat', 'Sorghum', 'Millet', 'Beans'],
+    'dairy': ['Eggs', 'Milk', 'Butter', 'Yoghurt', 'Cheese', 'Ghee'],
+    'other': ['Honey', 'Herbs', 'Coffee', 'Tea Leaves', 'Groundnuts', 'Sunflower Oil'],
+}
+ADJECTIVES = ['Fresh', 'Organic', 'Farm Fresh', 'Local', 'Premium', 'Sun-ripened']
+LOCATIONS = ['Nakuru', 'Eldoret', 'Kisumu', 'Nyeri', 'Meru', 'Kitale', 'Machakos', 'Thika']
+ORDER_STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+ORDER_STATUS_WEIGHTS = [5, 5, 10, 70, 10]
+RATING_WEIGHTS = [5, 7, 13, 30, 45]
+MAX_ORDER_ITEMS = 10
+HISTORY_DAYS = 365
+
+def _popular(rng, count, skew):
+    # Power-law pick in [1, count]: low ids are far more popular than high ones
+    return 1 + int(count * rng.random() ** skew)
+
+def _product_farmer(product_id, farmers):
+    # Derived from the id so order workers need no lookups; a few farmers own most products
+    spread = (product_id * 2654435761) % 2**32 / 2**32
+    return 1 + int(farmers * spread ** 2)
+
+def _product_price(product_id):
+    return Decimal('0.50') + Decimal((product_id * 7919) % 2000) / 100
+
+def _created_at(rng, now):
+    return now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 24 * 3600))
+
+def _generate_users(rng, start, count, sizes, now):
+    docs = []
+    for user_id in range(start, start + count):
+        user_type = 'farmer' if user_id <= sizes['farmers'] else 'buyer'
+        docs.append({
+            "id": user_id,
+            "username": f"{user_type}{user_id}",
+            "email": f"{user_type}{user_id}@example.com",
+            "password": "!",  # Unusable password
+            "first_name": f"First{user_id}",
+            "last_name": f"Last{user_id}",
+            "user_type": user_type,
+            "phone_number": f"+2547{user_id:08d}"[:15],
+            "address": f"{rng.choice(LOCATIONS)}, Kenya",
+            "profile_image": None,
+            "is_staff": False,
+            "is_superuser": False,
+            "is_active": True,
+            "last_login": None,
+            "date_joined": _created_at(rng, now),
+        })
+    return {'users': docs}
+
+def _generate_products(rng, start, count, sizes, now):
+    docs = []
+    for product_id in range(start, start + count):
+        category = rng.choice(CATEGORIES)
+        created_at = _created_at(rng, now)
+        docs.append({
+            "id": product_id,
+            "title": f"{rng.choice(ADJECTIVES)} {rng.choice(PRODUCE[category])}",
+            "description": f"Grown and harvested in {rng.choice(LOCATIONS)}. Lot {product_id}.",
+            "price": Decimal128(str(_product_price(product_id))),
+            "image_url": f"https://example.com/products/{product_id}.jpg",
+            "category": category,
+            "farmer_id": _product_farmer(product_id, sizes['farmers']),
+            "location": rng.choice(LOCATIONS),
+            "harvest_date": created_at - timedelta(days=rng.randrange(30)),
+            "is_organic": rng.random() < 0.3,
+            "quantity": rng.randrange(1000),
+            # Filled in by manage.py recompute_product_ratings once reviews exist
+            "rating_sum": 0,
+            "rating_count": 0,
+            "rating_avg": 0.0,
+            "created_at": created_at,
+            "updated_at": created_at,
+        })
+    return {'products': docs}
+
+def _generate_orders(rng, start, count, sizes, now):
+    orders, items = [], []
+    for order_id in range(start, start + count):
+        buyer_id = sizes['farmers'] + _popular(rng, sizes['buyers'], 2)
+        item_count = min(MAX_ORDER_ITEMS, 1 + int(rng.expovariate(0.7)))
+        product_ids = {_popular(rng, sizes['products'], 3) for _ in range(item_count)}
+        created_at = _created_at(rng, now)
+        
+        total = Decimal('0.00')
+        for index, product_id in enumerate(sorted(product_ids)):
+            quantity = rng.randint(1, 20)
+            price = _product_price(product_id)
+            total += quantity * price
+            items.append({
+                # Ids derived from the order id so workers never coordinate
+                "id": order_id * MAX_ORDER_ITEMS + index,
+                "order_id": order_id,
+                "product_id": product_id,
+                "quantity": quantity,
+                "price": Decimal128(str(price)),
+            })
+        
+        orders.append({
+            "id": order_id,
+            "buyer_id": buyer_id,
+            "farmer_ids": sorted({_product_farmer(p, sizes['farmers']) for p in product_ids}),
+            "total_amount": Decimal128(str(total)),
+            "shipping_address": f"{rng.choice(LOCATIONS)}, Kenya",
+            "phone_number": f"+2547{buyer_id:08d}"[:15],
+            "status": rng.choices(ORDER_STATUSES, weights=ORDER_STATUS_WEIGHTS)[0],
+            "created_at": created_at,
+            "updated_at": created_at + timedelta(hours=rng.randrange(72)),
+        })
+    return {'orders': orders, 'order_items': items}
+
+def _generate_reviews(rng, start, count, sizes, now):
+    docs = []
+    for review_id in range(start, start + count):
+        docs.append({
+            "id": review_id,
+            "product_id": _popular(rng, sizes['products'], 3),
+            "user_id": sizes['farmers'] + _popular(rng, sizes['buyers'], 2),
+            "rating": rng.choices([1, 2, 3, 4, 5], weights=RATING_WEIGHTS)[0],
+            "comment": f"Review {review_id}",
+            "created_at": _created_at(rng, now),
+        })
+    return {'reviews': docs}
+
+# Reviews pick products and users at random, so a few pairs repeat
+REVIEW_PAIR_INDEX = next(
+    index.document['name'] for index in INDEXES['reviews'] if index.document.get('unique')
+)
+
+GENERATORS = {
+    'users': _generate_users,
+    'products': _generate_products,
+    'orders': _generate_orders,
+    'reviews': _generate_reviews,
+}
+
+def _generate_chunk(task):
+    kind, start, count, sizes, seed, uri, now = task
+    # Seeded per chunk, so the output does not depend on worker scheduling
+    rng = random.Random(f"{seed}:{kind}:{start}")
+    # The client registry resets after fork, so each worker gets its own pool
+    db = get_db(uri)
+    
+    for collection, docs in GENERATORS[kind](rng, start, count, sizes, now).items():
+        try:
+            db[collection].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Only duplicate (product, user) reviews are expected to collide
+            if collection != 'reviews' or any(
+                error['code'] != 11000 or REVIEW_PAIR_INDEX not in error['errmsg']
+                for error in e.details['writeErrors']
+            ):
+                raise
+    return kind, count
+
+def generate_synthetic_data(farmers=1000, buyers=10000, products=50000, orders=200000,
+                            reviews=100000, workers=4, batch_size=5000, seed=42,
+                            uri=None):
+    """
+    Generate a production-scale dataset with skewed product popularity,
+    realistic order sizes and review distributions. Batches are written with
+    insert_many from parallel worker processes; the same seed always
+    produces the same data.
+    """
+    try:
+        db = get_db(uri)
+        sizes = {'farmers': farmers, 'buyers': buyers, 'products': products}
+        totals = {
+            'users': farmers + buyers,
+            'products': products,
+            'orders': orders,
+            'reviews': reviews,
+        }
+        # Fixed anchor so timestamps are reproducible too
+        now = datetime(2024, 1, 1)
+        
+        # Users and products first: orders and reviews reference them
+        for stage in (['users', 'products'], ['orders', 'reviews']):
+            tasks = [
+                (kind, start, min(batch_size, totals[kind] - start + 1), sizes, seed, uri, now)
+                for kind in stage
+                for start in range(1, totals[kind] + 1, batch_size)
+            ]
+            with multiprocessing.Pool(workers) as pool:
+                done = dict.fromkeys(stage, 0)
+                for kind, count in pool.imap_unordered(_generate_chunk, tasks):
+                    done[kind] += count
+                    print(f"  {kind}: {done[kind]}/{totals[kind]}", end='\r')
+            print(f"Generated {', '.join(f'{totals[k]} {k}' for k in stage)}")
+        
+        # Move djongo's id counters past the generated ids
+        last_ids = dict(totals, order_items=orders * MAX_ORDER_ITEMS + MAX_ORDER_ITEMS)
+        for collection, last_id in last_ids.items():
+            db['__schema__'].update_one(
+                {'name': collection},
+                {'$max': {'auto.seq': last_id}, '$setOnInsert': {'auto.field_names': ['id']}},
+                upsert=True
+            )
+        
+        print("Synthetic data generated successfully")
+        return True
+        
+    except Exception as e:
+        print(f"Error generating synthetic data: {str(e)}")
+        return False
+
 # MongoDB connection utility for the application
 def get_db_connection():
     """
     Get a connection to the MongoDB database
     """
     try:
-        client = MongoClient('mongodb://localhost:27017/')
-        db = client['agriconnect_db']
-        return db
+        return get_db()
     except Exception as e:
         print(f"Error connecting to MongoDB: {str(e)}")
         return None
 
 # Commands to run setup and seeding
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set up MongoDB for AgriConnect")
+    subparsers = parser.add_subparsers(dest='command')
+    generate = subparsers.add_parser('generate', help="Generate a synthetic dataset for load testing")
+    generate.add_argument('--farmers', type=int, default=1000)
+    generate.add_argument('--buyers', type=int, default=10000)
+    generate.add_argument('--products', type=int, default=50000)
+    generate.add_argument('--orders', type=int, default=200000)
+    generate.add_argument('--reviews', type=int, default=100000)
+    generate.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    generate.add_argument('--batch-size', type=int, default=5000)
+    generate.add_argument('--seed', type=int, default=42)
+    generate.add_argument('--uri', default=None)
+    args = parser.parse_args()
+    
     print("Setting up MongoDB for AgriConnect...")
     if setup_mongodb():
-        print("Would you like to seed the database with demo data? (y/n)")
-        response = input().lower()
-        if response == 'y':
-            seed_demo_data()
+        if args.command == 'generate':
+            generate_synthetic_data(
+                farmers=args.farmers, buyers=args.buyers, products=args.products,
+                orders=args.orders, reviews=args.reviews, workers=args.workers,
+                batch_size=args.batch_size, seed=args.seed, uri=args.uri
+            )
+        else:
+            print("Would you like to seed the database with demo data? (y/n)")
+            response = input().lower()
+            if response == 'y':
+                seed_demo_data()